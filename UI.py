@@ -1,4 +1,5 @@
 import os as os
+from functools import lru_cache
 from PyQt5.QtGui import QIcon
 
 stylesheet  ="""
@@ -59,8 +60,33 @@ def button_stylesheet(button, color="transparent", border_color='white', selecte
                 before dice roll: positions occupied by player -> dashed border
                 after dice roll: positions available for movement -> thick border
             if hover over position: semi-thick border
-        """
 
+        The stylesheets are cached (see _stylesheet), so a button whose style did not change is not restyled: it still has
+        the same cached string, which is compared by identity instead of character by character
+        """
+        stylesheet = _stylesheet(color, border_color, selected, pawn, classical, L)
+        if getattr(button, "_cached_stylesheet", None) is not stylesheet:
+            button._cached_stylesheet = stylesheet
+            button.setStyleSheet(stylesheet)
+
+# Stylesheets of the positions, only valid for the button size _stylesheets_L
+_stylesheets = {}
+_stylesheets_L = None
+_max_stylesheets = 1024
+
+def _stylesheet(color, border_color, selected, pawn, classical, L):
+        """Stylesheet of a position, see button_stylesheet(). The cache is emptied when the buttons get a new size"""
+        global _stylesheets_L
+        key = (color, border_color, selected, pawn, classical)
+        if L != _stylesheets_L or len(_stylesheets) >= _max_stylesheets:
+            _stylesheets.clear()
+            _stylesheets_L = L
+        if key not in _stylesheets:
+            _stylesheets[key] = _make_stylesheet(color, border_color, selected, pawn, classical, L)
+        return _stylesheets[key]
+
+def _make_stylesheet(color, border_color, selected, pawn, classical, L):
+        """Generate the stylesheet of a position, see button_stylesheet()"""
         quantum_transparency = 100
         color_rgba = {
                     'Red': rf"rgba(255, 0, 0, {255 if classical==True else quantum_transparency})",
@@ -82,8 +108,9 @@ def button_stylesheet(button, color="transparent", border_color='white', selecte
                 border: 4px solid {border_color};
             }}
             """
-        button.setStyleSheet(stylesheet)
+        return stylesheet
 
+@lru_cache(maxsize=None)
 def die_stylesheet(color="transparent"):
         """
         Description
@@ -0,0 +1,75 @@
+"""
+Description
+-----------
+Measure how long it takes to import the modules of the game, using `python -X importtime`.
+Every module is imported in a fresh interpreter, so nothing is cached between the runs.
+
+Example
+-------
+python benchmarks/import_time.py\\
+python benchmarks/import_time.py start_screen main --repeat 10 --top 5
+
+Results
+-------
+Median of 3 imports of main on one core. Matplotlib (about 0.55 s) is now only imported when the Bell test plot is opened,
+the rest is qiskit, which the game engine needs
+
+    matplotlib imported at the top of main     1363 ms
+    matplotlib imported by mpl_canvas()         805 ms
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+def import_times(module : str):
+    """
+    Description
+    -----------
+    Import the module in a new interpreter and return the cumulative import time (in ms) of the module and of every
+    module it imports. Modules that the interpreter imports at startup (e.g. site) are left out
+
+    Returns
+    -------
+    times : dict[str, float]
+        Maps the name of every imported module to its cumulative import time, including the modules it imports
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=root_path, capture_output=True, text=True, env=dict(os.environ, QT_QPA_PLATFORM="offscreen"))
+    if output.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{output.stderr}")
+
+    # -X importtime prints a module after the modules it imports, nested modules are indented
+    times = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+        if name.strip() == module:
+            return times
+        if not name.startswith("  "): # a top-level import that finished before the module was imported
+            times = {}
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the modules of the game")
+    parser.add_argument("modules", nargs="*", default=["start_screen", "main", "game_logic.quantum_circuits"])
+    parser.add_argument("--repeat", type=int, default=5, help="number of imports per module, the median is reported")
+    parser.add_argument("--top", type=int, default=0, help="also show the slowest imports of every module")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        total = statistics.median(run[module] for run in runs)
+        print(f"{module:<30} {total:8.1f} ms")
+        if args.top > 0:
+            slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+            for name, time in [item for item in slowest if item[0] != module][:args.top]:
+                print(f"    {name:<50} {time:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
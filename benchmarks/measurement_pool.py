@@ -0,0 +1,99 @@
+"""
+Description
+-----------
+Play many headless games at the same time in one process (one thread per game) and compare measuring every circuit on
+the thread of its game with measuring all circuits in one shared MeasurementPool. Prints the duration and the metrics of the pool.
+Afterwards the circuits of the games are measured with the AerSimulator, one by one and through the pool, which combines
+the requests of a batch into one sampler job (see quantum_circuits.measure_many())
+
+Example
+-------
+python benchmarks/measurement_pool.py\\
+python benchmarks/measurement_pool.py --games 64 --workers 8 --batch-size 32
+
+Results
+-------
+32 games on one core. The engine measures with the sparse simulator, which takes about 0.3 ms per circuit and runs no
+sampler job, so the pool can only add the overhead of the dispatcher and the worker processes. It only pays off for
+requests that run a sampler job (the AerSimulator, a noise model or a quantum computer) or with more cores
+
+    games without pool   1.65 s
+    games with pool      2.40 s
+    aer without pool     1.89 s   (the circuits of the 32 games after 12 turns)
+    aer with pool        1.67 s
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from game_logic.engine import Engine
+from game_logic.measurement_pool import MeasurementPool
+
+def play_games(games : int, pool = None, max_turns : int = 10000):
+    """Play games with seeds 0, ..., games - 1 at the same time and return the winners and the duration in seconds"""
+    winners = [None] * games
+    def play(seed):
+        engine = Engine(rng = random.Random(seed), pool = pool)
+        turns = 0
+        while engine.play_turn() is None and turns < max_turns:
+            turns += 1
+        winners[seed] = engine.winner()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target = play, args = (seed,)) for seed in range(games)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return winners, time.perf_counter() - start
+
+def mid_game_circuits(games : int, turns : int = 12):
+    """Circuits of games with seeds 0, ..., games - 1 after the given number of turns"""
+    circuits = []
+    for seed in range(games):
+        engine = Engine(rng = random.Random(seed))
+        for turn in range(turns):
+            engine.play_turn()
+        circuits.append(engine.circuit)
+    return circuits
+
+def measure_circuits(circuits, pool = None):
+    """Measure the circuits with the AerSimulator (circuit.measure(efficient = True)) and return the duration in seconds"""
+    start = time.perf_counter()
+    if pool is None:
+        for qc in circuits:
+            qc.detach().measure(shots = 1, efficient = True)
+    else:
+        futures = [pool.submit(qc.detach(), seed = seed, shots = 1, efficient = True) for seed, qc in enumerate(circuits)]
+        for future in futures:
+            future.result()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent games with and without a shared measurement pool")
+    parser.add_argument("--games", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, all cores by default")
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    winners, duration = play_games(args.games)
+    print(f"games without pool {duration:6.2f} s")
+    with MeasurementPool(workers = args.workers, batch_size = args.batch_size) as pool:
+        winners, duration = play_games(args.games, pool = pool)
+        print(f"games with pool    {duration:6.2f} s")
+        for name, value in pool.metrics().items():
+            print(f"    {name:<16} {value:.4g}")
+
+        circuits = mid_game_circuits(args.games)
+        # The first measurement builds the AerSimulator and the transpiler (in every worker)
+        measure_circuits(circuits[:1])
+        measure_circuits(circuits[:pool.workers], pool = pool)
+        print(f"aer without pool   {measure_circuits(circuits):6.2f} s")
+        print(f"aer with pool      {measure_circuits(circuits, pool = pool):6.2f} s")
+
+if __name__ == "__main__":
+    main()
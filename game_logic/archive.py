@@ -0,0 +1,209 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+if __package__:
+    from .game_record import GameRecord, TURN, decode_turn
+else:
+    from game_record import GameRecord, TURN, decode_turn
+
+
+MAGIC = b"QLDA"
+INDEX_MAGIC = b"QLDI"
+VERSION = 1
+# magic, version, number of positions on the board, 2 reserved bytes. The same for the archive and the index file
+HEADER = struct.Struct("<4sBBxx")
+# One turn of game_record.TURN as a NumPy structured type, such that the turns in the archive can be read without copying
+TURN_DTYPE = np.dtype([("dice_kind", "u1"), ("move_trigger", "u1"), ("outcome", "<u8")])
+# Index entry of a game: the number of turns before the game in the archive and the number of turns of the game
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("turns", "<u8")])
+
+
+def _index_path(path : str) -> str:
+    return path + ".idx"
+
+def _check_header(data, magic : bytes, path : str) -> int:
+    """Check the header of an archive or index file and return the number of positions of the board"""
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a game archive: too short")
+    file_magic, version, N = HEADER.unpack_from(data)
+    if file_magic != magic:
+        raise ValueError(f"{path} is not a game archive: wrong magic bytes")
+    if version != VERSION:
+        raise ValueError(f"Unsupported game archive version {version}")
+    return N
+
+
+class ArchiveWriter():
+    """
+    Description
+    -----------
+    Append game records (see game_record.GameRecord) to an archive file. The archive is a header followed by the turns of
+    all games, TURN.size bytes each, so its size grows linearly with the number of turns. Next to it, path + ".idx" contains
+    the offset and the number of turns of every game (INDEX_DTYPE). Both files are only appended to: the turns of a game are
+    written before its index entry, so an interrupted write never corrupts the games that are already in the index
+
+    Parameters
+    ----------
+    path : str
+        Archive file, created if it does not exist
+    N : int
+        Number of positions on the board, every game in an archive must have the same N
+
+    Example
+    -------
+    with ArchiveWriter("games.qlda") as writer:\\
+        writer.append(engine.record)
+    """
+    def __init__(self, path : str, N : int = 32):
+        self.path = path
+        self.N = N
+        for file_path, magic in ((path, MAGIC), (_index_path(path), INDEX_MAGIC)):
+            if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+                with open(file_path, "wb") as file:
+                    file.write(HEADER.pack(magic, VERSION, N))
+            else:
+                with open(file_path, "rb") as file:
+                    if _check_header(file.read(HEADER.size), magic, file_path) != N:
+                        raise ValueError(f"{file_path} contains games with a different number of positions")
+        self.file = open(path, "ab")
+        self.index = open(_index_path(path), "ab")
+        # Position of the next game in turns. Turns that were written without index entry (an interrupted write) are skipped
+        self.offset = (os.path.getsize(path) - HEADER.size) // TURN.size
+
+    def append(self, record : GameRecord) -> int:
+        """Append a game and return its number in the archive"""
+        if record.N != self.N:
+            raise ValueError("The game has a different number of positions than the archive")
+        self.file.write(record.turns)
+        self.file.flush()
+        self.index.write(np.array([(self.offset, len(record))], dtype = INDEX_DTYPE).tobytes())
+        self.index.flush()
+        self.offset += len(record)
+        return (self.index.tell() - HEADER.size) // INDEX_DTYPE.itemsize - 1
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+class GameArchive():
+    """
+    Description
+    -----------
+    Read an archive written by ArchiveWriter. Both files are memory mapped and viewed as NumPy arrays (TURN_DTYPE and
+    INDEX_DTYPE) without copying, so opening an archive does not read or parse the games, and turn T of game G is found
+    with one lookup in the index. Games that are appended after opening are not visible, open the archive again
+
+    Parameters
+    ----------
+    path : str
+        Archive file
+
+    Attributes
+    ----------
+    turns : np.ndarray
+        All turns of all games (TURN_DTYPE), a view on the archive file
+    index : np.ndarray
+        Offset and number of turns of every game (INDEX_DTYPE), a view on the index file
+
+    Example
+    -------
+    with GameArchive("games.qlda") as archive:\\
+        archive.turn(1000, 25)\\
+        replay.Replay(archive.record(1000)).seek(25)\\
+        np.bincount(archive.triggers(archive.turns)) # number of turns without, with a final and with a threshold measurement
+    """
+    def __init__(self, path : str):
+        self.path = path
+        self._files = []
+        self._maps = []
+        data = self._map(path)
+        self.N = _check_header(data, MAGIC, path)
+        index = self._map(_index_path(path))
+        _check_header(index, INDEX_MAGIC, _index_path(path))
+
+        self.index = np.frombuffer(index, dtype = INDEX_DTYPE, offset = HEADER.size,
+                                   count = (len(index) - HEADER.size) // INDEX_DTYPE.itemsize)
+        self.turns = np.frombuffer(data, dtype = TURN_DTYPE, offset = HEADER.size,
+                                   count = (len(data) - HEADER.size) // TURN.size)
+
+    def __len__(self):
+        """Number of games"""
+        return len(self.index)
+
+    def game(self, game : int) -> np.ndarray:
+        """The turns of a game (a view, TURN_DTYPE)"""
+        offset, turns = self.index[game]
+        return self.turns[int(offset):int(offset + turns)]
+
+    def turn(self, game : int, turn : int) -> dict:
+        """Turn of a game, decoded as in game_record.decode_turn()"""
+        offset, turns = self.index[game]
+        if not 0 <= turn < turns:
+            raise IndexError("turn out of range")
+        return decode_turn(self.turns[int(offset) + turn : int(offset) + turn + 1].tobytes())
+
+    def record(self, game : int) -> GameRecord:
+        """The game as a GameRecord, e.g. to replay it with replay.Replay"""
+        return GameRecord(self.N, self.game(game).tobytes())
+
+    # --------------------------------------------------------------
+    # Fields of many turns at once (e.g. self.turns or self.game(G))
+    # --------------------------------------------------------------
+    @staticmethod
+    def dice(turns : np.ndarray) -> np.ndarray:
+        """Array of shape (len(turns), 2) with both dice of every turn"""
+        return np.stack([turns["dice_kind"] & 7, turns["dice_kind"] >> 3 & 7], axis = -1)
+
+    @staticmethod
+    def kinds(turns : np.ndarray) -> np.ndarray:
+        """Kind of move of every turn as index in game_record.KINDS (0 if no move was made)"""
+        return turns["dice_kind"] >> 6
+
+    @staticmethod
+    def moves_from(turns : np.ndarray) -> np.ndarray:
+        return turns["move_trigger"] & 63
+
+    @staticmethod
+    def triggers(turns : np.ndarray) -> np.ndarray:
+        """Trigger of the measurement of every turn as index in game_record.TRIGGERS (0 if nothing was measured)"""
+        return turns["move_trigger"] >> 6
+
+    @staticmethod
+    def outcomes(turns : np.ndarray) -> np.ndarray:
+        """Bitmask of the measured positions that contained a pawn (bit i is position i) of every turn"""
+        return turns["outcome"]
+
+    def close(self):
+        # The arrays are views on the maps, they must be released before the maps can be closed. If a view
+        # is still used elsewhere, the map is closed when that view is freed
+        self.turns = self.index = None
+        for memory_map in self._maps:
+            try:
+                memory_map.close()
+            except BufferError:
+                pass
+        for file in self._files:
+            file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def _map(self, path : str) -> mmap.mmap:
+        file = open(path, "rb")
+        self._files.append(file)
+        memory_map = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        self._maps.append(memory_map)
+        return memory_map
@@ -0,0 +1,163 @@
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+if __package__:
+    from .engine import Engine
+else:
+    from engine import Engine
+
+
+# The four measurement settings of the CHSH inequality. Every setting finishes a different pawn, which determines the
+# measurement bases of the other pawns (see Engine.measure_basis_dict). The outcome of a setting is +1 if both positions
+# are occupied or both are empty and -1 otherwise
+SETTINGS = {
+    "ZT": {"color": 0, "dice": [1,1], "move_from": 25, "final_position": 1, "positions": (23, 24)}, # red pawn 1
+    "ZQ": {"color": 0, "dice": [2,2], "move_from": 24, "final_position": 0, "positions": (23, 32)}, # red pawn 0
+    "XT": {"color": 2, "dice": [2,2], "move_from": 9,  "final_position": 5, "positions": (23, 24)}, # blue pawn 1
+    "XQ": {"color": 2, "dice": [2,2], "move_from": 8,  "final_position": 4, "positions": (23, 24)}, # blue pawn 0
+}
+# S = E(ZT) + E(XQ) + E(XT) - E(ZQ), at most 2 for a classical (local) theory and 2*sqrt(2) for the game
+SIGNS = {"ZT": 1, "ZQ": -1, "XT": 1, "XQ": 1}
+
+
+def board(N : int = 32) -> Engine:
+    """
+    Description
+    -----------
+    Engine with the board of the Bell test (the same moves as main.Main.bell_test()): two pawns are entangled
+    by a superposition move and two captures, the measurement bases depend on the pawn that finishes
+    """
+    engine = Engine(N)
+    engine.force_standard_basis = False
+    engine.current_turn = engine.colors[0]
+    engine.new_pawn(0, 20)
+    engine.current_turn = engine.colors[1]
+    engine.new_pawn(2, 19)
+    engine.new_pawn(3, 23)
+    engine.current_turn = engine.colors[2]
+    engine.new_pawn(5, 9)
+    engine.new_pawn(4, 8)
+    engine.current_turn = engine.colors[0]
+    engine.new_pawn(1, 25)
+
+    engine.die_throws = [1,3]
+    engine.move(20)
+    engine.current_turn = engine.colors[2]
+    engine.die_throws = [2,2]
+    engine.direct_move(19)
+    return engine
+
+def prepare(setting : str, N : int = 32):
+    """
+    Description
+    -----------
+    Build the circuit of one measurement setting: the Bell test board, the move that finishes the pawn of the setting
+    and the rotation to the measurement bases, see SETTINGS
+
+    Returns
+    -------
+    qc : quantum_circuits.circuit
+        Circuit that is ready to be measured
+    """
+    if setting not in SETTINGS:
+        raise ValueError(f"setting must be one of {list(SETTINGS)}")
+    engine = board(N)
+    options = SETTINGS[setting]
+    engine.current_turn = engine.colors[options["color"]]
+    engine.die_throws = options["dice"]
+    engine.direct_move(options["move_from"])
+    engine.measure_basis(final_position = options["final_position"])
+    return engine.circuit
+
+def agreement(setting : str, engine : str = "sparse", N : int = 32) -> float:
+    """
+    Description
+    -----------
+    Exact probability that the outcome of a setting is +1 (both positions occupied or both empty), calculated from
+    the correlator of its circuit, see circuit.expectation()
+    """
+    return (1 + prepare(setting, N).expectation(SETTINGS[setting]["positions"], engine = engine)) / 2
+
+def run(iterations : int = 999, seed : int = None, callback : Callable = None, output : str = None, flush_every : int = 100, engine : str = "sparse") -> List[float]:
+    """
+    Description
+    -----------
+    Bell test without user interface. The circuits of the four settings are built and simulated once, after which
+    every iteration picks a random setting and draws its outcome (+1 or -1), like measuring that circuit once.
+    The running estimate of S is passed to the callback and/or written to the output file
+
+    Parameters
+    ----------
+    iterations : int
+        Number of measurements
+    seed : int
+        Seed of the choice of the setting and the outcomes
+    callback : function
+        Called as callback(iteration, S, outcomes) after every measurement, where outcomes is
+        {setting : {"amount" : number of measurements, "total" : sum of the outcomes}}
+    output : str
+        If given, one line "iteration S" is appended to this file for every measurement
+    flush_every : int
+        The output file is flushed every flush_every measurements
+    engine : str
+        Simulator of the circuits, see circuit.correlators()
+
+    Returns
+    -------
+    Ss : list[float]
+        S after every measurement
+    """
+    rng = random.Random(seed)
+    settings = list(SETTINGS)
+    agreements = [agreement(setting, engine = engine) for setting in settings]
+    signs = [SIGNS[setting] for setting in settings]
+    amounts = [0] * len(settings)
+    totals = [0] * len(settings)
+    outcomes = {setting: {"amount" : 0, "total" : 0} for setting in settings}
+
+    file = open(output, "a") if output is not None else None
+    Ss = []
+    S = 0
+    try:
+        for i in range(1, iterations + 1):
+            s = rng.randrange(len(settings))
+            outcome = 1 if rng.random() < agreements[s] else -1
+            # Only the term of the measured setting changes
+            if amounts[s] != 0:
+                S -= signs[s] * totals[s] / amounts[s]
+            amounts[s] += 1
+            totals[s] += outcome
+            S += signs[s] * totals[s] / amounts[s]
+            Ss.append(S)
+
+            if callback is not None:
+                outcomes[settings[s]]["amount"] = amounts[s]
+                outcomes[settings[s]]["total"] = totals[s]
+                callback(i, S, outcomes)
+            if file is not None:
+                file.write(f"{i} {S}\n")
+                if i % flush_every == 0:
+                    file.flush()
+    finally:
+        if file is not None:
+            file.close()
+    return Ss
+
+def exact_S(engine : str = "sparse") -> float:
+    """S without shot noise, from the exact correlators of the four settings, see circuit.expectation()"""
+    return sum(SIGNS[setting] * prepare(setting).expectation(SETTINGS[setting]["positions"], engine = engine) for setting in SETTINGS)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Bell test of the game without user interface and report S")
+    parser.add_argument("--iterations", type=int, default=999)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", type=str, default=None, help="append 'iteration S' for every measurement to this file")
+    parser.add_argument("--engine", type=str, default="sparse", choices=["sparse", "aer"])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    Ss = run(iterations = args.iterations, seed = args.seed, output = args.output, engine = args.engine)
+    print(f"S after {args.iterations} measurements {Ss[-1]:.4f} ({time.perf_counter() - start:.2f} s)")
+    print(f"exact S                     {exact_S(engine = args.engine):.4f}")
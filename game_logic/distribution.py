@@ -0,0 +1,149 @@
+import itertools
+import random
+from typing import Dict, List, Tuple
+
+
+class OutcomeDistribution():
+    """
+    Description
+    -----------
+    Exact probability of every measurement outcome of the board. An outcome is described by the positions
+    (qubits) that contain a pawn after the measurement, stored as a sorted tuple.
+
+    Unlike the histogram of circuit._internal_measure(), this contains no shot noise and nothing is filtered,
+    so drawing one outcome from it is the same as measuring the circuit once.
+
+    Independent clusters of qubits are stored as separate factors, see OutcomeDistribution.product().
+    The joint probabilities are only calculated when they are asked for, because their number is the product
+    of the number of outcomes of every factor.
+
+    Parameters
+    ----------
+    probabilities : dict[tuple[int], float]
+        Maps the occupied positions of an outcome to the probability of that outcome
+    nr_of_qubits_used : int
+        Number of qubits that were simulated at once to obtain the distribution
+    qubits : list[int]
+        Positions described by the distribution, also those that are empty in every outcome.
+        By default the positions that are occupied in at least one outcome
+
+    Example
+    -------
+    qc = circuit(N=3)\\
+    qc.new_pawn([0])\\
+    qc.move([0], [1, 2])\\
+    qc.distribution()
+
+    >>> OutcomeDistribution({(1,): 0.5, (2,): 0.5})
+    """
+    def __init__(self, probabilities : Dict[Tuple[int], float], nr_of_qubits_used : int = None, qubits : List[int] = None):
+        self.factors = [{tuple(sorted(positions)): probability for positions, probability in probabilities.items()}]
+        if qubits is None:
+            qubits = {qubit for positions in self.factors[0] for qubit in positions}
+        self.factor_qubits = [frozenset(qubits)] # the positions of every factor
+        self.nr_of_qubits_used = nr_of_qubits_used
+        self._joint = None
+
+    @classmethod
+    def product(cls, distributions : List["OutcomeDistribution"]):
+        """Combine the distributions of independent clusters of qubits into one distribution"""
+        distribution = cls({})
+        distribution.factors = [factor for d in distributions for factor in d.factors]
+        distribution.factor_qubits = [qubits for d in distributions for qubits in d.factor_qubits]
+        if len(distribution.factors) == 0:
+            distribution.factors = [{(): 1.0}]
+            distribution.factor_qubits = [frozenset()]
+        distribution.nr_of_qubits_used = max((d.nr_of_qubits_used or 0 for d in distributions), default=0)
+        return distribution
+
+    @classmethod
+    def from_state(cls, state, nr_of_qubits_used : int = None):
+        """Build the distribution from a sparse_simulator.SparseState or ClusteredState"""
+        if hasattr(state, "states"):
+            return cls.product([cls(cls.from_state(cluster_state).factors[0], len(qubits), qubits) for qubits, cluster_state in zip(state.clusters(), state.states())])
+        return cls({tuple(state.positions(basis)): probability for basis, probability in state.probabilities().items()}, nr_of_qubits_used, range(state.N))
+
+    @classmethod
+    def from_bitstrings(cls, probabilities : Dict[str, float], qubit_map : List[int]):
+        """
+        Build the distribution from qiskit bitstrings (e.g. Statevector.probabilities_dict()).
+        Bit i of the (little endian) bitstring belongs to position qubit_map[i]
+        """
+        distribution = {}
+        for key, probability in probabilities.items():
+            positions = tuple(qubit_map[index] for index, char in enumerate(key[::-1]) if char == '1')
+            distribution[positions] = distribution.get(positions, 0) + float(probability)
+        return cls(distribution, len(qubit_map), qubit_map)
+
+    @property
+    def probabilities(self) -> Dict[Tuple[int], float]:
+        """Joint probability of every outcome"""
+        if self._joint is None:
+            if len(self.factors) == 1:
+                self._joint = self.factors[0]
+            else:
+                self._joint = dict(self.items())
+        return self._joint
+
+    def __len__(self):
+        length = 1
+        for factor in self.factors:
+            length *= len(factor)
+        return length
+
+    def __iter__(self):
+        return (positions for positions, probability in self.items())
+
+    def __getitem__(self, positions):
+        positions = set(positions)
+        probability = 1
+        for factor, factor_qubits in zip(self.factors, self.factor_qubits):
+            probability *= factor.get(tuple(sorted(positions & factor_qubits)), 0)
+            positions -= factor_qubits
+        return probability if len(positions) == 0 else 0
+
+    def __repr__(self):
+        if len(self.factors) == 1:
+            return f"OutcomeDistribution({self.factors[0]})"
+        return f"OutcomeDistribution.product({[OutcomeDistribution(factor) for factor in self.factors]})"
+
+    def items(self):
+        """Iterate over (positions, probability) of every joint outcome"""
+        if len(self.factors) == 1:
+            yield from self.factors[0].items()
+            return
+        for combination in itertools.product(*(factor.items() for factor in self.factors)):
+            positions = tuple(sorted(qubit for outcome, probability in combination for qubit in outcome))
+            probability = 1
+            for outcome, factor_probability in combination:
+                probability *= factor_probability
+            yield positions, probability
+
+    def sample(self, rng = random) -> List[int]:
+        """Draw one outcome (one per factor) and return the positions that contain a pawn"""
+        positions = []
+        for factor in self.factors:
+            outcomes = list(factor.keys())
+            positions += rng.choices(outcomes, weights=list(factor.values()), k=1)[0]
+        return sorted(positions)
+
+    def expectation(self, positions : List[int]) -> float:
+        """
+        Expectation value of the outcome that is +1 if an even number of the positions contains a pawn and -1 otherwise.
+        The factors are independent, so this is the product of the expectation value of every factor
+        """
+        positions = set(positions)
+        expectation = 1.0
+        for factor in self.factors:
+            expectation *= sum(probability * (-1)**len(positions.intersection(outcome)) for outcome, probability in factor.items())
+        return expectation
+
+    def most_likely(self) -> List[int]:
+        return sorted(qubit for factor in self.factors for qubit in max(factor, key=factor.get))
+
+    def to_frequency_dict(self) -> Dict[float, List[int]]:
+        """
+        Convert to the {probability : positions} format returned by circuit.measure() for sampled histograms.
+        Note that outcomes with exactly the same probability overwrite each other in this format
+        """
+        return {probability: list(positions) for positions, probability in self.items()}
@@ -0,0 +1,598 @@
+import random
+from typing import List, Tuple
+
+if __package__:
+    from .quantum_circuits import circuit
+    from .game_record import GameRecord
+else:
+    from quantum_circuits import circuit
+    from game_record import GameRecord
+
+def _rotate(mask : int, shift : int, N : int) -> int:
+    """Rotate a bitboard of N positions: bit i of the result is bit (i + shift) % N of mask"""
+    shift %= N
+    return ((mask >> shift) | (mask << (N - shift))) & ((1 << N) - 1)
+
+def _bits(mask : int) -> List[int]:
+    """Positions of the set bits of a bitboard, in increasing order"""
+    positions = []
+    while mask:
+        lowest = mask & -mask
+        positions.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return positions
+
+
+class Engine():
+    """
+    Description
+    -----------
+    Rules and state of the game without any user interface: the board, turn order, dice, move generation, captures
+    (the entanglement in the quantum circuit) and the reconciliation of the board after a measurement.
+    main.Main is a view on top of this class, but the engine can also play complete games on its own, see Engine.play_turn()
+
+    The board is stored in three lists of pawn numbers. Pawn number 2*c + p is pawn p (0 or 1) of color self.colors[c],
+    an empty position is None. Because of this numbering home[i] and final[i] can only ever contain pawn number i.
+    For every pawn the board positions it occupies are also kept as a bitboard (bit i is position i), which is used to
+    generate the moves with a few bit operations (see Engine.options()) and as an index from pawn to positions, so
+    Engine.positions(), Engine.entanglement() and Engine.classical() need no scan of the board. Therefore the board must only be changed with Engine.place()
+
+    Parameters
+    ----------
+    N : int
+        Number of positions on the board. Qubits N and N+1 of the circuit are the final positions
+    simulation : boolean
+        If True, the quantum circuit is simulated. If False, it is run on a real quantum computer using the service
+    service : qiskit_ibm_runtime.QiskitRuntimeService
+        Service that is used if simulation == False
+    rng : random.Random
+        Source of randomness for the dice, the random moves and the measurement outcomes (see quantum_circuits.circuit).
+        A seeded random.Random replays a game exactly
+    pool : measurement_pool.MeasurementPool
+        If given (and simulation == True), the circuit is measured by this pool of workers, which can be shared by many
+        engines. The seed of every measurement is then drawn from rng. The engine measures with the sparse simulator,
+        which runs no sampler job that the pool could share between requests, so the pool gives no speedup on one core
+        and is not used by default, see benchmarks/measurement_pool.py
+    verbose : boolean
+        Print which pawns are removed from the board after a measurement
+    record : boolean
+        If True, the dice, moves and measurements of every turn are kept in self.record (a game_record.GameRecord),
+        from which the game can be replayed, see replay.Replay. Pawns that are placed directly (new_pawn() with
+        optional_move_to, used by the debug scenarios) can not be replayed
+
+    Attributes
+    ----------
+    board : list[int]
+        Pawn number on every position of the board
+    pawn_masks : list[int]
+        Bitboard of the positions of every pawn number
+    home : list[int]
+        Pawn number on every home position
+    final : list[int]
+        Pawn number on every final position
+    current_turn : str
+        Color that is currently playing
+    die_throws : list[int]
+        The last two dice that were thrown
+    circuit : quantum_circuits.circuit
+        Quantum circuit that describes the board
+
+    Example
+    -------
+    engine = Engine(rng=random.Random(1))\\
+    while engine.play_turn() is None:\\
+        pass\\
+    engine.winner()
+
+    >>> 'Blue' # the outcome of the measurements is random as well, so this can differ
+    """
+    def __init__(self, N=32, simulation = True, service = None, rng = random, verbose = False, pool = None, record = False):
+        self.N = N
+        self.simulation = simulation
+        self.service = service
+        self.rng = rng
+        self.pool = pool
+        self.verbose = verbose
+        self.record = GameRecord(N) if record else None
+        self.measure_threshold = 20 # The circuit is measured when this many positions are occupied
+        self.force_standard_basis = True # Only measure in other bases than Z if the trigger is given, see Engine.measure_basis()
+
+        self.colors = ['Red', 'Green', 'Blue', 'Purple'] # MUST BE FOUR COLOURS
+        self.measure_basis_dict = {
+            (self.colors[0],    0): {self.colors[0]:    "Z", self.colors[1]:  "Q", self.colors[2]:   "X", self.colors[3]: "T"},
+            (self.colors[0],    1): {self.colors[0]:    "Z", self.colors[3]: "Q", self.colors[2]:   "X", self.colors[1]:  "T"},
+            (self.colors[2],   0): {self.colors[2]:   "Z", self.colors[3]: "Q", self.colors[0]:    "X", self.colors[1]:  "T"},
+            (self.colors[2],   1): {self.colors[2]:   "Z", self.colors[1]:  "Q", self.colors[0]:    "X", self.colors[3]: "T"},
+            (self.colors[1],  0): {self.colors[1]:  "Z", self.colors[0]:    "Q", self.colors[3]: "X", self.colors[2]:   "T"},
+            (self.colors[1],  1): {self.colors[1]:  "Z", self.colors[2]:   "Q", self.colors[3]: "X", self.colors[0]:    "T"},
+            (self.colors[3], 0): {self.colors[3]: "Z", self.colors[2]:   "Q", self.colors[1]:  "X", self.colors[0]:    "T"},
+            (self.colors[3], 1): {self.colors[3]: "Z", self.colors[0]:    "Q", self.colors[1]:  "X", self.colors[2]:   "T"}
+        }
+        self.start_position = {
+            self.colors[0] : 26,
+            self.colors[1] : 2,
+            self.colors[2] : 10,
+            self.colors[3] : 18
+        }
+
+        self.circuit = circuit(self.N, live_state = self.simulation, rng = self.rng)
+        self.die_throws = None
+        self.last_measurement = None
+        self.reset(reset_circuit = False)
+
+    def reset(self, reset_circuit = True):
+        """Put all pawns back in their home positions and give the turn to the last color. The dice are not changed"""
+        if reset_circuit == True:
+            self.circuit._reset()
+            if self.record is not None:
+                self.record = GameRecord(self.N)
+        self.board = [None] * self.N
+        self.pawn_masks = [0] * (2 * len(self.colors))
+        self.home = list(range(2 * len(self.colors)))
+        self.final = [None] * (2 * len(self.colors))
+        self.current_turn = self.colors[-1]
+        self.total_turns = 0
+
+    # -----------
+    # Board state
+    # -----------
+    def pawn_id(self, color : str, pawn : int) -> int:
+        """Pawn number of pawn (0 or 1) of color"""
+        return self.colors.index(color) * 2 + pawn
+
+    def describe(self, pawn_id : int) -> Tuple[str, int]:
+        """Color and pawn (0 or 1) of a pawn number, (None, None) for an empty position"""
+        if pawn_id is None:
+            return None, None
+        return self.colors[pawn_id // 2], pawn_id % 2
+
+    def occupied(self) -> int:
+        """Number of occupied positions on the board"""
+        mask = 0
+        for pawn_mask in self.pawn_masks:
+            mask |= pawn_mask
+        return mask.bit_count()
+
+    def positions(self, pawn_id : int) -> List[int]:
+        """The positions of the board that contain the pawn, in increasing order"""
+        return _bits(self.pawn_masks[pawn_id])
+
+    def classical(self, position : int) -> bool:
+        """True if the pawn on the position is not in a superposition (it is on no other position of the board)"""
+        pawn_id = self.board[position]
+        if pawn_id is None:
+            return self.board.count(None) == 1
+        return self.pawn_masks[pawn_id].bit_count() == 1
+
+    def entanglement(self, position : int) -> List[int]:
+        """The other positions of the board that contain the same pawn as position"""
+        pawn_id = self.board[position]
+        if pawn_id is None:
+            return [i for i in range(self.N) if self.board[i] is None and i != position]
+        return _bits(self.pawn_masks[pawn_id] & ~(1 << position))
+
+    def winner(self) -> str:
+        """The color that has both pawns in its final positions, None if nobody has won yet"""
+        for color in self.colors:
+            if all(self.final[self.pawn_id(color, pawn)] is not None for pawn in [0, 1]):
+                return color
+        return None
+
+    def snapshot(self):
+        """Copy of the board and turn (and the number of recorded turns) that can be passed to Engine.restore()"""
+        return (tuple(self.home), tuple(self.board), tuple(self.final), self.current_turn, len(self.record) if self.record is not None else None)
+
+    def restore(self, snapshot):
+        """Restore the board and turn of Engine.snapshot(). The circuit is not changed, see circuit.undo()"""
+        home, board, final, self.current_turn, recorded = snapshot
+        if self.record is not None and recorded is not None:
+            self.record.rewind(recorded)
+        self.home, self.final = list(home), list(final)
+        self.board = [None] * self.N
+        self.pawn_masks = [0] * (2 * len(self.colors))
+        for position, pawn_id in enumerate(board):
+            self.place(position, pawn_id)
+
+    def place(self, position : int, pawn_id : int):
+        """Put a pawn number (None to remove the pawn) on a board position and update the bitboards"""
+        if self.board[position] is not None:
+            self.pawn_masks[self.board[position]] &= ~(1 << position)
+        if pawn_id is not None:
+            self.pawn_masks[pawn_id] |= 1 << position
+        self.board[position] = pawn_id
+
+    def color_mask(self, color : str) -> int:
+        """Bitboard of the positions occupied by the pawns of a color"""
+        pawn_id = self.pawn_id(color, 0)
+        return self.pawn_masks[pawn_id] | self.pawn_masks[pawn_id + 1]
+
+    # ---------------
+    # Turns and moves
+    # ---------------
+    def advance_turn(self):
+        """Give the turn to the next color"""
+        self.total_turns += 1
+        self.current_turn = self.colors[(self.colors.index(self.current_turn)+1)%4]
+        if self.record is not None:
+            self.record.new_turn()
+
+    def throw_dice(self, dice : List[int] = None) -> List[int]:
+        """Throw the two dice, or use the given dice"""
+        ar = [1,2,3,4,5,6]
+        self.die_throws = list(dice) if dice is not None else [self.rng.choice(ar), self.rng.choice(ar)]
+        if self.record is not None:
+            self.record.set_dice(self.die_throws)
+        return self.die_throws
+
+    def options(self) -> List[List[int]]:
+        """
+        Description
+        -----------
+        Determine the possible moves for the current player with the current dice. There are three types:
+            - superposition move: move a pawn into a superposition (for example: |100⟩ -> |010⟩ + |001⟩), see Engine.move()
+            - new pawn move: move a pawn from the home position to the board (|0⟩ -> |1⟩), see Engine.new_pawn()
+            - single move: move a pawn from one position to another (for example: q1 SWAP q2), see Engine.direct_move()
+
+        Returns
+        -------
+        options : list[list[int]]
+            [superposition_move_options, new_pawn_options, single_move_options]; the board positions (or home positions
+            for new pawns) from which a pawn can be moved
+        """
+        own = self.color_mask(self.current_turn)
+        first, second = self.die_throws
+        # Bit i of _rotate(own, d) is set if position i + d contains a pawn of the current color
+        free_first = own & ~_rotate(own, first, self.N)
+        if first != second:
+            superposition_move_options = _bits(free_first & ~_rotate(own, second, self.N))
+            single_move_options = []
+        else:
+            superposition_move_options = []
+            single_move_options = _bits(free_first)
+
+        new_pawn_options = []
+        if 6 in self.die_throws and not (own >> self.start_position[self.current_turn]) & 1:
+            pawn_id = self.pawn_id(self.current_turn, 0)
+            new_pawn_options = [i for i in [pawn_id, pawn_id + 1] if self.home[i] is not None]
+        return [superposition_move_options, new_pawn_options, single_move_options]
+
+    def moves(self) -> List[Tuple[str, int]]:
+        """All possible moves as (name of the Engine method that makes the move, move_from), see Engine.options()"""
+        return [(kind, move_from) for kind, option in zip(["move", "new_pawn", "direct_move"], self.options()) for move_from in option]
+
+    def random_option(self, options : List[List[int]] = None) -> Tuple[str, int]:
+        """
+        Choose a random type of move and then a random move of that type, like the "random turn" of the game.
+        Returns the name of the method that makes the move ("move", "new_pawn" or "direct_move") and its move_from,
+        or None if there are no possible moves
+        """
+        if options is None:
+            options = self.options()
+        kinds = [(kind, option) for kind, option in zip(["move", "new_pawn", "direct_move"], options) if len(option) != 0]
+        if len(kinds) == 0:
+            return None
+        kind, option = self.rng.choice(kinds)
+        return kind, self.rng.choice(option)
+
+    def find_next_available_spot(self, changing_move : int, constant_move : int = None) -> int:
+        """
+        Test if the position to move to is occupied (this happens for example when capturing a pawn)
+        If this is the case, find the next possible position to move to
+        When moving the pawn into a superposition, the pawn can overlap with itself.
+        To find the next possible position in this case provide the two arguments
+        """
+        while (self.board[changing_move] is not None
+            or (constant_move is not None and changing_move == constant_move)):
+            changing_move = (changing_move + 1) % self.N
+        return changing_move
+
+    def check_if_moving_in_final_positions(self, move_from : int, move_to : List[int]) -> list:
+        """Check if the move_to position is beyond the final_position for a color on a board. If so, move to the final position"""
+        start_position = self.start_position[self.current_turn]
+        for i, move in enumerate(move_to):
+            if (move_from - start_position) % self.N > 16 and (move - start_position) % self.N < 16: #this might not be the most general solution, but since the maximum movement is 6 this will work
+                move_to[i] = self.current_turn
+        return move_to
+
+    def direct_move(self, move_from : int) -> int:
+        """
+        Move a pawn from one position to another and potentially capture another pawn.
+        Returns the final position the pawn moved to, or None if it stayed on the board
+        """
+        if self.record is not None:
+            self.record.set_move(self.die_throws, "direct_move", move_from)
+        move_to = [(move_from + self.die_throws[0]) % self.N]
+        captives = [pos for pos in move_to if self.board[pos] is not None]
+        normal_move = [pos for pos in move_to if self.board[pos] is None]
+        captive_entanglement = [self.entanglement(move) for move in captives]
+        capture_move = [self.find_next_available_spot(move) for move in captives]
+
+        normal_move = self.check_if_moving_in_final_positions(move_from, normal_move)
+        capture_move = self.check_if_moving_in_final_positions(move_from, capture_move)
+        move_to = normal_move + capture_move
+
+        final_pos = None
+        if self.current_turn in move_to:
+            final_pos = self.board[move_from]
+            self.final[final_pos] = self.board[move_from]
+            move_to = [self.N]
+            capture_move = [self.N]
+        else:
+            self.place(move_to[0], self.board[move_from])
+        self.place(move_from, None)
+
+        self.circuit.switch([move_from], move_to)
+
+        if captives:
+            self.circuit.capture(capture_move, captives, captive_entanglement[0])
+        return final_pos
+
+    def move(self, move_from : int) -> int:
+        """
+        Move a pawn from one position to two others (in a superposition) and potentially capture another or two other pawns.
+        Returns the final position if (part of) the pawn moved to it, otherwise None
+        """
+        if self.record is not None:
+            self.record.set_move(self.die_throws, "move", move_from)
+        move_to = [(move_from + self.die_throws[0]) % self.N, (move_from + self.die_throws[1]) % self.N]
+        move_to.sort()
+        captives = [pos for pos in move_to if self.board[pos] is not None]
+        normal_move = [pos for pos in move_to if self.board[pos] is None]
+        captive_entanglement = [self.entanglement(move) for move in captives]
+        capture_move = [self.find_next_available_spot(move) for move in captives]
+
+        if len(captives) != 0:
+            capture_move[0] = self.find_next_available_spot(changing_move=capture_move[0], constant_move=(normal_move[0] if len(captives) == 1 else capture_move[1]))
+
+        normal_move = self.check_if_moving_in_final_positions(move_from, normal_move)
+        capture_move = self.check_if_moving_in_final_positions(move_from, capture_move)
+
+        nr_of_final_positions = sum(1 for pos in normal_move+capture_move if pos == self.current_turn)
+        if nr_of_final_positions == 1:
+            normal_move = [self.N if x == self.current_turn else x for x in normal_move]
+            capture_move = [self.N if x == self.current_turn else x for x in capture_move]
+        if nr_of_final_positions == 2:
+            if len(normal_move) == 2:
+                normal_move = [self.N, self.N + 1]
+            elif len(capture_move) == 2:
+                capture_move = [self.N, self.N + 1]
+            else:
+                normal_move = [self.N if x == self.current_turn else x for x in normal_move]
+                capture_move = [self.N + 1 if x == self.current_turn else x for x in capture_move]
+        move_to = normal_move + capture_move
+        pawn_id = self.board[move_from]
+
+        self.circuit.move(move_from = [move_from], move_to = move_to)
+        for i in range(len(captives)):
+            self.circuit.capture(capturer=[capture_move[i]], captive = [captives[i]], captive_entanglement=captive_entanglement[i])
+
+        if nr_of_final_positions != 0:
+            self.final[pawn_id] = pawn_id
+        for pos in move_to:
+            if pos < self.N:
+                self.place(pos, pawn_id)
+        self.place(move_from, None)
+        return pawn_id if nr_of_final_positions != 0 else None
+
+    def new_pawn(self, move_from : int, optional_move_to : int = None):
+        """Move a pawn from the home position to the board and potentially capture another pawn"""
+        if self.record is not None:
+            self.record.set_move(self.die_throws, "new_pawn", move_from)
+        move_to_original = self.start_position[self.current_turn] if optional_move_to == None else optional_move_to
+        move_to = self.find_next_available_spot(move_to_original)
+        captive_entanglement = self.entanglement(move_to_original)
+
+        self.place(move_to, self.home[move_from])
+        self.home[move_from] = None
+
+        self.circuit.new_pawn([move_to])
+
+        if move_to != move_to_original:
+            self.circuit.capture([move_to], [move_to_original], captive_entanglement)
+
+    # -----------
+    # Measurement
+    # -----------
+    def measure_basis(self, final_position : int = None, trigger : Tuple[str, int] = None, standard_basis = False):
+        """
+        Description
+        -----------
+        Rotate every pawn to the measurement basis that belongs to the pawn that triggered the measurement, see self.measure_basis_dict
+
+        Parameters
+        ----------
+        final_position : int
+            Final position of the pawn that finished and triggered the measurement
+        trigger : (str, int)
+            Color and pawn that determine the measurement bases. By default the pawn that reached final_position
+        standard_basis : boolean
+            If True, measure everything in the standard basis (Z). If self.force_standard_basis == True, this is
+            also done if no trigger is given
+        """
+        if (trigger != None and self.force_standard_basis == True) or self.force_standard_basis == False:
+            if standard_basis == False:
+                if trigger == None:
+                    trigger = (self.current_turn, final_position % 2)
+                measure_basis = [self.measure_basis_dict[trigger][self.colors[pawn_id // 2]]
+                                 if pawn_id is not None else None
+                                 for pawn_id in self.board]
+                # measure basis of pawn that finished
+                if final_position is not None:
+                    # Append same thing twice
+                    measure_basis.append([self.measure_basis_dict[trigger][self.current_turn]] * 2)
+                else:
+                    measure_basis.append([None, None])
+                self.circuit.measure_basis(measure_basis)
+
+    def measure(self, final_position : int = None, reconcile = True, histogram = False) -> List[int]:
+        """
+        Description
+        -----------
+        Measure the circuit and update the board accordingly:
+            - remove the pawns that were not measured
+            - if the pawn that triggered the measurement reached its final position, remove it from the board.
+              Otherwise remove it from its final position
+            - if a pawn is measured at more than one position, only keep the furthest one
+            - put captured pawns back in their home position
+        Afterwards the circuit only contains the remaining (now classical) pawns
+
+        Parameters
+        ----------
+        final_position : int
+            Final position of the pawn that finished and triggered the measurement
+        reconcile : boolean
+            If False, the board is not changed (used for the Bell test)
+        histogram : boolean
+            If True, the full (exact if simulated) histogram is calculated and stored in self.last_measurement
+            as (histogram, nr_of_qubits_used)
+
+        Returns
+        -------
+        positions : list[int]
+            Measured positions (qubits) that contain a pawn
+        """
+        return self.collapse(self.sample(histogram = histogram), final_position = final_position, reconcile = reconcile)
+
+    def sample(self, histogram = False) -> List[int]:
+        """
+        Description
+        -----------
+        First half of Engine.measure(): measure the circuit without changing the board or the circuit. Pass the result to
+        Engine.collapse(). To measure on another thread, use Engine.prepare_sample() and Engine.store_sample() instead
+
+        Returns
+        -------
+        positions : list[int]
+            Measured positions (qubits) that contain a pawn
+        """
+        return self.store_sample(*self.prepare_sample(histogram = histogram)())
+
+    def prepare_sample(self, histogram = False, rng : random.Random = None):
+        """
+        Description
+        -----------
+        Prepare the measurement of Engine.sample(). The returned function does the slow part (a simulation or a job on a
+        quantum computer) without reading or changing the engine, so it can be run on another thread (see main.Main.measure_action)
+        as long as the circuit is not changed in the meantime, see circuit.detach()
+
+        Parameters
+        ----------
+        histogram : boolean
+            See Engine.measure()
+        rng : random.Random
+            Random number generator of the measurement, by default self.rng. A measurement on another thread must have
+            its own generator, e.g. random.Random(engine.rng.getrandbits(64)) drawn before it is started
+
+        Returns
+        -------
+        measure : function
+            Function without arguments that measures and returns (positions, histogram, measure info); pass these to
+            Engine.store_sample() to get the positions
+        """
+        # circuit.measure() resets the circuit, that is done by Engine.collapse() instead
+        circuit = self.circuit.detach()
+        if rng is not None:
+            circuit.rng = rng
+        if histogram:
+            kwargs = dict(out_internal_measure=True, efficient = True, simulator = self.simulation, service = self.service, engine = "sparse", exact = self.simulation)
+        else:
+            kwargs = dict(shots = 1, efficient = True, simulator = self.simulation, service = self.service, engine = "sparse")
+
+        pool = self.pool if self.simulation == True else None
+        if pool is not None:
+            del kwargs["service"] # the service can not be sent to another process
+            seed = circuit.rng.getrandbits(32)
+
+        def measure():
+            if pool is not None:
+                future = pool.submit(circuit, seed = seed, **kwargs)
+                output = future.result()
+                measure_info = future.last_measure_info
+            else:
+                output = circuit.measure(**kwargs)
+                measure_info = circuit.last_measure_info
+
+            if histogram:
+                positions, out_with_freq, nr_of_qubits_used = output
+                return positions, (out_with_freq, nr_of_qubits_used), measure_info
+            return output, None, measure_info
+        return measure
+
+    def store_sample(self, positions : List[int], last_measurement, last_measure_info) -> List[int]:
+        """Store the result of the function of Engine.prepare_sample() in self.last_measurement and circuit.last_measure_info and return the positions"""
+        self.last_measurement = last_measurement
+        self.circuit.last_measure_info = last_measure_info
+        return positions
+
+    def collapse(self, positions : List[int], final_position : int = None, reconcile = True) -> List[int]:
+        """Second half of Engine.measure(): update the board and the circuit to the positions returned by Engine.sample()"""
+        if reconcile == True:
+            self._reconcile(positions, final_position)
+            if self.record is not None:
+                self.record.set_measurement("final" if final_position is not None else "threshold", positions)
+
+        new_positions = [p for p in range(self.N) if self.board[p] is not None]
+        self.circuit._reset()
+        self.circuit.new_pawn(new_positions)
+        return positions
+
+    def play_turn(self) -> str:
+        """
+        Description
+        -----------
+        Play one turn without user interface: give the turn to the next color, throw the dice and make a random move.
+        Measure if a pawn reached its final position or if too many positions are occupied
+
+        Returns
+        -------
+        winner : str
+            The color that won the game, None if the game is not finished
+        """
+        self.advance_turn()
+        self.throw_dice()
+        option = self.random_option()
+        if option is not None:
+            kind, move_from = option
+            final_position = getattr(self, kind)(move_from)
+            if final_position is not None:
+                self.measure_basis(final_position = final_position)
+                self.measure(final_position = final_position)
+        if self.winner() is None and self.occupied() >= self.measure_threshold:
+            self.measure(final_position = None)
+        return self.winner()
+
+    def _reconcile(self, positions : List[int], final_position : int):
+        """Update the board after measuring positions, see Engine.measure()"""
+        measured = set(positions)
+        for pos in range(self.N):
+            if pos not in measured:
+                self.place(pos, None)
+        finished = self.N in positions or self.N + 1 in positions
+        if final_position != None and not finished:
+            self.final[final_position] = None
+
+        # If pawn appears in winning position, remove it from other positions
+        if final_position is not None and finished:
+            finished_pawn = self.pawn_id(self.current_turn, final_position % 2)
+            for pos in self.positions(finished_pawn):
+                if self.verbose:
+                    print(f"Removing {self.current_turn} pawn {final_position % 2} from position {pos} as it reached winning position")
+                self.place(pos, None)
+
+        # Remove duplicate pawns keeping only the furthest one
+        for pawn_id in range(len(self.home)):
+            pawn_positions = self.positions(pawn_id)
+            if len(pawn_positions) > 1:
+                color, pawn = self.describe(pawn_id)
+                start_pos = self.start_position[color]
+                furthest_pos = max(pawn_positions, key=lambda x: (x - start_pos) % self.N)
+                for pos in pawn_positions:
+                    if pos != furthest_pos:
+                        if self.verbose:
+                            print(f"Removing duplicate {color} pawn {pawn} at position {pos}, keeping position {furthest_pos}")
+                        self.place(pos, None)
+
+        # Check if a pawn was captured and put it back into its home position
+        for pawn_id in range(len(self.home)):
+            if not self.pawn_masks[pawn_id] and self.final[pawn_id] is None:
+                self.home[pawn_id] = pawn_id
@@ -0,0 +1,183 @@
+import struct
+from typing import List
+
+MAGIC = b"QLDR"
+VERSION = 1
+# magic, version, number of positions on the board, 2 reserved bytes
+HEADER = struct.Struct("<4sBBxx")
+# Every turn is TURN.size = 10 bytes:
+#   byte 0    die 1 (bits 0-2), die 2 (bits 3-5) and the kind of move (bits 6-7, index in KINDS)
+#   byte 1    move_from (bits 0-5) and the trigger of the measurement (bits 6-7, index in TRIGGERS)
+#   byte 2-9  measured outcome: bit i is set if position (qubit) i contained a pawn, 0 if nothing was measured
+TURN = struct.Struct("<BBQ")
+KINDS = (None, "move", "direct_move", "new_pawn")
+TRIGGERS = (None, "final", "threshold")
+
+
+def encode_turn(dice : List[int] = None, kind : str = None, move_from : int = None, trigger : str = None, positions : List[int] = None) -> bytes:
+    """Pack one turn in TURN.size bytes, see GameRecord"""
+    dice = dice or [0, 0]
+    outcome = 0
+    for position in positions or []:
+        outcome |= 1 << position
+    return TURN.pack(dice[0] | dice[1] << 3 | KINDS.index(kind) << 6, (move_from or 0) | TRIGGERS.index(trigger) << 6, outcome)
+
+def decode_turn(data, offset : int = 0) -> dict:
+    """
+    Unpack the turn at offset of data (bytes, bytearray or memoryview)
+
+    Returns
+    -------
+    turn : dict
+        "dice" : [die 1, die 2] ([0, 0] if the dice were not thrown)\\
+        "kind", "move_from" : the Engine method of the move and its argument, None if no move was made\\
+        "trigger" : "final", "threshold" or None if there was no measurement\\
+        "positions" : the measured positions that contained a pawn (only if trigger is not None)
+    """
+    dice_kind, move_trigger, outcome = TURN.unpack_from(data, offset)
+    kind = KINDS[dice_kind >> 6]
+    trigger = TRIGGERS[move_trigger >> 6]
+    positions = []
+    while outcome:
+        lowest = outcome & -outcome
+        positions.append(lowest.bit_length() - 1)
+        outcome ^= lowest
+    return {"dice": [dice_kind & 7, dice_kind >> 3 & 7], "kind": kind, "move_from": move_trigger & 63 if kind is not None else None,
+            "trigger": trigger, "positions": positions}
+
+
+class GameRecord():
+    """
+    Description
+    -----------
+    Compact binary record of a game: a header (HEADER) followed by TURN.size bytes for every turn with the dice, the chosen
+    move, what triggered a measurement and its outcome, see encode_turn(). Every other part of the game (the board, the
+    captures and the circuit) follows from these, so replay.Replay can rebuild the game without user interface or simulation.
+    An Engine with record = True keeps a GameRecord of the moves that are made, also when it is played by main.Main
+
+    Parameters
+    ----------
+    N : int
+        Number of positions on the board (at most 62, the outcome is stored in 64 bits)
+    data : bytes
+        Encoded turns, see GameRecord.from_bytes()
+
+    Example
+    -------
+    engine = Engine(rng = random.Random(1), record = True)\\
+    while engine.play_turn() is None:\\
+        pass\\
+    engine.record.save("game.qldr")\\
+    replay.Replay(GameRecord.load("game.qldr")).play()
+
+    >>> 'Blue' # the same winner as engine.winner()
+    """
+    def __init__(self, N : int = 32, data : bytes = b""):
+        if N + 2 > 64:
+            raise ValueError("A game record supports boards of at most 62 positions")
+        if len(data) % TURN.size != 0:
+            raise ValueError(f"The turns of a game record must be a multiple of {TURN.size} bytes")
+        self.N = N
+        self.turns = bytearray(data)
+        self.undone = bytearray() # turns removed by GameRecord.rewind(), which can be restored by rewinding forward
+        self.fork = None          # length in bytes of self.turns after the last rewind, while there are undone turns
+
+    def __len__(self):
+        """Number of turns"""
+        return len(self.turns) // TURN.size
+
+    def __getitem__(self, turn : int) -> dict:
+        if turn < 0:
+            turn += len(self)
+        if not 0 <= turn < len(self):
+            raise IndexError("turn out of range")
+        return decode_turn(self.turns, turn * TURN.size)
+
+    def __iter__(self):
+        return (decode_turn(self.turns, offset) for offset in range(0, len(self.turns), TURN.size))
+
+    # ---------
+    # Recording
+    # ---------
+    def new_turn(self):
+        """Start a new (empty) turn"""
+        self.turns += encode_turn()
+
+    def set_dice(self, dice : List[int]):
+        """Store the dice of the current turn"""
+        if len(self) == 0:
+            return
+        dice_kind, move_trigger, outcome = TURN.unpack_from(self.turns, len(self.turns) - TURN.size)
+        TURN.pack_into(self.turns, len(self.turns) - TURN.size, dice[0] | dice[1] << 3 | (dice_kind & 192), move_trigger, outcome)
+
+    def set_move(self, dice : List[int], kind : str, move_from : int):
+        """Store the move of the current turn and the dice it was made with"""
+        if len(self) == 0:
+            return
+        dice = dice or [0, 0]
+        self._diverge()
+        dice_kind, move_trigger, outcome = TURN.unpack_from(self.turns, len(self.turns) - TURN.size)
+        TURN.pack_into(self.turns, len(self.turns) - TURN.size, dice[0] | dice[1] << 3 | KINDS.index(kind) << 6, move_from | (move_trigger & 192), outcome)
+
+    def set_measurement(self, trigger : str, positions : List[int]):
+        """Store what triggered the measurement of the current turn and the measured positions that contain a pawn"""
+        if len(self) == 0:
+            return
+        dice_kind, move_trigger, outcome = TURN.unpack_from(self.turns, len(self.turns) - TURN.size)
+        if move_trigger >> 6 != 0:
+            raise ValueError("A turn can only contain one measurement")
+        self._diverge()
+        outcome = 0
+        for position in positions:
+            outcome |= 1 << position
+        TURN.pack_into(self.turns, len(self.turns) - TURN.size, dice_kind, move_trigger | TRIGGERS.index(trigger) << 6, outcome)
+
+    def rewind(self, length : int):
+        """
+        Return to the first length turns (e.g. for main.Main.undo()). The removed turns are kept, such that rewinding
+        forward again (main.Main.redo()) restores them, until a move is made. Like the redo history of the circuit
+        """
+        end = length * TURN.size
+        if self.fork is not None:
+            # The turns that were started since the last rewind contain no move, otherwise self.fork would be None
+            del self.turns[self.fork:]
+        if end < len(self.turns):
+            self.undone = self.turns[end:] + self.undone
+            del self.turns[end:]
+        elif end > len(self.turns):
+            missing = end - len(self.turns)
+            self.turns += self.undone[:missing]
+            del self.undone[:missing]
+        self.fork = len(self.turns) if len(self.undone) != 0 else None
+
+    def _diverge(self):
+        """A move or measurement is recorded, so the turns that were rewound can not be restored anymore"""
+        self.undone = bytearray()
+        self.fork = None
+
+    # -------------
+    # Serialization
+    # -------------
+    def to_bytes(self) -> bytes:
+        return HEADER.pack(MAGIC, VERSION, self.N) + bytes(self.turns)
+
+    @classmethod
+    def from_bytes(cls, data : bytes):
+        """Read a record written by GameRecord.to_bytes()"""
+        if len(data) < HEADER.size:
+            raise ValueError("Not a game record: too short")
+        magic, version, N = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a game record: wrong magic bytes")
+        if version != VERSION:
+            raise ValueError(f"Unsupported game record version {version}")
+        return cls(N, data[HEADER.size:])
+
+    def save(self, path : str):
+        with open(path, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path : str):
+        with open(path, "rb") as file:
+            return cls.from_bytes(file.read())
@@ -0,0 +1,234 @@
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+if __package__:
+    from .quantum_circuits import measure_many
+else:
+    from quantum_circuits import measure_many
+
+
+def _batch_key(kwargs : dict):
+    """
+    Requests that are measured with one sampler job by quantum_circuits.measure_many() get the same key, the other requests get None.
+    Only requests with the same simple (hashable) arguments are combined
+    """
+    if kwargs.get("engine", "aer") != "aer" or kwargs.get("exact", False) or kwargs.get("clusters", False):
+        return None
+    if not (kwargs.get("efficient", False) or kwargs.get("simulator", True) == False or kwargs.get("backend") is not None or kwargs.get("noise_model") is not None):
+        return None
+    try:
+        return tuple(sorted(kwargs.items()))
+    except TypeError:
+        return None
+
+def _measure_batch(batch):
+    """
+    Description
+    -----------
+    Measure a batch of circuits in a worker, see MeasurementPool. Requests with the same arguments that run a sampler are
+    combined into one sampler job (see quantum_circuits.measure_many()), the other requests are measured one by one.
+    An exception only fails the requests of that job
+
+    Parameters
+    ----------
+    batch : list[tuple]
+        (circuit, seed, keyword arguments of circuit.measure()) for every request
+
+    Returns
+    -------
+    results : list[tuple]
+        (True, output of circuit.measure(), circuit.last_measure_info) or (False, exception, None) for every request
+    """
+    results = [None] * len(batch)
+    groups = {}
+    for i, (qc, seed, kwargs) in enumerate(batch):
+        key = _batch_key(kwargs)
+        if key is not None:
+            groups.setdefault(key, []).append(i)
+            continue
+        try:
+            if seed is not None:
+                qc.rng = random.Random(seed)
+            results[i] = (True, qc.measure(**kwargs), qc.last_measure_info)
+        except Exception as error:
+            results[i] = (False, error, None)
+
+    for indices in groups.values():
+        kwargs = {name: value for name, value in batch[indices[0]][2].items() if name not in ("engine", "efficient", "exact", "clusters")}
+        circuits = [batch[i][0] for i in indices]
+        try:
+            outputs = measure_many(circuits, seeds = [batch[i][1] for i in indices] if batch[indices[0]][1] is not None else None, **kwargs)
+            for i, qc, output in zip(indices, circuits, outputs):
+                results[i] = (True, output, qc.last_measure_info)
+        except Exception as error:
+            for i in indices:
+                results[i] = (False, error, None)
+    return results
+
+class MeasurementPool():
+    """
+    Description
+    -----------
+    Pool of workers that measures circuits for many games at once (e.g. several headless engines in one process, see
+    Engine(pool=...)). Requests are put in one queue with MeasurementPool.submit(), which returns a Future. A dispatcher
+    thread takes the requests from the queue and sends them to the workers in batches of at most batch_size requests,
+    such that the overhead of sending a job to a process is shared by the requests that were waiting. Requests in a batch
+    that run a sampler with the same arguments are also combined into one sampler job (see quantum_circuits.measure_many()).
+    MeasurementPool.metrics() gives the queue depth and the latency of the requests
+
+    Only requests that run a sampler (the AerSimulator, a noise model or a quantum computer) are combined. A request with
+    engine = "sparse" (what Engine.sample() uses) takes less than a millisecond and is measured on its own, so the pool
+    only adds the overhead of the dispatcher and the workers and is slower than measuring directly on one core, see
+    benchmarks/measurement_pool.py
+
+    Parameters
+    ----------
+    workers : int
+        Number of workers, the number of cores by default
+    processes : boolean
+        If True, the workers are processes (the simulation is Python code, so threads can not use more than one core).
+        Use threads for circuits that can not be pickled or that wait for a quantum computer
+    batch_size : int
+        Maximum number of requests that is sent to a worker at once
+
+    Example
+    -------
+    with MeasurementPool(workers = 4) as pool:\\
+        futures = [pool.submit(engine.circuit.detach(), shots = 1, efficient = True) for engine in engines]\\
+        positions = [future.result() for future in futures]\\
+        pool.metrics()
+    """
+    def __init__(self, workers : int = None, processes : bool = True, batch_size : int = 16):
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        if processes:
+            self.executor = ProcessPoolExecutor(max_workers = self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers = self.workers)
+
+        self.queue = queue.Queue()
+        # At most two batches per worker are sent at once, the other requests wait in the queue and are batched
+        self.slots = threading.Semaphore(2 * self.workers)
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.latencies = []
+        self.max_latencies = 10000
+        self.start = time.perf_counter()
+        self.closed = False
+        self.dispatcher = threading.Thread(target = self._dispatch, daemon = True)
+        self.dispatcher.start()
+
+    def submit(self, qc, seed : int = None, **kwargs) -> Future:
+        """
+        Description
+        -----------
+        Request a measurement of qc (a quantum_circuits.circuit) with qc.measure(**kwargs). The circuit is measured in
+        another process, so pass a copy that is not changed anymore (see circuit.detach())
+
+        Parameters
+        ----------
+        seed : int
+            Seed of the measurement (replaces qc.rng), such that the outcome does not depend on the worker
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Result of qc.measure(**kwargs), with the size of the measured circuit as future.last_measure_info
+        """
+        if self.closed:
+            raise ValueError("The measurement pool is closed")
+        future = Future()
+        with self.lock:
+            self.submitted += 1
+        self.queue.put((future, time.perf_counter(), (qc, seed, kwargs)))
+        return future
+
+    def metrics(self) -> dict:
+        """Number of requests (submitted, waiting in the queue, completed and failed), batches and the latency in seconds of the completed requests"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            metrics = {
+                "submitted": self.submitted,
+                "queue_depth": self.queue.qsize(),
+                "completed": self.completed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "mean_batch_size": (self.completed + self.failed) / self.batches if self.batches else 0,
+                "throughput": self.completed / (time.perf_counter() - self.start),
+            }
+        if latencies:
+            metrics["latency_mean"] = statistics.fmean(latencies)
+            metrics["latency_p50"] = latencies[len(latencies) // 2]
+            metrics["latency_p95"] = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+        return metrics
+
+    def close(self):
+        """Measure the requests that are still waiting and stop the workers"""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.dispatcher.join()
+        self.executor.shutdown(wait = True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def _dispatch(self):
+        """Send the requests in the queue to the workers in batches (runs on the dispatcher thread)"""
+        stop = False
+        while not stop:
+            request = self.queue.get()
+            if request is None:
+                break
+            batch = [request]
+            while len(batch) < self.batch_size:
+                try:
+                    request = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            batch = [request for request in batch if request[0].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self.slots.acquire()
+            job = self.executor.submit(_measure_batch, [arguments for future, submitted, arguments in batch])
+            job.add_done_callback(lambda job, batch = batch: self._finish(job, batch))
+
+    def _finish(self, job, batch):
+        """Set the results of a finished batch"""
+        self.slots.release()
+        end = time.perf_counter()
+        try:
+            results = job.result()
+        except Exception as error: # e.g. a worker process died
+            results = [(False, error, None)] * len(batch)
+        with self.lock:
+            self.batches += 1
+            for (future, submitted, arguments), (succeeded, result, info) in zip(batch, results):
+                if succeeded:
+                    self.completed += 1
+                    self.latencies.append(end - submitted)
+                else:
+                    self.failed += 1
+            del self.latencies[:-self.max_latencies]
+        for (future, submitted, arguments), (succeeded, result, info) in zip(batch, results):
+            if succeeded:
+                future.last_measure_info = info
+                future.set_result(result)
+            else:
+                future.set_exception(result)
@@ -1,15 +1,176 @@
 import numpy as np
 from typing import List
-import matplotlib.pyplot as plt
 
-from qiskit import QuantumCircuit, transpile
-from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
-from qiskit_ibm_runtime.fake_provider import FakeSherbrooke
-from qiskit.providers.fake_provider import GenericBackendV2 as GenericBackend
-from qiskit_ibm_runtime import SamplerV2 as Sampler 
-from qiskit_aer import AerSimulator
+from qiskit import QuantumCircuit
 
+import copy
 import random
+from functools import lru_cache
+
+if __package__:
+    from .sparse_simulator import SparseState, ClusteredState
+    from .distribution import OutcomeDistribution
+else:
+    from sparse_simulator import SparseState, ClusteredState
+    from distribution import OutcomeDistribution
+
+# qiskit_ibm_runtime, qiskit_aer, the transpiler and matplotlib take seconds to import and the fake backends are slow
+# to build, so they are only imported (and built) when a circuit is actually measured or drawn. This keeps the
+# start screen fast. The helpers below build every backend once
+
+@lru_cache(maxsize=None)
+def _fake_backend():
+    """FakeSherbrooke (127 qubits), the default backend to transpile to"""
+    from qiskit_ibm_runtime.fake_provider import FakeSherbrooke
+    return FakeSherbrooke()
+
+@lru_cache(maxsize=None)
+def _generic_backend(nr_of_qubits : int):
+    """GenericBackend with nr_of_qubits qubits. Building one is slow, so it is only done once for every size"""
+    from qiskit.providers.fake_provider import GenericBackendV2 as GenericBackend
+    return GenericBackend(nr_of_qubits)
+
+def _preset_pass_manager(backend, optimization_level : int):
+    from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+    # The layout and routing passes are randomized, a fixed seed gives the same circuit (and so the same shots of a seeded simulator) every time
+    return generate_preset_pass_manager(backend=backend, optimization_level=optimization_level, seed_transpiler=0)
+
+@lru_cache(maxsize=None)
+def _pass_manager(nr_of_qubits : int, optimization_level : int):
+    """Preset pass manager for _generic_backend(nr_of_qubits), only built once for every (size, optimization level)"""
+    return _preset_pass_manager(_generic_backend(nr_of_qubits), optimization_level)
+
+def _aer_sampler(seed : int = None, **options):
+    """SamplerV2 that runs on an AerSimulator with the given options. The shots are reproducible if a seed is given"""
+    from qiskit_ibm_runtime import SamplerV2 as Sampler
+    from qiskit_aer import AerSimulator
+    sampler = Sampler(mode = AerSimulator(**options))
+    if seed is not None:
+        sampler.options.simulator.seed_simulator = seed
+    return sampler
+
+@lru_cache(maxsize=None)
+def _aer_basis_gates():
+    """Names of the instructions the AerSimulator can run without transpiling"""
+    from qiskit_aer import AerSimulator
+    return list(AerSimulator().configuration().basis_gates)
+
+def _measure_backend(backend, simulator : bool, service):
+    """Backend of circuit._internal_measure(): the least busy quantum computer of the service, or FakeSherbrooke if none is given"""
+    if service is None and simulator == False:
+        raise ValueError("If simulator is False, the service must be given")
+    if simulator == False:
+        return service.least_busy(operational=True, simulator=False)
+    if backend is None:
+        return _fake_backend()
+    return backend
+
+def _measure_sampler(backend, simulator : bool, noise_model = None, seed : int = None):
+    """Sampler of circuit._internal_measure(): the runtime sampler of the quantum computer, otherwise an AerSimulator"""
+    if simulator == False:
+        from qiskit_ibm_runtime import SamplerV2 as Sampler
+        return Sampler(mode = backend)
+    return _aer_sampler(seed = seed, noise_model = noise_model)
+
+def _translate_instruction(operation, basis_gates : List[str]) -> QuantumCircuit:
+    """Translate one operation to the basis gates, as a circuit on operation.num_qubits qubits"""
+    from qiskit import transpile
+    template = QuantumCircuit(operation.num_qubits)
+    template.append(operation, range(operation.num_qubits))
+    return transpile(template, basis_gates=basis_gates, optimization_level=0)
+
+class _InstructionKey():
+    """An operation that is hashed and compared by its key, such that _compiled_instruction() can cache it"""
+    def __init__(self, operation, basis_gates : List[str]):
+        self.operation = operation
+        self.basis_gates = basis_gates
+        self.key = (tuple(basis_gates), operation.name, operation.num_qubits, getattr(operation, "ctrl_state", None), tuple(operation.params))
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+@lru_cache(maxsize=256)
+def _compiled_instruction(instruction : _InstructionKey) -> QuantumCircuit:
+    """_translate_instruction() of every distinct instruction, the moves only emit a few different ones"""
+    return _translate_instruction(instruction.operation, instruction.basis_gates)
+
+def _compile_instructions(qc : QuantumCircuit, basis_gates : List[str]):
+    """
+    Description
+    -----------
+    Translate the circuit to the basis gates. The moves only append a few different gates (every move and capture
+    emits the same template), so every distinct instruction is translated once and the result is reused afterwards.
+    No layout or routing is done, the qubits of the returned circuit are those of qc
+
+    Parameters
+    ----------
+    qc : QuantumCircuit
+        Circuit to translate
+    basis_gates : list[str]
+        Names of the gates the returned circuit may contain
+    """
+    qc_out = QuantumCircuit(qc.num_qubits, qc.num_clbits, global_phase=qc.global_phase)
+    for instruction in qc.data:
+        operation = instruction.operation
+        qubits = [qc.find_bit(qubit).index for qubit in instruction.qubits]
+        if operation.name in basis_gates or operation.name == "barrier" or len(instruction.clbits) > 0:
+            qc_out.append(operation, qubits, [qc.find_bit(clbit).index for clbit in instruction.clbits])
+            continue
+
+        try:
+            template = _compiled_instruction(_InstructionKey(operation, basis_gates))
+        except TypeError: # unhashable parameters, e.g. the matrix of a UnitaryGate
+            template = _translate_instruction(operation, basis_gates)
+
+        qc_out.global_phase += template.global_phase
+        for template_instruction in template.data:
+            qc_out.append(template_instruction.operation, [qubits[template.find_bit(qubit).index] for qubit in template_instruction.qubits])
+    return qc_out
+
+def _rotate_to_bases(target, measure_bases):
+    """
+    Rotate the qubits of target (a qiskit.QuantumCircuit or a ClusteredState) such that measuring in the Z basis measures
+    qubit i in basis measure_bases[i]: "Z" (nothing happens), "X", "Q" (theta = pi/4) or "T" (theta = 3pi/4).
+    measure_bases is a list or a dictionary {qubit : basis}, None (or any other value) leaves the qubit unchanged
+    """
+    items = measure_bases.items() if isinstance(measure_bases, dict) else enumerate(measure_bases)
+    for i, measure_basis in items:
+        if measure_basis == "X":
+            target.h(i)
+        elif measure_basis == "Q":
+            target.ry(np.pi/4, i)
+        elif measure_basis == "T":
+            target.ry(3*np.pi/4, i)
+
+def render_circuit(qc : QuantumCircuit, text : bool = False, show_idle_wires : bool = False):
+    """
+    Description
+    -----------
+    Draw a QuantumCircuit without any window, such that it can be done in another process (see main.CircuitFigure).
+    Drawing a long circuit with matplotlib takes seconds, the text drawing is much cheaper
+
+    Returns
+    -------
+    drawing : bytes or str
+        The matplotlib drawing as png image, or the text drawing if text == True
+    """
+    if text:
+        return str(qc.draw('text', idle_wires=show_idle_wires, fold=-1))
+    import io
+    import matplotlib.pyplot as plt
+    fig = qc.draw('mpl', style="iqp-dark", idle_wires=show_idle_wires)
+    image = io.BytesIO()
+    fig.savefig(image, format="png", facecolor=fig.get_facecolor())
+    plt.close(fig)
+    return image.getvalue()
+
+def render_process_init():
+    """Initializer of a process that runs render_circuit(): matplotlib must not open windows there"""
+    import matplotlib
+    matplotlib.use("Agg")
 
 
 class circuit():
@@ -21,6 +182,27 @@ class circuit():
     ----------
     N : int
         Size of the quantum circuit
+    live_state : boolean
+        If True, every gate is also directly applied to a ClusteredState (self.state). The simulation cost is then spread over
+        the moves and measuring with engine="sparse" only has to sample this state
+    max_history : int
+        Maximum number of saved states to which circuit.undo() can return. Older operations are removed from the log,
+        if nothing is saved only the last max_history operations are kept
+    rng : random.Random
+        Source of randomness of the measurements: the outcome drawn from a histogram, the shots of the sparse and exact
+        simulation and the seed of the AerSimulator. With a seeded random.Random every measurement can be reproduced
+
+    Attributes
+    ----------
+    last_measure_info : dict
+        Number of qubits, number of gates, depth and gate counts of the last circuit that was run by circuit.measure()
+    log : list[tuple]
+        Every operation applied to the circuit as (method name, *arguments), e.g. ("move", (0,), (1, 2)). The arguments are
+        tuples, except a dictionary of measurement bases of circuit.measure_basis(), which is copied. A measurement
+        is logged as ("reset",), because the circuit is empty afterwards. Together with the checkpoints (copies of the circuit
+        every checkpoint_interval operations) this is used to rebuild the circuit in circuit.undo() and circuit.redo()
+    history : list[int]
+        Length of the log at every circuit.save()
     
     Returns
     -------
@@ -35,10 +217,32 @@ class circuit():
 
     >>> [3,5,29]
     """
-    def __init__(self, N=32):
+    def __init__(self, N=32, live_state = False, max_history = 100, rng = random):
         self.N = N + 2
+        self.live_state = live_state
+        self.rng = rng
         self.qcircuit = QuantumCircuit(self.N)
+        self.state = ClusteredState(self.N) if live_state else None
+        self.max_history = max_history
+        self.checkpoint_interval = 16
+        self.log = []
         self.history = []
+        self.redo_history = []
+        self._checkpoints = [(0, None, None)]
+        self._replaying = False
+        self.last_measure_info = None
+
+    def __getstate__(self):
+        # The random module can not be pickled (e.g. to measure in a MeasurementPool), the default rng is restored afterwards
+        state = self.__dict__.copy()
+        if state["rng"] is random:
+            state["rng"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = random
 
     def new_pawn(self, move_to : List[int]):
         """
@@ -68,7 +272,9 @@ class circuit():
         >>> q_1: ─────
         """
         if len(move_to) != 0:
-            self.qcircuit.x(move_to)
+            for qc in self._circuits():
+                qc.x(move_to)
+            self._record("new_pawn", move_to)
 
     def switch(self, move_from : List[int], move_to : List[int]):
         """
@@ -86,7 +292,9 @@ class circuit():
         if len(move_from) != 1 or len(move_to) != 1:
             raise ValueError("move must be in the form [int]; a list containing one integer")
         
-        self.qcircuit.swap(move_from[0], move_to)
+        for qc in self._circuits():
+            qc.swap(move_from[0], move_to)
+        self._record("switch", move_from, move_to)
 
     def move(self, move_from : List[int], move_to : List[int]):
         """
@@ -126,10 +334,12 @@ class circuit():
             raise ValueError("move_from must be in the form [int]; a list containing one integer")
         if len(move_to) != 2:
             raise ValueError("move_to must be in the form [int, int]; a list containing two integers")
-        self.qcircuit.cx(move_from[0], move_to[0])
-        self.qcircuit.ch(move_from[0], move_to[0])
-        self.qcircuit.swap(move_from[0], move_to[1])
-        self.qcircuit.cx(move_to[0], move_to[1])
+        for qc in self._circuits():
+            qc.cx(move_from[0], move_to[0])
+            qc.ch(move_from[0], move_to[0])
+            qc.swap(move_from[0], move_to[1])
+            qc.cx(move_to[0], move_to[1])
+        self._record("move", move_from, move_to)
 
     def capture(self, capturer : List[int], captive : List[int], captive_entanglement : List[int]):
         """
@@ -186,13 +396,15 @@ class circuit():
         if captive[0] in captive_entanglement:
             raise ValueError("the captive_entanglement also contains the captive, this should not be the case please look at the documentation")
         
-        for captive_entangled in captive_entanglement:
-            self.qcircuit.x(captive_entangled)
-        
-        self.qcircuit.mcx(captive_entanglement+capturer, captive[0])
-    
-        for captive_entangled in captive_entanglement:
-            self.qcircuit.x(captive_entangled)
+        for qc in self._circuits():
+            for captive_entangled in captive_entanglement:
+                qc.x(captive_entangled)
+
+            qc.mcx(captive_entanglement+capturer, captive[0])
+
+            for captive_entangled in captive_entanglement:
+                qc.x(captive_entangled)
+        self._record("capture", capturer, captive, captive_entanglement)
 
     def merge_move(self, move_from : List[int], move_to : List[int], merge_in : List[int]):
         """
@@ -225,40 +437,154 @@ class circuit():
 
         move_to.remove(merge_in[0])    
     
-        self.qcircuit.swap(move_from[0], move_to[0])
-        self.qcircuit.unitary(U, [merge_in[0], move_to[0]])
+        for qc in self._circuits():
+            qc.swap(move_from[0], move_to[0])
+            qc.unitary(U, [merge_in[0], move_to[0]])
+        self._record("merge_move", move_from, move_to + merge_in, merge_in)
 
     def measure_basis(self, measure_bases : List[int]):
-        for i, measure_basis in enumerate(measure_bases):
-            if measure_basis != None:
-                if measure_basis == "Z":
-                    # Nothing happens
-                    pass
-                if measure_basis == "X":
-                    self.qcircuit.h(i)
-                if measure_basis == "Q":
-                    theta = np.pi/4  # Rotation angle for Q basis
-                    self.qcircuit.ry(theta, i)
-                if measure_basis == "T":
-                    theta = 3*np.pi/4  # Rotation angle for T basis
-                    self.qcircuit.ry(theta, i)
+        for qc in self._circuits():
+            _rotate_to_bases(qc, measure_bases)
+        self._record("measure_basis", measure_bases)
+
+    def expectation(self, positions : List[int], measure_bases : List[str] = None, engine : str = "sparse") -> float:
+        """
+        Description
+        -----------
+        Exact correlator of the given positions, without sampling and without changing the circuit: the expectation value
+        of the outcome that is +1 if an even number of the positions contains a pawn and -1 otherwise (the product of
+        the Z observables of the qubits). For two positions this is +1 if both or neither contain a pawn, as in the Bell test
+
+        Parameters
+        ----------
+        positions : list[int]
+            Positions (qubits) of which the correlator is calculated
+        measure_bases : list[str] or dict
+            Measurement basis of every position ("Z", "X", "Q", "T" or None) as in circuit.measure_basis(), or a dictionary
+            {position : basis}. The rotations
+            are only applied for this calculation. Rotations of other positions do not change the result, so they are skipped
+        engine : str
+            See circuit.correlators()
+
+        Example
+        -------
+        qc = circuit(N=3)\\
+        qc.new_pawn([0])\\
+        qc.move([0], [1, 2])\\
+        qc.expectation([1, 2])
+
+        >>> -1.0 # the pawn is at exactly one of the two positions
+        """
+        return self.correlators(positions, {None: measure_bases}, engine = engine)[None]
+
+    def correlators(self, positions : List[int], settings : dict, engine : str = "sparse") -> dict:
+        """
+        Description
+        -----------
+        Exact correlator (see circuit.expectation()) of the positions for several assignments of measurement bases.
+        The state is prepared once and only the rotations are applied for every setting
+
+        Parameters
+        ----------
+        positions : list[int]
+            Positions (qubits) of which the correlator is calculated
+        settings : dict
+            Name of every setting and its measurement bases, see circuit.expectation()
+        engine : str
+            - "sparse": use the (live) ClusteredState, see sparse_simulator.py
+            - "aer": calculate the statevector of the clusters of the positions with qiskit.quantum_info.Statevector
+
+        Returns
+        -------
+        correlators : dict
+            Name of every setting and its correlator
+        """
+        positions = list(positions)
+        def basis(measure_bases, position):
+            if isinstance(measure_bases, dict):
+                return measure_bases.get(position)
+            return measure_bases[position] if measure_bases is not None and position < len(measure_bases) else None
+        rotations = {name: [basis(measure_bases, position) for position in positions] for name, measure_bases in settings.items()}
+
+        if engine == "sparse":
+            state = self._simulated_state()
+            correlators = {}
+            for name, bases in rotations.items():
+                rotated = state.copy()
+                for position, basis in zip(positions, bases):
+                    _rotate_to_bases(rotated, {position: basis})
+                correlators[name] = OutcomeDistribution.from_state(rotated).expectation(positions)
+            return correlators
+        elif engine == "aer":
+            from qiskit.quantum_info import Statevector
+            qubits = sorted({qubit for cluster in self._clusters() if set(cluster) & set(positions) for qubit in cluster} | set(positions))
+            qubit_map = {qubit: index for index, qubit in enumerate(qubits)}
+            state = Statevector(self._sub_circuit(qubits))
+            correlators = {}
+            for name, bases in rotations.items():
+                rotation = QuantumCircuit(len(qubits))
+                _rotate_to_bases(rotation, {qubit_map[position]: basis for position, basis in zip(positions, bases)})
+                probabilities = state.evolve(rotation).probabilities_dict()
+                distribution = OutcomeDistribution.from_bitstrings(probabilities, qubits)
+                correlators[name] = distribution.expectation(positions)
+            return correlators
+        else:
+            raise ValueError("engine must be 'aer' or 'sparse'")
+
+    def chsh(self, positions : List[int], settings : dict, engine : str = "sparse") -> float:
+        """
+        Description
+        -----------
+        Exact S = E1 + E2 + E3 - E4 of the CHSH inequality, where E1, ..., E4 are the correlators of the four settings
+        (in the order of the dictionary), see circuit.correlators(). |S| is at most 2 for a local theory and 2*sqrt(2) for a quantum state
+
+        Example
+        -------
+        bases = lambda a, b: {21: a, 24: a, 22: b, 23: b}\\
+        qc.chsh([23, 24], {"ZT": bases("Z", "T"), "XQ": bases("X", "Q"), "XT": bases("X", "T"), "ZQ": bases("Z", "Q")})
+
+        >>> 2.8284271247461903
+        """
+        if len(settings) != 4:
+            raise ValueError("The CHSH inequality needs four settings")
+        correlators = list(self.correlators(positions, settings, engine = engine).values())
+        return correlators[0] + correlators[1] + correlators[2] - correlators[3]
     
-    def measure(self, backend = FakeSherbrooke(), optimization_level=2, simulator = True, out_internal_measure=False, shots=1024, efficient = False, service = None):
+    def measure(self, backend = None, optimization_level=2, simulator = True, out_internal_measure=False, shots=1024, efficient = False, service = None, engine = "aer", exact = False, clusters = False, noise_model = None):
         """
         Description
         -----------
-        Measures the circuit and returns the remaining positions in an array
+        Measures the circuit and returns the remaining positions in an array. The measurement collapses the state, so on every
+        path (simulated or not) the circuit is reset afterwards: it is empty and the reset is logged. Measure a copy from
+        circuit.detach() to keep the circuit
 
         Parameters
         ----------
         circuit : qiskit.QuantumCircuit
             Quantum circuit that describes the positions of the board in qubits and gates
         backend: Fake or real backend
-            Backend to which the circuit is transpiled (and run)
+            Backend to which the circuit is transpiled (and run). If None and simulator == True, the logical circuit is simulated
+            directly without layout or routing (see circuit._internal_logical_simulation()), unless a noise_model is given,
+            in that case the circuit is transpiled to FakeSherbrooke()
         optimization_level: int
             See https://docs.quantum.ibm.com/api/qiskit/transpiler_preset#generate_preset_pass_manager 
         out_internal_measure : boolean
             Outputs out_with_freq from the self._internal_measure if True. Mostly unused
+        engine : str
+            Simulator used when simulator == True:
+            - "aer": transpile the circuit and run it on the AerSimulator (reference)
+            - "sparse": apply the gates directly to a ClusteredState, see sparse_simulator.py
+        shots : int
+            Number of shots that are simulated. If shots == 1 (and out_internal_measure == False), no histogram is made
+            and the positions of the single shot are returned directly
+        exact : boolean
+            If True, no shots are simulated. The outcome is drawn from the exact probability of every outcome, see circuit.distribution()
+        clusters : boolean
+            Only used if efficient == True and engine == "aer". Split the circuit into clusters of qubits that interact with each other
+            and simulate every cluster separately, see circuit._clusters(). The sparse engine always does this
+        noise_model : qiskit_aer.noise.NoiseModel
+            Noise model of the AerSimulator. Only used if simulator == True and engine == "aer", the circuit is then always
+            transpiled to the backend. The sparse engine raises a ValueError if a noise_model or backend is given
         
         Returns
         -------
@@ -266,12 +592,14 @@ class circuit():
             Array containing the collapsed bits describing the remaining pawns
         if out_internal_measure == True: out_with_freq : dictionary
             Dictionary containing the measurement outcome in binary with its frequency, see ibm for exact documentation
+            If exact == True or clusters == True this is an OutcomeDistribution instead
         
         Notes
         ------
         It seems not necessary to have a backend and a simulator arguments. However, the fakesimulators are describing to which architecture
         the circuit is compiled, while the simulator value makes sure that for the simulation itself a 'perfect' simulation is used,
-        namely the AerSimulator(), because the normal fakesimulators can not simulate this many bits
+        namely the AerSimulator(), because the normal fakesimulators can not simulate this many bits.
+        For a perfect simulation the layout and routing only add gates, so the transpilation is only done if a backend or noise_model is given
 
         The simulator returns several hunderds of measurement. Therefore all possible outcomes have a certain frequency connected to them
         This is used as a weight in selecting the final measurement from all the measurements using pseudo-random methods
@@ -279,21 +607,58 @@ class circuit():
         """
         if service is None and simulator == False:
             raise ValueError("If simulator is False, the service must be given")
+        if engine not in ("aer", "sparse"):
+            raise ValueError("engine must be 'aer' or 'sparse'")
+        if engine == "sparse" and simulator == True and (backend is not None or noise_model is not None):
+            raise ValueError("The sparse engine simulates the logical circuit without noise, use engine='aer' with a backend or noise_model")
+        if exact == True and simulator == False:
+            raise ValueError("An exact distribution can only be calculated if simulator is True")
 
-        if efficient == False or simulator == False:
-            filtered_data = self._internal_measure(backend = backend, optimization_level=optimization_level, simulator = simulator, shots = shots, service = service)
-            if simulator == False:
-                nr_of_qubits_used = self.N
+        if exact == True:
+            distribution = self.distribution(engine = engine)
+            self._reset()
+            chosen_positions = distribution.sample(self.rng)
+            if out_internal_measure == False:
+                return chosen_positions
             else:
-                nr_of_qubits_used = 127
+                return chosen_positions, distribution, distribution.nr_of_qubits_used
+
+        # A weighted draw from the histogram is the same as taking one shot, so in that case
+        # the internal methods directly return the positions of that shot
+        single_shot = shots == 1 and out_internal_measure == False
+
+        if simulator == True and engine == "sparse":
+            output = self._internal_sparse_simulation(shots = shots, single_shot = single_shot)
+        elif simulator == False or backend is not None or noise_model is not None:
+            output = self._internal_measure(backend = backend, optimization_level=optimization_level, simulator = simulator, shots = shots, service = service, single_shot = single_shot, noise_model = noise_model)
+        elif efficient == False:
+            output = self._internal_logical_simulation(shots = shots, single_shot = single_shot)
+        elif clusters == True:
+            output = self._internal_cluster_simulation(optimization_level=optimization_level, shots = shots, single_shot = single_shot)
         else:
-            filtered_data, nr_of_qubits_used = self._internal_efficient_simulation(backend = backend, optimization_level=optimization_level, shots = shots)
+            output = self._internal_efficient_simulation(backend = backend, optimization_level=optimization_level, shots = shots, single_shot = single_shot)
+
+        return self._choose(output, single_shot, out_internal_measure, self.rng)
+
+    @staticmethod
+    def _choose(output, single_shot : bool, out_internal_measure : bool, rng = random):
+        """Draw the measured positions from the output of one of the internal measurement methods, see circuit.measure()"""
+        if single_shot == True:
+            return output
+        filtered_data, nr_of_qubits_used = output
+
+        if isinstance(filtered_data, OutcomeDistribution):
+            chosen_positions = filtered_data.sample(rng)
+            if out_internal_measure == False:
+                return chosen_positions
+            else:
+                return chosen_positions, filtered_data, nr_of_qubits_used
         
         weights = list(filtered_data.keys())
         positions = list(filtered_data.values())
 
         if weights:
-            chosen_positions = random.choices(positions, weights=weights, k=1)[0]
+            chosen_positions = rng.choices(positions, weights=weights, k=1)[0]
         else:
             raise ValueError(r"Not a single measurement outcome has a probability P>0.5\% of occuring; there is probably a measurement error")
         if out_internal_measure == False:
@@ -301,60 +666,214 @@ class circuit():
         else:
             return chosen_positions, filtered_data, nr_of_qubits_used
     
-    def draw(self, mpl_open = True, term_draw = True, show_idle_wires = True):
+    def distribution(self, engine = "sparse"):
+        """
+        Description
+        -----------
+        Calculate the exact probability of every measurement outcome of the current circuit, without sampling and without
+        changing the circuit.
+
+        Parameters
+        ----------
+        engine : str
+            - "sparse": simulate the circuit with a ClusteredState
+            - "aer": calculate the statevector of every cluster of active qubits with qiskit.quantum_info.Statevector
+
+        Returns
+        -------
+        distribution : OutcomeDistribution
+            Probability of every outcome, see distribution.py
+        """
+        if engine == "sparse":
+            return OutcomeDistribution.from_state(self._simulated_state())
+        elif engine == "aer":
+            from qiskit.quantum_info import Statevector
+            distributions = []
+            for cluster in self._clusters():
+                probabilities = Statevector(self._sub_circuit(cluster)).probabilities_dict()
+                distributions.append(OutcomeDistribution.from_bitstrings(probabilities, cluster))
+            return OutcomeDistribution.product(distributions)
+        else:
+            raise ValueError("engine must be 'aer' or 'sparse'")
+
+    def draw(self, mpl_open = True, term_draw = True, show_idle_wires = True, moves = None):
         """
         Description
         ------------
         Test function that draws the circuit and opens it in matplotlib if mpl_open == True
         Also prints the circuit in the terminal if term_draw == True
+        If moves is given, only the last moves are drawn, see circuit.recent()
         """
-        fig = self.qcircuit.draw('mpl', style="iqp-dark", idle_wires=show_idle_wires)
+        qc = self.qcircuit if moves is None else self.recent(moves)
+        fig = qc.draw('mpl', style="iqp-dark", idle_wires=show_idle_wires)
         if mpl_open == True:
+            import matplotlib.pyplot as plt
             plt.show()
         if term_draw ==True:
-            print(self.qcircuit)
+            print(qc)
         return fig
+
+    def recent(self, moves : int = 10, end : int = None) -> QuantumCircuit:
+        """
+        Description
+        -----------
+        Circuit of only the last moves since the last measurement, such that drawing it costs the same however long the
+        circuit has become. The moves are replayed from the log on an empty circuit. All earlier moves are collapsed into
+        one box on the qubits of the returned circuit
+
+        Parameters
+        ----------
+        moves : int
+            Number of moves (operations in the log) to keep
+        end : int
+            Only use the first `end` operations of the log, e.g. to draw the circuit as it was when the log had this length.
+            Default is the whole log
+
+        Example
+        -------
+        qc = circuit()\\
+        qc.new_pawn([0])\\
+        qc.move([0], [1, 2])\\
+        qc.move([1], [3, 4])\\
+        qc.recent(moves = 1).draw()
+        """
+        end = len(self.log) if end is None else min(end, len(self.log))
+        start = end
+        while start > 0 and end - start < moves and self.log[start - 1][0] != "reset":
+            start -= 1
+        # Older moves are still in the log, or were removed from it by circuit._compact_log()
+        earlier = self.log[start - 1][0] != "reset" if start > 0 else self._checkpoints[0][1] is not None
+
+        window = circuit(self.N - 2)
+        for operation in self.log[start:end]:
+            window._apply(operation)
+        qc = window.qcircuit
+        qubits = sorted({qc.find_bit(qubit).index for instruction in qc.data for qubit in instruction.qubits})
+        if earlier and len(qubits) > 0:
+            from qiskit.circuit import Gate
+            collapsed = QuantumCircuit(self.N)
+            collapsed.append(Gate("earlier", len(qubits), [], label="Earlier moves"), qubits)
+            qc = collapsed.compose(qc)
+        return qc
     
     def save(self):
-        self.history.append(self.qcircuit.copy())
-    
+        """Save the current state of the circuit, such that circuit.undo() can return to it. Only the length of the log is stored"""
+        self.history.append(len(self.log))
+        if len(self.history) > self.max_history:
+            self.history.pop(0)
+
     def undo(self):
+        """
+        Description
+        -----------
+        Return to the second to last saved state (the last saved state is the current state, see Main.undo()), which
+        is then the last saved state. The circuit is rebuilt from the last checkpoint before that state, so this costs at
+        most checkpoint_interval operations. The undone operations are kept, such that circuit.redo() can apply them again
+        """
+        if len(self.history) > 1:
+            current = self.history.pop()
+            previous = self.history[-1]
+            self.redo_history.append(self.log[previous:current])
+            self._rebuild(previous)
+        else:
+            self._reset()
+
+    def detach(self):
+        """
+        Description
+        -----------
+        Shallow copy of the circuit with its own empty log and history. circuit.measure() resets the circuit it measures, so
+        measuring the copy (e.g. on another thread) leaves this circuit unchanged. The gates and the live state are shared,
+        so this circuit must not be changed while the copy is measured
+        """
+        detached = copy.copy(self)
+        detached.log, detached.history, detached.redo_history = [], [], []
+        detached._checkpoints = [(0, None, None)]
+        return detached
+
+    def revert(self):
+        """Return to the last saved state and forget the operations since then (they can not be redone)"""
         if len(self.history) != 0:
-            self.qcircuit = self.history.pop()
-            self.qcircuit = self.history.pop()
+            self._rebuild(self.history[-1])
         else:
-            self.reset()
+            self._reset()
+        self.redo_history = []
+
+    def redo(self):
+        """
+        Apply the operations that were undone by the last circuit.undo() again and save the state that is reached,
+        such that the next circuit.undo() returns to the state before. A new operation clears the redo history
+        """
+        if len(self.redo_history) != 0:
+            for operation in self.redo_history.pop():
+                self._apply(operation)
+                self._log(operation)
+            self.history.append(len(self.log))
         
-    def _internal_measure(self, backend = FakeSherbrooke(), optimization_level=2, simulator = True, shots = 1024, service = None):
+    def _internal_measure(self, backend = None, optimization_level=2, simulator = True, shots = 1024, service = None, single_shot = False, noise_model = None):
         """See circuit.measure() for documentation"""
-        if service is None and simulator == False:
-            raise ValueError("If simulator is False, the service must be given")
-        if simulator == False:
-            backend = service.least_busy(operational=True, simulator=False)
+        backend = _measure_backend(backend, simulator, service)
+        pub, finish = self._prepare_measure(backend, optimization_level, simulator, single_shot)
+        result = _measure_sampler(backend, simulator, noise_model, seed = self._seed()).run(pubs=[pub], shots = shots).result()[0]
+        return finish(result, shots)
+
+    def _prepare_measure(self, backend, optimization_level, simulator, single_shot):
+        """Transpile the circuit for the backend of circuit._internal_measure() and reset it. Returns the pub and the function that turns its result into the output"""
+        qc = self.qcircuit.copy() # the circuit is shared with detached copies (see circuit.detach()), so it is not changed
+        self._reset()
+        qc.measure_all()
 
-        self.qcircuit.measure_all()
+        pm = _preset_pass_manager(backend, optimization_level)
+        isa_circuit = pm.run(qc)
+        self._record_measure_info(isa_circuit)
+        nr_of_qubits_used = self.N if simulator == False else isa_circuit.num_qubits
 
-        pm = generate_preset_pass_manager(backend=backend, optimization_level=optimization_level)
-        isa_circuit = pm.run(self.qcircuit)
-        pub = (isa_circuit)
+        def finish(result, shots):
+            if single_shot == True:
+                return [index for index, char in enumerate(result.data.meas.get_bitstrings()[0][::-1]) if char == '1']
+            out_with_freq = result.data.meas.get_counts()
 
-        if simulator == False:
-            sampler = Sampler(mode = backend)
-        else:
-            sampler = Sampler(mode = AerSimulator())
+            filter = 1 # with a shot of 1000, so if P < 0.1% the measurement is removed
+            filtered_data = {value/shots : [index for index, char in enumerate(key[::-1]) if char == '1'] for key, value in out_with_freq.items() if value >= filter}
 
-        job = sampler.run(pubs=[pub], shots = 1024)
-        result = job.result()[0]
-        out_with_freq = result.data.meas.get_counts()
+            return filtered_data, nr_of_qubits_used
+        return isa_circuit, finish
+    
+    def _internal_logical_simulation(self, shots = 1024, single_shot = False):
+        """
+        Simulate the logical circuit on the AerSimulator: only the active qubits are kept and no layout or routing is done,
+        because SWAP gates for the connectivity of a device change nothing about the outcome of a perfect simulation.
+        Only the gates that the AerSimulator does not know (e.g. ch) are translated
+        """
+        active_qubits = self._active_qubits()
+        if len(active_qubits) == 0:
+            self._reset()
+            return [] if single_shot == True else ({1.0: []}, 0)
+        qc = _compile_instructions(self._sub_circuit(active_qubits), _aer_basis_gates())
+        self._reset()
+        qc.measure_all()
+        self._record_measure_info(qc)
 
+        sampler = _aer_sampler(seed = self._seed())
+        result = sampler.run(pubs=[qc], shots = shots).result()[0]
+        if single_shot == True:
+            return [active_qubits[index] for index, char in enumerate(result.data.meas.get_bitstrings()[0][::-1]) if char == '1']
+        out_with_freq = result.data.meas.get_counts()
 
         filter = 1 # with a shot of 1000, so if P < 0.1% the measurement is removed
-        filtered_data = {value/shots : [index for index, char in enumerate(key[::-1]) if char == '1'] for key, value in out_with_freq.items() if value >= filter}
+        filtered_data = {value/shots : [active_qubits[index] for index, char in enumerate(key[::-1]) if char == '1'] for key, value in out_with_freq.items() if value >= filter}
+        return filtered_data, len(active_qubits)
 
-        return filtered_data
-    
-    def _internal_efficient_simulation(self, backend = FakeSherbrooke(), optimization_level =2, shots = 1024):
+    def _internal_efficient_simulation(self, backend = None, optimization_level =2, shots = 1024, single_shot = False):
         """Simulate the circuit in a more efficient way by removing idle wires"""
+        pub, finish = self._prepare_efficient_simulation(optimization_level, single_shot)
+        if pub is None:
+            return finish(None, shots)
+        result = _aer_sampler(seed = self._seed()).run(pubs=[pub], shots = shots).result()[0]
+        return finish(result, shots)
+
+    def _prepare_efficient_simulation(self, optimization_level, single_shot):
+        """Transpile the circuit for circuit._internal_efficient_simulation() and reset it. Returns the pub and the function that turns its result into the output"""
         def count_gates(qc: QuantumCircuit):
             gate_count = {qubit: 0 for qubit in qc.qubits}
             for gate in qc.data:
@@ -382,34 +901,266 @@ class circuit():
 
             return qc_out, [active_qubits[i]._index for i in range(len(active_qubits))]
         
-        backend = GenericBackend(self.N)
-        transpiled_qc = transpile(self.qcircuit, backend)
-        qc, active_qubits = remove_idle_wires(transpiled_qc)
-        old_qubits = [transpiled_qc.layout.final_index_layout().index(i) for i in active_qubits]
+        # Translating the logical circuit is cached per instruction, so only the pass manager below transpiles
+        backend = _generic_backend(self.N)
+        qc, old_qubits = remove_idle_wires(self.qcircuit)
+        if len(old_qubits) == 0: # nothing to simulate (the sampler does not accept a circuit without qubits)
+            self._reset()
+            return None, lambda result, shots: [] if single_shot == True else ({1.0: []}, 0)
+        qc = _compile_instructions(qc, [name for name in backend.operation_names if name not in ("measure", "delay", "reset")])
+        active_qubits = old_qubits
 
         qc.measure_all()
 
-        pm = generate_preset_pass_manager(backend=backend, optimization_level=optimization_level)
+        pm = _pass_manager(self.N, optimization_level)
         isa_circuit = pm.run(qc)
-        pub = (isa_circuit)
+        self._record_measure_info(isa_circuit)
+        self._reset()
 
-        sampler = Sampler(mode = AerSimulator())
+        def finish(result, shots):
+            if single_shot == True:
+                return [old_qubits[index] for index, char in enumerate(result.data.meas.get_bitstrings()[0][::-1]) if char == '1']
+            out_with_freq = result.data.meas.get_counts()
 
-        job = sampler.run(pubs=[pub], shots = shots)
-        result = job.result()[0]
-        out_with_freq = result.data.meas.get_counts()
+            filter = 2 # with a shot of 1000, so if P < 0.2% the measurement is removed
+            filtered_data = {value/shots : [old_qubits[index] for index, char in enumerate(key[::-1]) if char == '1'] for key, value in out_with_freq.items() if value >= filter}
+            return filtered_data, len(active_qubits)
+        return isa_circuit, finish
+    
+    def _internal_sparse_simulation(self, shots = 1024, single_shot = False):
+        """Simulate the circuit with a ClusteredState instead of the AerSimulator: no transpilation and the cost scales with the number of branches"""
+        state = self._simulated_state()
+        if single_shot == True:
+            self._reset()
+            return SparseState.positions(state.sample_one(self.rng))
+        out_with_freq = state.sample(shots, self.rng)
+
+        filtered_data = {value/shots : SparseState.positions(basis) for basis, value in out_with_freq.items()}
+        self._reset()
+        return filtered_data, max((len(cluster) for cluster in state.clusters()), default=0)
+
+    def _internal_cluster_simulation(self, optimization_level = 2, shots = 1024, single_shot = False):
+        """
+        Simulate every cluster of interacting qubits as a separate circuit. All clusters are submitted
+        in one job, so the AerSimulator can run them in parallel. The cost scales with the largest cluster
+        instead of with the number of pawns on the board
+        """
+        clusters = self._clusters()
+        sub_circuits = [self._sub_circuit(cluster) for cluster in clusters]
+        self._reset()
+        if len(clusters) == 0:
+            return [] if single_shot == True else (OutcomeDistribution({(): 1.0}, 0), 0)
+
+        pm = _pass_manager(max(2, max(len(cluster) for cluster in clusters)), optimization_level)
+
+        pubs = []
+        for qc in sub_circuits:
+            qc.measure_all()
+            pubs.append(pm.run(qc))
+
+        sampler = _aer_sampler(seed = self._seed(), max_parallel_experiments = 0)
+        results = sampler.run(pubs=pubs, shots = shots).result()
+
+        if single_shot == True:
+            return sorted(cluster[index] for cluster, result in zip(clusters, results)
+                          for index, char in enumerate(result.data.meas.get_bitstrings()[0][::-1]) if char == '1')
 
         filter = 2 # with a shot of 1000, so if P < 0.2% the measurement is removed
-        filtered_data = {value/shots : [old_qubits[index] for index, char in enumerate(key[::-1]) if char == '1'] for key, value in out_with_freq.items() if value >= filter}
-        self.qcircuit = QuantumCircuit(self.N)
-        return filtered_data, len(active_qubits)
-    
+        distributions = []
+        for cluster, result in zip(clusters, results):
+            counts = {key: value/shots for key, value in result.data.meas.get_counts().items() if value >= filter}
+            distributions.append(OutcomeDistribution.from_bitstrings(counts, cluster))
+        return OutcomeDistribution.product(distributions), max(len(cluster) for cluster in clusters)
+
+    def _seed(self) -> int:
+        """Seed of the AerSimulator for the next measurement, drawn from self.rng"""
+        return self.rng.getrandbits(32)
+
+    def _record_measure_info(self, qc : QuantumCircuit):
+        """Store the size of the circuit that is run in self.last_measure_info"""
+        gates = {name: count for name, count in qc.count_ops().items() if name not in ("measure", "barrier")}
+        self.last_measure_info = {"nr_of_qubits": qc.num_qubits, "nr_of_gates": sum(gates.values()), "depth": qc.depth(), "gates": gates}
+
+    def _active_qubits(self):
+        """Indices of the qubits on which at least one gate acts"""
+        return sorted({self.qcircuit.find_bit(qubit).index for instruction in self.qcircuit.data
+                       for qubit in instruction.qubits if instruction.operation.name not in ("barrier", "measure")})
+
+    def _clusters(self):
+        """
+        Description
+        -----------
+        Split the active qubits in clusters: the connected components of the graph in which two qubits are connected
+        if a gate acts on both of them. Different clusters are never entangled, so they can be simulated separately
+
+        Returns
+        -------
+        clusters : list[list[int]]
+            Sorted list of the qubit indices of every cluster
+        """
+        parent = {qubit: qubit for qubit in self._active_qubits()}
+        def find(qubit):
+            while parent[qubit] != qubit:
+                parent[qubit] = parent[parent[qubit]]
+                qubit = parent[qubit]
+            return qubit
+
+        for instruction in self.qcircuit.data:
+            if instruction.operation.name in ("barrier", "measure"):
+                continue
+            qubits = [self.qcircuit.find_bit(qubit).index for qubit in instruction.qubits]
+            for qubit in qubits[1:]:
+                parent[find(qubit)] = find(qubits[0])
+
+        clusters = {}
+        for qubit in parent:
+            clusters.setdefault(find(qubit), []).append(qubit)
+        return list(clusters.values())
+
+    def _sub_circuit(self, qubits):
+        """Return a copy of the circuit containing only the given qubits (which may not interact with other qubits)"""
+        qubit_map = {old: new for new, old in enumerate(qubits)}
+
+        qc = QuantumCircuit(len(qubits))
+        for instruction in self.qcircuit.data:
+            if instruction.operation.name in ("barrier", "measure"):
+                continue
+            instruction_qubits = [self.qcircuit.find_bit(qubit).index for qubit in instruction.qubits]
+            if instruction_qubits[0] in qubit_map:
+                qc.append(instruction.operation, [qubit_map[qubit] for qubit in instruction_qubits])
+        return qc
+
+    def _simulated_state(self):
+        """The live state if it is kept, otherwise simulate the circuit"""
+        if self.live_state:
+            return self.state
+        return ClusteredState.from_circuit(self.qcircuit)
+
+    def _circuits(self):
+        """The objects to which the gates of a move are applied: the qiskit circuit and, if live_state == True, the live state"""
+        if self.live_state:
+            return [self.qcircuit, self.state]
+        return [self.qcircuit]
+
     def _reset(self):
         self.qcircuit = QuantumCircuit(self.N)
+        if self.live_state:
+            self.state = ClusteredState(self.N)
+        self._record("reset")
+
+    def _record(self, *operation):
+        """Log an operation of one of the public methods. Operations that are replayed from the log are not logged again"""
+        if self._replaying:
+            return
+        self.redo_history = []
+        # A dictionary (the measurement bases of circuit.measure_basis()) is copied, a tuple of it would only keep the keys
+        self._log((operation[0],) + tuple(dict(argument) if isinstance(argument, dict) else tuple(argument) for argument in operation[1:]))
+
+    def _log(self, operation):
+        """Append an (already applied) operation to the log and add a checkpoint after a reset or every checkpoint_interval operations"""
+        self.log.append(operation)
+        if operation[0] == "reset":
+            self._checkpoints.append((len(self.log), None, None))
+        elif len(self.log) - self._checkpoints[-1][0] >= self.checkpoint_interval:
+            self._checkpoints.append((len(self.log), self.qcircuit.copy(), self.state.copy() if self.live_state else None))
+        else:
+            return
+        self._compact_log()
+
+    def _apply(self, operation):
+        """Apply a logged operation to the circuit (and live state) without logging it"""
+        self._replaying = True
+        try:
+            if operation[0] == "reset":
+                self._reset()
+            else:
+                getattr(self, operation[0])(*[dict(argument) if isinstance(argument, dict) else list(argument) for argument in operation[1:]])
+        finally:
+            self._replaying = False
+
+    def _rebuild(self, length : int):
+        """Rebuild the circuit (and live state) after the first length operations of the log, starting at the last checkpoint before it"""
+        self.log = self.log[:length]
+        self._checkpoints = [checkpoint for checkpoint in self._checkpoints if checkpoint[0] <= length]
+        index, qcircuit, state = self._checkpoints[-1]
+        self.qcircuit = qcircuit.copy() if qcircuit is not None else QuantumCircuit(self.N)
+        if self.live_state:
+            self.state = state.copy() if state is not None else ClusteredState(self.N)
+        for operation in self.log[index:]:
+            self._apply(operation)
+
+    def _compact_log(self):
+        """
+        Remove the operations before the last checkpoint before the oldest saved state, or before the last max_history
+        operations if nothing is saved (e.g. the headless Engine), such that the memory stays bounded. Called for every new checkpoint
+        """
+        oldest = self.history[0] if len(self.history) != 0 else len(self.log) - self.max_history
+        start = max((index for index, qcircuit, state in self._checkpoints if index <= oldest), default = 0)
+        if start == 0:
+            return
+        self.log = self.log[start:]
+        self._checkpoints = [(index - start, qcircuit, state) for index, qcircuit, state in self._checkpoints if index >= start]
+        self.history = [length - start for length in self.history]
     
     def _return_circuit(self):
         return self.qcircuit
 
+def _combined_seed(rngs : List[random.Random]) -> int:
+    """One seed for a job of several circuits: a draw from the rng of every circuit, hashed together (a str seed is hashed with sha512)"""
+    return random.Random(" ".join(str(rng.getrandbits(32)) for rng in rngs)).getrandbits(32)
+
+def measure_many(circuits : List[circuit], backend = None, optimization_level = 2, simulator = True, shots = 1024, service = None,
+                 out_internal_measure = False, noise_model = None, seeds : List[int] = None):
+    """
+    Description
+    -----------
+    Measure several circuits with a single sampler.run() call, instead of one job per circuit. This shares the overhead of
+    a job (and of the queue of a quantum computer) between the circuits, e.g. the circuits of many games.
+    Every circuit is transpiled as in circuit.measure(efficient = True) and the results are split back out to each circuit
+
+    Parameters
+    ----------
+    circuits : list[circuit]
+        Circuits to measure. Like circuit.measure(), this resets the circuits
+    seeds : list[int]
+        Seed of the measurement of every circuit, optional. By default the rng of every circuit is used (see circuit()).
+        The circuits are run in one job, so the seed of the AerSimulator is derived from all of them, see _combined_seed()
+    Other parameters : 
+        See circuit.measure(). The circuits are run on the efficient simulation, unless simulator == False or a backend
+        or noise model is given; then they are run on that backend as in circuit._internal_measure()
+
+    Returns
+    -------
+    outputs : list
+        For every circuit, what circuit.measure() returns with the same arguments
+
+    Example
+    -------
+    circuits = [engine.circuit.detach() for engine in engines]\\
+    measure_many(circuits, shots = 1)
+
+    >>> [[3, 5], [], [1, 12, 29]]
+    """
+    if len(circuits) == 0:
+        return []
+    single_shot = shots == 1 and out_internal_measure == False
+    rngs = [random.Random(seed) for seed in seeds] if seeds is not None else [qc.rng for qc in circuits]
+    if simulator == False or backend is not None or noise_model is not None:
+        backend = _measure_backend(backend, simulator, service)
+        prepared = [qc._prepare_measure(backend, optimization_level, simulator, single_shot) for qc in circuits]
+        sampler = _measure_sampler(backend, simulator, noise_model, seed = _combined_seed(rngs))
+    else:
+        prepared = [qc._prepare_efficient_simulation(optimization_level, single_shot) for qc in circuits]
+        sampler = _aer_sampler(seed = _combined_seed(rngs))
+
+    pubs = [pub for pub, finish in prepared if pub is not None]
+    results = iter(sampler.run(pubs=pubs, shots = shots).result() if len(pubs) > 0 else [])
+    outputs = []
+    for i, (pub, finish) in enumerate(prepared):
+        result = next(results) if pub is not None else None
+        outputs.append(circuit._choose(finish(result, shots), single_shot, out_internal_measure, rngs[i]))
+    return outputs
+
 if __name__ == "__main__":
     qc = circuit(N=100)
     qc.new_pawn([0,1])
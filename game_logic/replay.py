@@ -0,0 +1,84 @@
+if __package__:
+    from .engine import Engine
+    from .game_record import GameRecord
+else:
+    from engine import Engine
+    from game_record import GameRecord
+
+
+class Replay():
+    """
+    Description
+    -----------
+    Rebuild the board and the circuit of a recorded game without user interface. The measurements are not simulated,
+    the recorded outcomes are used instead (see Engine.collapse()). Every snapshot_interval turns the board and the circuit
+    are saved, so Replay.seek() only has to replay the turns since the last snapshot before the requested turn
+
+    Parameters
+    ----------
+    record : GameRecord
+        The game to replay
+    snapshot_interval : int
+        Number of turns between two snapshots
+
+    Example
+    -------
+    replay = Replay(record)\\
+    replay.seek(100)\\
+    replay.engine.board # the board after 100 turns
+    """
+    def __init__(self, record : GameRecord, snapshot_interval : int = 64):
+        self.record = record
+        self.snapshot_interval = snapshot_interval
+        # The circuit is only rebuilt, so the live state of the simulation is not kept
+        self.engine = Engine(record.N, simulation = False)
+        self.turn = 0
+        self.snapshots = {}
+        self._snapshot()
+
+    def step(self) -> str:
+        """Replay the next turn and return the winner (None if the game is not finished)"""
+        if self.turn >= len(self.record):
+            raise ValueError("The end of the record is reached")
+        turn = self.record[self.turn]
+        engine = self.engine
+        engine.advance_turn()
+        engine.die_throws = turn["dice"]
+        final_position = None
+        if turn["kind"] is not None:
+            final_position = getattr(engine, turn["kind"])(turn["move_from"])
+        if turn["trigger"] is not None:
+            engine.collapse(turn["positions"], final_position = final_position if turn["trigger"] == "final" else None)
+        self.turn += 1
+        if self.turn % self.snapshot_interval == 0:
+            self._snapshot()
+        return engine.winner()
+
+    def seek(self, turn : int):
+        """Go to the state after the first turn turns, starting from the nearest snapshot before it (or the current state)"""
+        if not 0 <= turn <= len(self.record):
+            raise ValueError(f"turn must be between 0 and {len(self.record)}")
+        snapshot = max(index for index in self.snapshots if index <= turn)
+        if not snapshot <= self.turn <= turn:
+            self._restore(snapshot)
+        while self.turn < turn:
+            self.step()
+
+    def play(self) -> str:
+        """Replay the rest of the game and return the winner"""
+        while self.turn < len(self.record):
+            self.step()
+        return self.engine.winner()
+
+    def _snapshot(self):
+        engine = self.engine
+        self.snapshots[self.turn] = (engine.snapshot(), engine.total_turns, engine.die_throws, engine.circuit.qcircuit.copy())
+
+    def _restore(self, turn : int):
+        board, total_turns, die_throws, qcircuit = self.snapshots[turn]
+        self.engine.restore(board)
+        self.engine.total_turns = total_turns
+        self.engine.die_throws = die_throws
+        self.engine.circuit._reset()
+        self.engine.circuit.qcircuit = qcircuit.copy()
+        self.turn = turn
@@ -0,0 +1,361 @@
+import math
+import random
+from typing import Dict, List
+
+# Amplitudes smaller than this are considered to be zero and are removed from the state
+ATOL = 1e-12
+
+
+def _as_list(qubits):
+    """Qiskit style broadcasting: accept a single integer or a list of integers"""
+    if isinstance(qubits, (list, tuple, range)):
+        return list(qubits)
+    return [qubits]
+
+
+class SparseState():
+    """
+    Description
+    -----------
+    Quantum state that only stores the basis states with a non-zero amplitude. The state is a dictionary
+    that maps a basis state to its amplitude. A basis state is a bitmask in which bit i describes qubit i,
+    so the bitmask directly describes the positions that contain a pawn.
+
+    The gates used by the game (x, swap, cx, ch, mcx) keep the board in a superposition of only a few basis states,
+    so applying a gate costs O(#branches) instead of O(2^N). The gate methods have the same names and
+    arguments as the methods of qiskit.QuantumCircuit.
+
+    Parameters
+    ----------
+    N : int
+        Number of qubits
+    amplitudes : dict[int, complex]
+        Optional initial state. Default is |00...0>
+
+    Example
+    -------
+    state = SparseState(N=3)\\
+    state.x(0)\\
+    state.cx(0, 1)\\
+    state.ch(0, 2)\\
+    state.probabilities()
+
+    >>> {3: 0.5, 7: 0.5}
+    """
+    def __init__(self, N : int, amplitudes : Dict[int, complex] = None):
+        self.N = N
+        self.amplitudes = {0: 1 + 0j} if amplitudes is None else dict(amplitudes)
+
+    def __len__(self):
+        """Number of branches (basis states with a non-zero amplitude)"""
+        return len(self.amplitudes)
+
+    def copy(self):
+        return SparseState(self.N, self.amplitudes)
+
+    @classmethod
+    def from_circuit(cls, qc):
+        """
+        Description
+        -----------
+        Simulate a qiskit.QuantumCircuit by applying all its instructions to |00...0>.
+        Barriers and final measurements are ignored.
+        """
+        state = cls(qc.num_qubits)
+        for instruction in qc.data:
+            qubits = [qc.find_bit(qubit).index for qubit in instruction.qubits]
+            state.apply_operation(instruction.operation, qubits)
+        return state
+
+    # -----
+    # Gates
+    # -----
+    def x(self, qubits):
+        for qubit in _as_list(qubits):
+            bit = 1 << qubit
+            self._permute(lambda basis: basis ^ bit)
+
+    def swap(self, qubit1, qubit2):
+        for q1, q2 in zip(_as_list(qubit1), _as_list(qubit2)):
+            both = (1 << q1) | (1 << q2)
+            self._permute(lambda basis: basis ^ both if (basis >> q1 & 1) != (basis >> q2 & 1) else basis)
+
+    def cx(self, control_qubit, target_qubit):
+        self.mcx(_as_list(control_qubit), target_qubit)
+
+    def mcx(self, control_qubits : List[int], target_qubit, ctrl_state : int = None):
+        control_mask, control_value = self._control_condition(_as_list(control_qubits), ctrl_state)
+        for target in _as_list(target_qubit):
+            bit = 1 << target
+            self._permute(lambda basis: basis ^ bit if basis & control_mask == control_value else basis)
+
+    def h(self, qubits):
+        s = 2**-0.5
+        for qubit in _as_list(qubits):
+            self._apply_matrix([[s, s], [s, -s]], [qubit])
+
+    def ch(self, control_qubit, target_qubit):
+        s = 2**-0.5
+        control_mask, control_value = self._control_condition(_as_list(control_qubit))
+        self._apply_matrix([[s, s], [s, -s]], _as_list(target_qubit), control_mask, control_value)
+
+    def ry(self, theta : float, qubits):
+        c, s = math.cos(theta/2), math.sin(theta/2)
+        for qubit in _as_list(qubits):
+            self._apply_matrix([[c, -s], [s, c]], [qubit])
+
+    def unitary(self, matrix, qubits):
+        """Apply a 2^k x 2^k matrix to k qubits, using the qiskit (little endian) ordering of the qubits"""
+        self._apply_matrix(matrix, _as_list(qubits))
+
+    def apply_operation(self, operation, qubits : List[int]):
+        """
+        Description
+        -----------
+        Apply a qiskit operation (the `operation` of a CircuitInstruction) to the given qubit indices.
+        Permutation gates are applied directly, every other gate is applied using its matrix.
+        """
+        name = operation.name
+        if name in ("barrier", "measure", "id", "delay"):
+            return
+        if name == "x":
+            self.x(qubits[0])
+        elif name == "swap":
+            self.swap(qubits[0], qubits[1])
+        elif hasattr(operation, "base_gate") and hasattr(operation, "num_ctrl_qubits"):
+            n = operation.num_ctrl_qubits
+            controls, targets = qubits[:n], qubits[n:]
+            if operation.base_gate.name == "x":
+                self.mcx(controls, targets[0], ctrl_state=operation.ctrl_state)
+            else:
+                control_mask, control_value = self._control_condition(controls, operation.ctrl_state)
+                self._apply_matrix(operation.base_gate.to_matrix(), targets, control_mask, control_value)
+        else:
+            self._apply_matrix(operation.to_matrix(), qubits)
+
+    # -----------
+    # Measurement
+    # -----------
+    def probabilities(self) -> Dict[int, float]:
+        """Probability of every basis state with a non-zero amplitude"""
+        return {basis: abs(amplitude)**2 for basis, amplitude in self.amplitudes.items()}
+
+    def sample(self, shots : int = 1, rng = random) -> Dict[int, int]:
+        """Sample the state `shots` times and return the counts of every basis state"""
+        probabilities = self.probabilities()
+        counts = {}
+        for basis in rng.choices(list(probabilities.keys()), weights=list(probabilities.values()), k=shots):
+            counts[basis] = counts.get(basis, 0) + 1
+        return counts
+
+    def sample_one(self, rng = random) -> int:
+        """Draw a single basis state without building the counts"""
+        threshold = rng.random()
+        cumulative = 0
+        for basis, amplitude in self.amplitudes.items():
+            cumulative += abs(amplitude)**2
+            if cumulative > threshold:
+                return basis
+        return basis
+
+    @staticmethod
+    def positions(basis : int) -> List[int]:
+        """Convert a basis state to the list of qubits that are |1>"""
+        return [index for index in range(basis.bit_length()) if basis >> index & 1]
+
+    # ---------
+    # Internals
+    # ---------
+    def _permute(self, mapping):
+        self.amplitudes = {mapping(basis): amplitude for basis, amplitude in self.amplitudes.items()}
+
+    @staticmethod
+    def _control_condition(control_qubits : List[int], ctrl_state : int = None):
+        """Return (mask, value) such that the controls are satisfied if basis & mask == value"""
+        if ctrl_state is None:
+            ctrl_state = 2**len(control_qubits) - 1
+        control_mask = 0
+        control_value = 0
+        for i, qubit in enumerate(control_qubits):
+            control_mask |= 1 << qubit
+            if ctrl_state >> i & 1:
+                control_value |= 1 << qubit
+        return control_mask, control_value
+
+    def _apply_matrix(self, matrix, qubits : List[int], control_mask : int = 0, control_value : int = 0):
+        """Apply a (possibly controlled) 2^k x 2^k matrix to k qubits"""
+        if hasattr(matrix, "tolist"):
+            matrix = matrix.tolist()
+        bits = [1 << qubit for qubit in qubits]
+        all_bits = sum(bits)
+        new_amplitudes = {}
+        for basis, amplitude in self.amplitudes.items():
+            if basis & control_mask != control_value:
+                new_amplitudes[basis] = new_amplitudes.get(basis, 0) + amplitude
+                continue
+            rest = basis & ~all_bits
+            column = sum(1 << i for i, bit in enumerate(bits) if basis & bit)
+            for row in range(len(matrix)):
+                element = matrix[row][column]
+                if element != 0:
+                    target = rest | sum(bit for i, bit in enumerate(bits) if row >> i & 1)
+                    new_amplitudes[target] = new_amplitudes.get(target, 0) + element * amplitude
+        self.amplitudes = {basis: amplitude for basis, amplitude in new_amplitudes.items() if abs(amplitude) > ATOL}
+
+
+class ClusteredState():
+    """
+    Description
+    -----------
+    Quantum state stored as a product of independent SparseStates, one for every cluster of qubits that interacted
+    with each other. Pawns that never interact stay in different clusters, so the number of stored branches is the sum
+    of the branches of every cluster instead of the product.
+
+    A multi-qubit gate merges the clusters of its qubits. A swap gate does not entangle qubits,
+    so it moves the qubits between clusters instead of merging them. Qubits on which no gate acted are |0>
+    and are not part of any cluster.
+
+    The gate methods have the same names and arguments as the methods of SparseState and qiskit.QuantumCircuit.
+
+    Example
+    -------
+    state = ClusteredState(N=4)\\
+    state.x([0, 2])\\
+    state.ch(0, 1)\\
+    state.ch(2, 3)\\
+    state.clusters()
+
+    >>> [[0, 1], [2, 3]]
+    """
+    def __init__(self, N : int):
+        self.N = N
+        self.owner = {} # qubit -> SparseState of the cluster containing that qubit
+
+    def __len__(self):
+        """Number of branches of the full state"""
+        branches = 1
+        for state in self.states():
+            branches *= len(state)
+        return branches
+
+    def copy(self):
+        new = ClusteredState(self.N)
+        for qubits, state in zip(self.clusters(), self.states()):
+            state = state.copy()
+            for qubit in qubits:
+                new.owner[qubit] = state
+        return new
+
+    @classmethod
+    def from_circuit(cls, qc):
+        """Simulate a qiskit.QuantumCircuit cluster by cluster, see SparseState.from_circuit()"""
+        state = cls(qc.num_qubits)
+        for instruction in qc.data:
+            qubits = [qc.find_bit(qubit).index for qubit in instruction.qubits]
+            state.apply_operation(instruction.operation, qubits)
+        return state
+
+    def states(self) -> List[SparseState]:
+        """The SparseState of every cluster"""
+        return list({id(state): state for state in self.owner.values()}.values())
+
+    def clusters(self) -> List[List[int]]:
+        """The qubits of every cluster, in the same order as self.states()"""
+        clusters = {}
+        for qubit, state in sorted(self.owner.items()):
+            clusters.setdefault(id(state), []).append(qubit)
+        return list(clusters.values())
+
+    # -----
+    # Gates
+    # -----
+    def x(self, qubits):
+        for qubit in _as_list(qubits):
+            self._merge([qubit]).x(qubit)
+
+    def swap(self, qubit1, qubit2):
+        for q1, q2 in zip(_as_list(qubit1), _as_list(qubit2)):
+            state1, state2 = self.owner.get(q1), self.owner.get(q2)
+            if state1 is not None and state1 is state2:
+                state1.swap(q1, q2)
+                continue
+            # Different clusters: the other qubit is always |0> inside a cluster, so swapping
+            # inside each cluster moves the qubit from one cluster to the other without merging
+            for state in (state1, state2):
+                if state is not None:
+                    state.swap(q1, q2)
+            self.owner.pop(q1, None)
+            self.owner.pop(q2, None)
+            if state1 is not None:
+                self.owner[q2] = state1
+            if state2 is not None:
+                self.owner[q1] = state2
+
+    def cx(self, control_qubit, target_qubit):
+        self.mcx(_as_list(control_qubit), target_qubit)
+
+    def mcx(self, control_qubits : List[int], target_qubit, ctrl_state : int = None):
+        self._merge(_as_list(control_qubits) + _as_list(target_qubit)).mcx(control_qubits, target_qubit, ctrl_state)
+
+    def h(self, qubits):
+        for qubit in _as_list(qubits):
+            self._merge([qubit]).h(qubit)
+
+    def ch(self, control_qubit, target_qubit):
+        self._merge(_as_list(control_qubit) + _as_list(target_qubit)).ch(control_qubit, target_qubit)
+
+    def ry(self, theta : float, qubits):
+        for qubit in _as_list(qubits):
+            self._merge([qubit]).ry(theta, qubit)
+
+    def unitary(self, matrix, qubits):
+        self._merge(_as_list(qubits)).unitary(matrix, qubits)
+
+    def apply_operation(self, operation, qubits : List[int]):
+        """Apply a qiskit operation, see SparseState.apply_operation()"""
+        if operation.name in ("barrier", "measure", "id", "delay"):
+            return
+        if operation.name == "swap":
+            self.swap(qubits[0], qubits[1])
+        else:
+            self._merge(qubits).apply_operation(operation, qubits)
+
+    # -----------
+    # Measurement
+    # -----------
+    def sample(self, shots : int = 1, rng = random) -> Dict[int, int]:
+        """Sample every cluster independently `shots` times and return the counts of the combined basis states"""
+        counts = {}
+        for _ in range(shots):
+            basis = self.sample_one(rng)
+            counts[basis] = counts.get(basis, 0) + 1
+        return counts
+
+    def sample_one(self, rng = random) -> int:
+        """Draw one basis state per cluster and combine them"""
+        basis = 0
+        for state in self.states():
+            basis |= state.sample_one(rng)
+        return basis
+
+    # ---------
+    # Internals
+    # ---------
+    def _merge(self, qubits : List[int]) -> SparseState:
+        """Return the SparseState that contains all the given qubits, merging their clusters if necessary"""
+        states = list({id(self.owner[qubit]): self.owner[qubit] for qubit in qubits if qubit in self.owner}.values())
+        if len(states) == 1 and all(qubit in self.owner for qubit in qubits):
+            return states[0]
+
+        # Qubits are disjoint between clusters, so the tensor product is an OR of the bitmasks
+        merged = SparseState(self.N)
+        for state in states:
+            merged.amplitudes = {basis1 | basis2: amplitude1 * amplitude2
+                                 for basis1, amplitude1 in merged.amplitudes.items()
+                                 for basis2, amplitude2 in state.amplitudes.items()}
+        for qubit, state in list(self.owner.items()):
+            if any(state is merged_state for merged_state in states):
+                self.owner[qubit] = merged
+        for qubit in qubits:
+            self.owner[qubit] = merged
+        return merged
@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+import pytest
+
+from archive import ArchiveWriter, GameArchive, HEADER, INDEX_DTYPE
+from engine import Engine
+from game_record import GameRecord, TURN
+from replay import Replay
+
+
+def play(seed : int) -> Engine:
+    engine = Engine(rng = random.Random(seed), record = True)
+    while engine.play_turn() is None:
+        pass
+    return engine
+
+@pytest.fixture(scope = "module")
+def engines():
+    return [play(seed) for seed in range(4)]
+
+@pytest.fixture
+def path(tmp_path, engines):
+    path = str(tmp_path / "games.qlda")
+    with ArchiveWriter(path) as writer:
+        for engine in engines[:2]:
+            writer.append(engine.record)
+    # Appending to an existing archive continues after the games that are in it
+    with ArchiveWriter(path) as writer:
+        for number, engine in enumerate(engines[2:], start = 2):
+            assert writer.append(engine.record) == number
+    return path
+
+def test_offsets_and_turn_lookup(path, engines):
+    with GameArchive(path) as archive:
+        assert len(archive) == len(engines)
+        offsets = np.cumsum([0] + [len(engine.record) for engine in engines])
+        assert list(archive.index["offset"]) == list(offsets[:-1])
+        assert list(archive.index["turns"]) == [len(engine.record) for engine in engines]
+        for game, engine in enumerate(engines):
+            for turn in [0, len(engine.record) // 2, len(engine.record) - 1]:
+                assert archive.turn(game, turn) == engine.record[turn]
+            assert archive.game(game).tobytes() == bytes(engine.record.turns)
+        with pytest.raises(IndexError):
+            archive.turn(0, len(engines[0].record))
+
+def test_fields_match_the_records(path, engines):
+    with GameArchive(path) as archive:
+        turns = archive.game(3)
+        record = list(engines[3].record)
+        assert archive.dice(turns).tolist() == [turn["dice"] for turn in record]
+        assert archive.triggers(turns).tolist() == [[None, "final", "threshold"].index(turn["trigger"]) for turn in record]
+        assert np.count_nonzero(archive.outcomes(turns)) == sum(len(turn["positions"]) > 0 for turn in record)
+
+def test_archived_game_replays_to_the_winner(path, engines):
+    with GameArchive(path) as archive:
+        record = archive.record(1)
+    assert isinstance(record, GameRecord)
+    assert Replay(record).play() == engines[1].winner()
+
+def test_interrupted_write_is_skipped(path, engines):
+    # Turns without index entry, as after a crash between writing the turns and the index
+    with open(path, "ab") as file:
+        file.write(bytes(TURN.size * 3))
+    with ArchiveWriter(path) as writer:
+        writer.append(engines[0].record)
+    with GameArchive(path) as archive:
+        assert len(archive) == len(engines) + 1
+        assert archive.game(len(engines)).tobytes() == bytes(engines[0].record.turns)
+
+def test_invalid_archives_are_rejected(tmp_path, path):
+    with pytest.raises(ValueError):
+        ArchiveWriter(path, N = 40)
+    other = tmp_path / "other.qlda"
+    other.write_bytes(b"QLDR" + bytes(HEADER.size - 4))
+    (tmp_path / "other.qlda.idx").write_bytes(bytes(INDEX_DTYPE.itemsize))
+    with pytest.raises(ValueError):
+        GameArchive(str(other))
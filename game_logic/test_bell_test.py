@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import bell_test
+
+root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_exact_S_violates_the_classical_bound():
+    assert bell_test.exact_S() == pytest.approx(2 * np.sqrt(2))
+    assert bell_test.exact_S(engine = "aer") == pytest.approx(2 * np.sqrt(2))
+
+def test_run_is_reproducible_and_converges(tmp_path):
+    output = tmp_path / "S.txt"
+    calls = []
+    Ss = bell_test.run(iterations = 2000, seed = 5, output = str(output), callback = lambda i, S, outcomes: calls.append(i))
+    assert Ss == bell_test.run(iterations = 2000, seed = 5)
+    assert len(Ss) == 2000 and calls == list(range(1, 2001))
+    assert Ss[-1] == pytest.approx(2 * np.sqrt(2), abs = 0.25)
+    assert output.read_text().splitlines()[-1] == f"2000 {Ss[-1]}"
+
+def test_unknown_setting_is_rejected():
+    with pytest.raises(ValueError):
+        bell_test.prepare("ZZ")
+
+def test_import_does_not_import_the_user_interface():
+    output = subprocess.run([sys.executable, "-c", "import sys, game_logic.bell_test; print([name for name in ('PyQt5', 'matplotlib') if name in sys.modules])"],
+                            cwd = root_path, capture_output = True, text = True)
+    assert output.stdout.strip() == "[]", output.stderr
@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from distribution import OutcomeDistribution
+from sparse_simulator import ClusteredState
+
+
+def test_getitem_knows_qubits_that_are_always_empty():
+    # Position 3 belongs to the first factor, but is empty in every outcome
+    empty = OutcomeDistribution({(1,): 0.25, (): 0.75}, qubits = [1, 3])
+    other = OutcomeDistribution({(5,): 1.0}, qubits = [5])
+    distribution = OutcomeDistribution.product([empty, other])
+    assert distribution[(1, 5)] == pytest.approx(0.25)
+    assert distribution[(5,)] == pytest.approx(0.75)
+    assert distribution[(3, 5)] == 0
+    assert distribution.factor_qubits == [frozenset({1, 3}), frozenset({5})]
+
+def test_from_state_keeps_the_qubits_of_every_cluster():
+    state = ClusteredState(4)
+    state.x(0)
+    state.x(0) # qubit 0 is part of a cluster, but empty
+    state.x(2)
+    state.ch(2, 3)
+    distribution = OutcomeDistribution.from_state(state)
+    assert sorted(map(sorted, distribution.factor_qubits)) == [[0], [2, 3]]
+    assert distribution[(2,)] == pytest.approx(0.5)
+    assert distribution[(2, 3)] == pytest.approx(0.5)
+
+def test_from_bitstrings_maps_the_bits():
+    distribution = OutcomeDistribution.from_bitstrings({"01": 0.5, "10": 0.5}, [7, 9])
+    assert distribution.probabilities == {(7,): 0.5, (9,): 0.5}
+    assert distribution.factor_qubits == [frozenset({7, 9})]
+
+def test_expectation_and_sample():
+    distribution = OutcomeDistribution.product([OutcomeDistribution({(1,): 0.5, (2,): 0.5}), OutcomeDistribution({(4,): 1.0})])
+    assert distribution.expectation([1, 2]) == pytest.approx(-1.0)
+    assert distribution.expectation([4]) == pytest.approx(-1.0)
+    assert distribution.sample(random.Random(0)) in ([1, 4], [2, 4])
+    assert len(distribution) == 2
+    assert repr(OutcomeDistribution({(4,): 1.0})) == "OutcomeDistribution({(4,): 1.0})"
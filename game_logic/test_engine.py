@@ -0,0 +1,130 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from engine import Engine
+
+root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_engine_does_not_import_qt():
+    output = subprocess.run([sys.executable, "-c", "import sys, game_logic.engine; print('PyQt5' in sys.modules)"],
+                            cwd = root_path, capture_output = True, text = True)
+    assert output.stdout.strip() == "False", output.stderr
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_headless_game_has_a_winner(seed):
+    engine = Engine(rng = random.Random(seed))
+    winner = None
+    while winner is None and engine.total_turns < 5000:
+        winner = engine.play_turn()
+    assert winner in engine.colors
+    assert engine.winner() == winner
+    pawn_id = engine.pawn_id(winner, 0)
+    assert engine.final[pawn_id] == pawn_id and engine.final[pawn_id + 1] == pawn_id + 1
+
+def test_new_pawn_and_moves():
+    engine = Engine()
+    engine.current_turn = "Red"
+    engine.throw_dice([6, 6])
+    assert engine.options() == [[], [0, 1], []]
+    engine.new_pawn(0)
+    start = engine.start_position["Red"]
+    assert engine.board[start] == engine.pawn_id("Red", 0) and engine.home[0] is None
+
+    engine.throw_dice([1, 3])
+    engine.move(start)
+    assert engine.positions(0) == [(start + 1) % engine.N, (start + 3) % engine.N]
+    assert engine.entanglement((start + 1) % engine.N) == [(start + 3) % engine.N]
+    assert not engine.classical((start + 1) % engine.N)
+    assert engine.occupied() == 2
+    assert engine.circuit.distribution().probabilities == pytest.approx({((start + 1) % engine.N,): 0.5, ((start + 3) % engine.N,): 0.5})
+
+def test_snapshot_and_restore():
+    engine = Engine(rng = random.Random(2))
+    for turn in range(30):
+        engine.play_turn()
+    snapshot = engine.snapshot()
+    masks = list(engine.pawn_masks)
+    for turn in range(10):
+        engine.play_turn()
+    engine.restore(snapshot)
+    assert engine.snapshot() == snapshot
+    assert engine.pawn_masks == masks
+
+def scanned_options(engine : Engine):
+    """The move generator before the bitboards: a scan of the board for every type of move"""
+    own = {engine.pawn_id(engine.current_turn, 0), engine.pawn_id(engine.current_turn, 1)}
+    first, second = engine.die_throws
+    def free(position):
+        return engine.board[position % engine.N] not in own
+    return [[i for i in range(engine.N) if engine.board[i] in own and free(i + first) and free(i + second) and first != second],
+            [i for i in range(len(engine.home)) if engine.home[i] in own and free(engine.start_position[engine.current_turn]) and 6 in engine.die_throws],
+            [i for i in range(engine.N) if engine.board[i] in own and free(i + first) and first == second]]
+
+def game_states(seeds = range(4), turns = 150):
+    """Engines after every turn of random games"""
+    for seed in seeds:
+        engine = Engine(rng = random.Random(seed))
+        for turn in range(turns):
+            if engine.play_turn() is not None:
+                break
+            yield engine
+
+def test_options_match_the_board_scan():
+    dice = [[first, second] for first in range(1, 7) for second in range(1, 7)]
+    states = 0
+    for engine in game_states():
+        current_turn, die_throws = engine.current_turn, engine.die_throws
+        for color in engine.colors:
+            engine.current_turn = color
+            for engine.die_throws in dice:
+                assert engine.options() == scanned_options(engine)
+        engine.current_turn, engine.die_throws = current_turn, die_throws
+        states += 1
+    assert states > 200
+
+def test_pawn_index_matches_the_board_scan():
+    states = 0
+    for engine in game_states():
+        assert engine.occupied() == sum(1 for pawn_id in engine.board if pawn_id is not None)
+        for pawn_id in range(len(engine.pawn_masks)):
+            assert engine.positions(pawn_id) == [i for i in range(engine.N) if engine.board[i] == pawn_id]
+        for position in range(engine.N):
+            assert engine.entanglement(position) == [i for i in range(engine.N) if engine.board[i] == engine.board[position] and i != position]
+            assert engine.classical(position) == (engine.board.count(engine.board[position]) == 1)
+        states += 1
+    assert states > 200
+
+def test_prepared_sample_leaves_the_engine_unchanged():
+    engine = Engine(rng = random.Random(4))
+    engine.current_turn = "Red"
+    engine.throw_dice([6, 6])
+    engine.new_pawn(0)
+    engine.throw_dice([1, 3])
+    engine.move(engine.start_position["Red"])
+    state, snapshot, last_measure_info = engine.rng.getstate(), engine.snapshot(), engine.circuit.last_measure_info
+
+    measure = engine.prepare_sample(histogram = True, rng = random.Random(3))
+    positions, last_measurement, measure_info = measure()
+    assert engine.rng.getstate() == state
+    assert engine.snapshot() == snapshot
+    assert engine.last_measurement is None and engine.circuit.last_measure_info is last_measure_info
+    assert engine.prepare_sample(histogram = True, rng = random.Random(3))()[0] == positions
+
+    assert engine.store_sample(positions, last_measurement, measure_info) == positions
+    assert engine.last_measurement == last_measurement and engine.circuit.last_measure_info == measure_info
+    assert tuple(positions) in last_measurement[0].probabilities
+
+def test_same_seed_gives_the_same_game():
+    engines = [Engine(rng = random.Random(7)), Engine(rng = random.Random(7))]
+    for turn in range(200):
+        winners = [engine.play_turn() for engine in engines]
+        assert winners[0] == winners[1]
+        assert engines[0].snapshot() == engines[1].snapshot()
+        assert engines[0].die_throws == engines[1].die_throws
+        if winners[0] is not None:
+            break
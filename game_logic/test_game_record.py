@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from engine import Engine
+from game_record import GameRecord, HEADER, TURN, encode_turn, decode_turn
+from replay import Replay
+
+
+def play(seed : int) -> Engine:
+    engine = Engine(rng = random.Random(seed), record = True)
+    while engine.play_turn() is None:
+        pass
+    return engine
+
+@pytest.mark.parametrize("turn", [
+    {"dice": [0, 0], "kind": None, "move_from": None, "trigger": None, "positions": []},
+    {"dice": [3, 5], "kind": "move", "move_from": 17, "trigger": None, "positions": []},
+    {"dice": [6, 6], "kind": "new_pawn", "move_from": 3, "trigger": "final", "positions": [0, 12, 31, 33]},
+    {"dice": [1, 2], "kind": "direct_move", "move_from": 0, "trigger": "threshold", "positions": list(range(20))},
+])
+def test_encode_decode_round_trip(turn):
+    data = encode_turn(**turn)
+    assert len(data) == TURN.size == 10
+    assert decode_turn(data) == turn
+
+def test_record_is_ten_bytes_per_turn(tmp_path):
+    engine = play(1)
+    record = engine.record
+    assert len(record) == engine.total_turns
+    assert len(record.to_bytes()) == HEADER.size + 10 * len(record)
+
+    record.save(tmp_path / "game.qldr")
+    loaded = GameRecord.load(tmp_path / "game.qldr")
+    assert loaded.N == record.N
+    assert list(loaded) == list(record)
+
+def test_invalid_records_are_rejected():
+    with pytest.raises(ValueError):
+        GameRecord.from_bytes(b"QLDA" + bytes(4))
+    with pytest.raises(ValueError):
+        GameRecord(32, bytes(TURN.size + 1))
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_replay_reproduces_the_winner(seed):
+    engine = play(seed)
+    replay = Replay(GameRecord.from_bytes(engine.record.to_bytes()))
+    assert replay.play() == engine.winner()
+    assert replay.engine.snapshot()[0:4] == engine.snapshot()[0:4]
+    assert replay.engine.circuit.qcircuit == engine.circuit.qcircuit
+
+def test_seek_matches_stepping():
+    record = play(2).record
+    stepped = Replay(record, snapshot_interval = 16)
+    boards = [stepped.engine.snapshot()[0:4]]
+    while stepped.turn < len(record):
+        stepped.step()
+        boards.append(stepped.engine.snapshot()[0:4])
+
+    replay = Replay(record, snapshot_interval = 16)
+    replay.play()
+    for turn in [len(record) // 2, 5, len(record), 0, 40]:
+        replay.seek(turn)
+        assert replay.engine.snapshot()[0:4] == boards[turn]
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+HEAVY = ("matplotlib", "pandas", "qiskit_aer", "qiskit_ibm_runtime")
+
+
+def imported(module : str):
+    """The heavy modules that are imported by importing module in a new interpreter"""
+    output = subprocess.run([sys.executable, "-c", f"import sys, {module}; print(' '.join(name for name in {HEAVY!r} if name in sys.modules))"],
+                            cwd = root_path, capture_output = True, text = True, env = dict(os.environ, QT_QPA_PLATFORM = "offscreen"))
+    assert output.returncode == 0, output.stderr
+    return output.stdout.split()
+
+@pytest.mark.parametrize("module", ["main", "start_screen", "game_logic.quantum_circuits", "game_logic.engine"])
+def test_import_is_lazy(module):
+    assert imported(module) == []
+
+def test_start_screen_does_not_import_qiskit():
+    output = subprocess.run([sys.executable, "-c", "import sys, start_screen; print('qiskit' in sys.modules)"],
+                            cwd = root_path, capture_output = True, text = True, env = dict(os.environ, QT_QPA_PLATFORM = "offscreen"))
+    assert output.stdout.strip() == "False", output.stderr
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from quantum_circuits import circuit
+from measurement_pool import MeasurementPool
+from engine import Engine
+
+
+def pawns(positions, N = 6):
+    qc = circuit(N = N)
+    qc.new_pawn(positions)
+    return qc
+
+@pytest.fixture(params = [False, True], ids = ["threads", "processes"])
+def pool(request):
+    with MeasurementPool(workers = 2, processes = request.param, batch_size = 4) as pool:
+        yield pool
+
+def test_results_match_the_requests(pool):
+    futures = [pool.submit(pawns([i, i + 1]), seed = i, shots = 1, engine = "sparse") for i in range(5)]
+    assert [future.result(timeout = 60) for future in futures] == [[i, i + 1] for i in range(5)]
+    assert pool.metrics()["completed"] == 5
+
+def test_errors_only_fail_their_request(pool):
+    good = pool.submit(pawns([1]), seed = 0, shots = 1, engine = "sparse")
+    bad = pool.submit(pawns([1]), seed = 0, shots = 1, engine = "unknown")
+    assert good.result(timeout = 60) == [1]
+    with pytest.raises(ValueError, match = "engine"):
+        bad.result(timeout = 60)
+    assert pool.metrics()["failed"] == 1
+
+def test_errors_of_a_batched_sampler_job_are_raised():
+    with MeasurementPool(workers = 1, processes = False, batch_size = 4) as pool:
+        # simulator == False needs a service, all requests of the sampler job fail
+        futures = [pool.submit(pawns([i]), seed = i, shots = 1, simulator = False) for i in range(3)]
+        for future in futures:
+            with pytest.raises(ValueError, match = "service"):
+                future.result(timeout = 60)
+
+def test_closed_pool_rejects_requests():
+    pool = MeasurementPool(workers = 1, processes = False)
+    pool.close()
+    with pytest.raises(ValueError):
+        pool.submit(pawns([0]))
+
+def test_engine_with_pool_is_reproducible():
+    with MeasurementPool(workers = 1, processes = False) as pool:
+        winners = []
+        for attempt in range(2):
+            engine = Engine(rng = random.Random(3), pool = pool)
+            while engine.play_turn() is None:
+                pass
+            winners.append((engine.winner(), engine.total_turns))
+    assert winners[0] == winners[1]
@@ -0,0 +1,137 @@
+import random
+
+import numpy as np
+import pytest
+from qiskit import QuantumCircuit
+from qiskit.quantum_info import Operator
+
+from quantum_circuits import circuit, measure_many, _compile_instructions, _compiled_instruction
+from engine import Engine
+
+
+@pytest.mark.parametrize("kwargs", [{"noise_model": object()}, {"backend": object()}])
+def test_sparse_engine_rejects_noise(kwargs):
+    qc = circuit(N = 4)
+    qc.new_pawn([0])
+    with pytest.raises(ValueError):
+        qc.measure(engine = "sparse", **kwargs)
+    assert len(qc.qcircuit.data) == 1 # nothing was measured
+
+def test_compiled_instructions_are_cached_and_bounded():
+    qc = QuantumCircuit(3)
+    qc.ch(0, 1)
+    qc.mcx([0, 1], 2, ctrl_state = 1)
+    qc.ch(1, 2)
+    compiled = _compile_instructions(qc, ["cx", "u", "x"])
+    assert Operator(compiled).equiv(Operator(qc))
+    hits = _compiled_instruction.cache_info().hits
+    _compile_instructions(qc, ["cx", "u", "x"])
+    assert _compiled_instruction.cache_info().hits == hits + 3
+    assert _compiled_instruction.cache_info().maxsize is not None
+
+def test_log_stays_bounded_without_save():
+    engine = Engine(rng = random.Random(0))
+    longest, checkpoints = 0, 0
+    for turn in range(3000):
+        if engine.play_turn() is not None:
+            engine.reset()
+        longest = max(longest, len(engine.circuit.log))
+        checkpoints = max(checkpoints, len(engine.circuit._checkpoints))
+    # Without compaction the log grows to thousands of operations and hundreds of checkpoints
+    assert longest <= engine.circuit.max_history + 2 * engine.circuit.checkpoint_interval
+    assert checkpoints <= 32
+
+def test_undo_after_redo_returns_to_the_previous_save():
+    qc = circuit(N = 6)
+    qc.save()
+    qc.new_pawn([0])
+    qc.save()
+    qc.move([0], [1, 2])
+    qc.save()
+    after_move = qc.distribution().probabilities
+
+    qc.undo()
+    assert qc.distribution().probabilities == {(0,): 1.0}
+    qc.redo()
+    assert qc.distribution().probabilities == after_move
+    qc.undo()
+    assert qc.distribution().probabilities == {(0,): 1.0}
+    qc.undo()
+    assert qc.distribution().probabilities == {(): 1.0}
+
+def test_measure_basis_dictionary_is_replayed():
+    qc = circuit(N = 4)
+    qc.save()
+    qc.new_pawn([0])
+    qc.measure_basis({0: "X", 1: "Q"})
+    qc.save()
+    rotated = qc.distribution().probabilities
+    assert rotated[()] == pytest.approx(0.5 * np.cos(np.pi/8)**2)
+
+    qc.undo()
+    qc.redo()
+    assert qc.distribution().probabilities == pytest.approx(rotated)
+    assert qc.recent().size() == 3
+
+@pytest.mark.parametrize("engine", ["sparse", "aer"])
+def test_expectation_example(engine):
+    qc = circuit(N = 3)
+    qc.new_pawn([0])
+    qc.move([0], [1, 2])
+    assert qc.expectation([1, 2], engine = engine) == pytest.approx(-1.0)
+    assert qc.expectation([1], measure_bases = {1: "X"}, engine = engine) == pytest.approx(0.0, abs = 1e-9)
+
+def superposition(rng = random):
+    qc = circuit(N = 6, rng = rng)
+    qc.new_pawn([0, 3])
+    qc.move([0], [1, 2])
+    return qc
+
+@pytest.mark.parametrize("kwargs", [{"engine": "sparse"}, {"engine": "aer"}, {"engine": "aer", "efficient": True}, {"exact": True}])
+def test_single_shot_returns_one_outcome(kwargs):
+    outcomes = set()
+    for seed in range(8):
+        positions = superposition(random.Random(seed)).measure(shots = 1, **kwargs)
+        assert positions == superposition(random.Random(seed)).measure(shots = 1, **kwargs)
+        outcomes.add(tuple(positions))
+    assert outcomes == {(1, 3), (2, 3)}
+
+def test_logical_simulation():
+    qc = superposition(random.Random(0))
+    positions, out_with_freq, nr_of_qubits_used = qc.measure(out_internal_measure = True)
+    assert sorted(map(tuple, out_with_freq.values())) == [(1, 3), (2, 3)]
+    assert sum(out_with_freq.keys()) == pytest.approx(1.0)
+    assert positions in out_with_freq.values()
+    assert nr_of_qubits_used == 4 # the active qubits 0, 1, 2 and 3
+    assert qc.last_measure_info["nr_of_qubits"] == 4
+    assert qc.last_measure_info["nr_of_gates"] == sum(qc.last_measure_info["gates"].values()) > 0
+
+@pytest.mark.parametrize("kwargs", [{}, {"efficient": True}, {"efficient": True, "clusters": True}, {"engine": "sparse"}, {"exact": True}, {"backend": "generic"}])
+def test_measure_resets_the_circuit(kwargs):
+    qc = superposition(random.Random(0))
+    if kwargs.get("backend") == "generic":
+        from qiskit.providers.fake_provider import GenericBackendV2
+        kwargs = {"backend": GenericBackendV2(num_qubits = qc.qcircuit.num_qubits, seed = 0)}
+    assert qc.measure(**kwargs) in ([1, 3], [2, 3])
+    assert qc.qcircuit.size() == 0
+    assert qc.log[-1] == ("reset",)
+
+def test_measure_many():
+    def circuits():
+        capture = circuit(N = 6)
+        capture.new_pawn([0, 1])
+        capture.move([0], [2, 3])
+        capture.move([1], [4, 5])
+        capture.capture([4], [3], [2])
+        return [superposition(), circuit(N = 6), capture]
+    supports = [set(qc.distribution().probabilities) for qc in circuits()]
+    for seed in range(4):
+        measured = circuits()
+        outputs = measure_many(measured, shots = 1, seeds = [seed, seed + 1, seed + 2])
+        assert [tuple(positions) in support for positions, support in zip(outputs, supports)] == [True] * 3
+        assert outputs == measure_many(circuits(), shots = 1, seeds = [seed, seed + 1, seed + 2])
+        assert [qc.qcircuit.size() for qc in measured] == [0] * 3
+    histograms = measure_many(circuits(), out_internal_measure = True, seeds = [0, 1, 2])
+    for (positions, out_with_freq, nr_of_qubits_used), support in zip(histograms, supports):
+        assert {tuple(outcome) for outcome in out_with_freq.values()} <= support
+        assert tuple(positions) in support
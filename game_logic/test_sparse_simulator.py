@@ -0,0 +1,150 @@
+import random
+
+import numpy as np
+import pytest
+from qiskit import QuantumCircuit
+from qiskit.quantum_info import Statevector
+
+from quantum_circuits import circuit
+from sparse_simulator import SparseState, ClusteredState
+from distribution import OutcomeDistribution
+from engine import Engine
+
+
+def superposition(qc):
+    qc.new_pawn([0, 1])
+    qc.move([0], [2, 3])
+
+def capture(qc):
+    qc.new_pawn([0, 1])
+    qc.move([0], [2, 3])
+    qc.move([1], [4, 5])
+    qc.capture([4], [3], [2])
+
+def merge(qc):
+    qc.new_pawn([0])
+    qc.move([0], [1, 2])
+    qc.merge_move([1], [3, 2], [2])
+
+def bases(qc):
+    qc.new_pawn([0, 4])
+    qc.move([0], [1, 2])
+    qc.measure_basis(["Z", "X", "Q", "T"])
+
+def assert_same_distribution(actual : OutcomeDistribution, expected : OutcomeDistribution):
+    actual, expected = actual.probabilities, expected.probabilities
+    for positions in set(actual) | set(expected):
+        assert actual.get(positions, 0) == pytest.approx(expected.get(positions, 0), abs = 1e-9)
+
+
+@pytest.mark.parametrize("moves", [superposition, capture, merge, bases])
+def test_sparse_distribution_matches_aer(moves):
+    qc = circuit(N = 6)
+    moves(qc)
+    assert_same_distribution(qc.distribution(engine = "sparse"), qc.distribution(engine = "aer"))
+
+@pytest.mark.parametrize("moves", [superposition, capture, merge])
+def test_live_state_matches_circuit(moves):
+    qc = circuit(N = 6, live_state = True)
+    moves(qc)
+    assert_same_distribution(OutcomeDistribution.from_state(qc.state), OutcomeDistribution.from_state(ClusteredState.from_circuit(qc.qcircuit)))
+
+def test_sparse_state_matches_statevector():
+    qc = QuantumCircuit(4)
+    qc.x(0)
+    qc.h(1)
+    qc.ch(1, 2)
+    qc.ry(np.pi/3, 3)
+    qc.mcx([1, 3], 0, ctrl_state = 1)
+    qc.swap(0, 2)
+    expected = Statevector(qc).probabilities_dict()
+    actual = SparseState.from_circuit(qc).probabilities()
+    for bitstring, probability in expected.items():
+        assert actual.get(int(bitstring, 2), 0) == pytest.approx(probability, abs = 1e-9)
+
+def test_sparse_shots_follow_distribution():
+    qc = circuit(N = 6)
+    superposition(qc)
+    counts = ClusteredState.from_circuit(qc.qcircuit).sample(shots = 4000, rng = random.Random(0))
+    assert sum(counts.values()) == 4000
+    assert sum(count for basis, count in counts.items() if basis >> 2 & 1) / 4000 == pytest.approx(0.5, abs = 0.05)
+
+def assert_live_state_matches(qc):
+    assert_same_distribution(OutcomeDistribution.from_state(qc.state), OutcomeDistribution.from_state(ClusteredState.from_circuit(qc.qcircuit)))
+
+def test_live_state_follows_undo_redo_and_reset():
+    qc = circuit(N = 6, live_state = True)
+    qc.save()
+    capture(qc)
+    qc.save()
+    qc.move([2], [0, 1])
+    qc.save()
+    qc.undo()
+    assert_live_state_matches(qc)
+    qc.redo()
+    assert_live_state_matches(qc)
+    qc.measure(engine = "sparse", shots = 1)
+    assert len(qc.state.states()) == 0
+
+def test_live_state_during_a_game():
+    engine = Engine(rng = random.Random(4))
+    for turn in range(80):
+        engine.play_turn()
+        assert_live_state_matches(engine.circuit)
+
+def mid_game_circuits(seeds = range(3), turns = 40):
+    """The circuits of random games before every turn"""
+    circuits = []
+    for seed in seeds:
+        engine = Engine(rng = random.Random(seed))
+        for turn in range(turns):
+            circuits.append(engine.circuit.qcircuit.copy())
+            if engine.play_turn() is not None:
+                break
+    return circuits
+
+def test_swap_moves_a_qubit_between_clusters():
+    state = ClusteredState(4)
+    state.x(0)
+    state.ch(0, 1)
+    state.x(3)
+    assert state.clusters() == [[0, 1], [3]]
+    state.swap(1, 2) # to a qubit outside every cluster
+    assert state.clusters() == [[0, 2], [3]]
+    state.swap(2, 3) # between two clusters: the qubits are exchanged without merging the clusters
+    assert sorted(state.clusters()) == [[0, 3], [2]]
+    assert_same_distribution(OutcomeDistribution.from_state(state), OutcomeDistribution({(0, 2): 0.5, (0, 2, 3): 0.5}))
+
+def test_entangling_gates_merge_clusters():
+    state = ClusteredState(5)
+    state.h([0, 2])
+    state.x(4)
+    assert state.clusters() == [[0], [2], [4]]
+    state.cx(0, 1)
+    assert state.clusters() == [[0, 1], [2], [4]]
+    state.mcx([1, 2], 3)
+    assert state.clusters() == [[0, 1, 2, 3], [4]]
+    assert len(state.states()) == 2
+    copy = state.copy()
+    copy.x(4)
+    assert state.states()[1].probabilities() == {16: 1.0}
+
+def test_clustered_state_matches_sparse_state():
+    circuits = mid_game_circuits()
+    assert len(circuits) > 50
+    for qc in circuits:
+        expected = SparseState.from_circuit(qc).probabilities()
+        actual = OutcomeDistribution.from_state(ClusteredState.from_circuit(qc)).probabilities
+        assert len(actual) == len(expected)
+        for basis, probability in expected.items():
+            assert actual[tuple(SparseState.positions(basis))] == pytest.approx(probability, abs = 1e-9)
+
+def test_cluster_simulation():
+    qc = circuit(N = 6, rng = random.Random(1))
+    superposition(qc)
+    assert qc._clusters() == [[0, 2, 3], [1]]
+    positions, distribution, nr_of_qubits_used = qc.measure(efficient = True, clusters = True, out_internal_measure = True)
+    assert set(distribution.probabilities) == {(1, 2), (1, 3)}
+    assert tuple(positions) in distribution.probabilities
+    assert nr_of_qubits_used == 3 # the largest cluster
+    assert qc.qcircuit.size() == 0
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+root_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(root_path)
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication, QPushButton
+
+import UI
+
+
+@pytest.fixture
+def app():
+    return QApplication.instance() or QApplication([])
+
+def test_stylesheet_cache_key_and_eviction():
+    UI._stylesheets.clear()
+    first = UI._stylesheet("Red", "white", False, 0, True, 25)
+    assert UI._stylesheet("Red", "white", False, 0, True, 25) is first
+    assert UI._stylesheet("Red", "white", False, 0, False, 25) is not first
+    assert set(UI._stylesheets) == {("Red", "white", False, 0, True), ("Red", "white", False, 0, False)}
+
+    # A new button size empties the cache, the stylesheets of the old size are never returned again
+    resized = UI._stylesheet("Red", "white", False, 0, True, 40)
+    assert resized != first and "border-radius: 20px" in resized
+    assert list(UI._stylesheets) == [("Red", "white", False, 0, True)]
+    assert UI._stylesheet("Red", "white", False, 0, True, 25) == first
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(UI, "_max_stylesheets", 4)
+    UI._stylesheets.clear()
+    for pawn in range(10):
+        UI._stylesheet(None, "white", False, pawn, True, 25)
+        assert len(UI._stylesheets) <= 4
+
+def test_button_is_only_restyled_when_the_style_changes(app, monkeypatch):
+    button = QPushButton()
+    calls = []
+    monkeypatch.setattr(button, "setStyleSheet", lambda stylesheet: calls.append(stylesheet))
+    UI.button_stylesheet(button, color = "Blue", L = 30)
+    UI.button_stylesheet(button, color = "Blue", L = 30)
+    assert len(calls) == 1
+    UI.button_stylesheet(button, color = "Blue", selected = True, L = 30)
+    UI.button_stylesheet(button, color = "Blue", selected = True, L = 32)
+    assert len(calls) == 3 and "border-radius: 16px" in calls[-1]
@@ -0,0 +1,13 @@
+import tournament
+
+
+def test_report_without_games(capsys):
+    tournament.report([], 0.0)
+    assert capsys.readouterr().out == "games          0, no games were played\n"
+
+def test_report(capsys):
+    results, duration = tournament.tournament(games = 2, processes = 1)
+    tournament.report(results, duration)
+    out = capsys.readouterr().out
+    assert out.startswith("games          2 in ")
+    assert sum(int(line.split("(")[-1].rstrip(")")) for line in out.splitlines()[3:]) == 2
@@ -0,0 +1,105 @@
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import time
+
+if __package__:
+    from .engine import Engine
+    from .archive import ArchiveWriter
+else:
+    from engine import Engine
+    from archive import ArchiveWriter
+
+
+def play_game(seed : int, max_turns : int = 10000, record : bool = False):
+    """
+    Description
+    -----------
+    Play one complete game with random moves without user interface, see Engine.play_turn()
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the dice, the moves and the measurement outcomes of this game
+    max_turns : int
+        The game is stopped without winner after this many turns
+    record : boolean
+        If True, the result also contains the game record (see game_record.GameRecord) as "record"
+
+    Returns
+    -------
+    result : dict
+        The seed, the winning color (None if the game was stopped), the number of turns and the duration in seconds
+    """
+    start = time.perf_counter()
+    engine = Engine(rng = random.Random(seed), record = record)
+    winner = None
+    turns = 0
+    while winner is None and turns < max_turns:
+        winner = engine.play_turn()
+        turns += 1
+    result = {"seed": seed, "winner": winner, "turns": turns, "time": time.perf_counter() - start}
+    if record:
+        result["record"] = engine.record
+    return result
+
+def _play_game(arguments):
+    return play_game(*arguments)
+
+def tournament(games : int = 1000, processes : int = None, seed : int = 0, max_turns : int = 10000, archive : str = None):
+    """
+    Description
+    -----------
+    Play many games in parallel, spread over a pool of processes. Game i is played with seed + i,
+    so the results do not depend on the number of processes. If archive is given, the record of every game is
+    appended to that archive file in the order of the seeds, see archive.ArchiveWriter
+
+    Returns
+    -------
+    results : list[dict]
+        The result of every game, see play_game(), sorted by seed
+    duration : float
+        Total time in seconds
+    """
+    start = time.perf_counter()
+    arguments = [(seed + i, max_turns, archive is not None) for i in range(games)]
+    if processes == 1:
+        results = list(map(_play_game, arguments))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = list(pool.imap_unordered(_play_game, arguments, chunksize = max(1, games // (16 * (processes or os.cpu_count())))))
+    results = sorted(results, key=lambda result: result["seed"])
+    if archive is not None:
+        with ArchiveWriter(archive, N = results[0]["record"].N if results else 32) as writer:
+            for result in results:
+                writer.append(result.pop("record"))
+    return results, time.perf_counter() - start
+
+def report(results, duration, colors = None):
+    """Print the number of games per second, the number of turns per game and the win rate of every color"""
+    if colors is None:
+        colors = Engine().colors
+    if len(results) == 0:
+        print("games          0, no games were played")
+        return
+    turns = [result["turns"] for result in results]
+    print(f"games          {len(results)} in {duration:.1f} s ({len(results)/duration:.1f} games/s)")
+    print(f"turns per game mean {statistics.mean(turns):.1f}, median {statistics.median(turns):.0f}, min {min(turns)}, max {max(turns)}")
+    print("win rate")
+    for color in colors + [None]:
+        wins = sum(1 for result in results if result["winner"] == color)
+        print(f"    {color if color is not None else 'no winner':<10} {wins/len(results):6.1%} ({wins})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play complete games with random moves in parallel and report the results")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=None, help="number of processes, all cores by default")
+    parser.add_argument("--seed", type=int, default=0, help="game i is played with seed + i")
+    parser.add_argument("--max-turns", type=int, default=10000, help="stop a game without winner after this many turns")
+    parser.add_argument("--archive", type=str, default=None, help="append the record of every game to this archive file")
+    args = parser.parse_args()
+
+    results, duration = tournament(games = args.games, processes = args.processes, seed = args.seed, max_turns = args.max_turns, archive = args.archive)
+    report(results, duration)
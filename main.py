@@ -2,39 +2,41 @@
 # IMPORT THE STYLESHEETS
 from UI import stylesheet, button_stylesheet, die_cons, die_stylesheet
 
-# IMPORT THE QUANTUM CIRCUITS
-from game_logic.quantum_circuits import circuit
+# IMPORT THE GAME ENGINE (RULES, BOARD AND QUANTUM CIRCUIT)
+from game_logic.engine import Engine
+from game_logic.quantum_circuits import render_circuit, render_process_init
+from game_logic import bell_test
 
 # LIBRARIES
 # application from pyqt
 from PyQt5.QtWidgets import QApplication, QWidget, QTextEdit, QComboBox,QPushButton, QLabel, QHBoxLayout,QVBoxLayout, QGridLayout, QMenuBar, QMainWindow, QDialog, QProgressBar
 import PyQt5.QtWidgets as Qt
 from PyQt5.QtWidgets import QSizePolicy
-from PyQt5.QtGui import QIcon
+from PyQt5.QtGui import QIcon, QPixmap, QFontDatabase
 import PyQt5.QtCore as Qtc
 from PyQt5.QtCore import QSize, QTimer
 from PyQt5.QtSvg import QSvgGenerator
 from PyQt5.QtGui import QPainter
 
 # others
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
 import sys
 import os
-import numpy as np
 import random
-from pandas import DataFrame
+import numpy as np
 import datetime
+import time
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 
-class MplCanvas(FigureCanvas):
-    def __init__(self, parent=None, width=5, height=4, dpi=100):
-        plt.style.use('dark_background') 
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = fig.add_subplot(111)
-        super().__init__(fig)
+def mpl_canvas(parent=None, width=5, height=4, dpi=100):
+    """Matplotlib canvas with one subplot (canvas.axes). Matplotlib takes over a second to import, so it is only imported when a plot is opened"""
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    plt.style.use('dark_background') 
+    canvas = FigureCanvas(Figure(figsize=(width, height), dpi=dpi))
+    canvas.axes = canvas.figure.add_subplot(111)
+    return canvas
 
 class BellTestPlot(QDialog):
     def __init__(self, *args, **kwargs):
@@ -42,7 +44,7 @@ class BellTestPlot(QDialog):
         self.setStyleSheet(stylesheet)
 
         # Create and configure the Matplotlib canvas
-        self.canvas = MplCanvas(self, width=5, height=4, dpi=100)
+        self.canvas = mpl_canvas(self, width=5, height=4, dpi=100)
 
         # Use a layout to add widgets to the QDialog
         layout = QVBoxLayout()
@@ -57,10 +59,12 @@ class BellTestPlot(QDialog):
         # Initialize the plot
         self.update_plot(0, 0)
 
-    def update_plot(self, x, y):
-        """Update the plot with new data."""
+    def update_plot(self, x, y, draw = True):
+        """Update the plot with new data. If draw is False, the point is only added and drawn by the next update"""
         self.xdata.append(x)
         self.ydata.append(y)
+        if draw == False:
+            return
         
         if self._plot_ref is None:
             # Create the line plot initially
@@ -194,63 +198,146 @@ class selectDicePopup(QDialog):
             self.accept()
 
 class MeasurePopup(QDialog):
-    """Popup during measurement"""
-    def __init__(self):
+    """Popup during measurement, showing how long the measurement takes. If cancel is True, the measurement can be cancelled with cancel_button"""
+    def __init__(self, cancel = False):
         super().__init__()
         self.setStyleSheet(stylesheet)
         self.setWindowTitle("Measuring")
         self.setFixedSize(600,300)
         self.label= QLabel("MEASURING.......")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0) # Busy indicator, the duration of a measurement is not known
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setVisible(cancel)
         layout = QVBoxLayout()
         layout.addWidget(self.label)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.cancel_button)
         self.setLayout(layout)
 
+        self.start = time.perf_counter()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_time)
+        self.timer.start(1000)
+
+    def update_time(self):
+        self.label.setText(f"MEASURING....... {time.perf_counter() - self.start:.0f} s")
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
 class CircuitFigure(QDialog):
     """
     Description
     -----------
-    General class for a popup window with a matplotlib figure. The figure can be updated with another figure
-    by calling the method `plot` with the new figure as argument
+    Popup window with a drawing of the quantum circuit. A matplotlib drawing of a long circuit takes seconds, so
+    the circuit is only drawn while the window is visible, in another process. Updates that arrive within `delay` ms
+    are combined into one drawing. The whole circuit is drawn, or only the last `moves` moves if given (see circuit.recent()),
+    and circuits with more than `max_operations` operations are shown as text drawing
     
     Methods
     ----------
-    __init__ : Define the layout of the popup: a matplotlib figure
-    plot : Method to update the canvas with a new figure
+    __init__ : Define the layout of the popup: a scrollable drawing
+    update_circuit : Method to give the new circuit, it is drawn again as soon as the window is visible
+    draw : Start drawing the latest circuit in the other process
+    show_drawing : Show a finished drawing and start the next one if the circuit changed in the meantime
+    shutdown : Stop the process that draws, when the game is closed
     
     Examples
     --------
     circuit = circuit(32)
     circuitfigure = CircuitFigure()
-    fig = circuit.draw(mpl_open = False, term_draw = False)
-    circuitfigure.plot(self.fig)
+    circuitfigure.update_circuit(circuit)
     circuitfigure.show()
     """
-    def __init__(self):
+    drawn = Qtc.pyqtSignal(object, int)
+
+    def __init__(self, delay = 200, moves = None, max_operations = 500):
         super().__init__()
         self.setStyleSheet(stylesheet)
         self.setWindowTitle("Circuit")
         self.resize(800, 600)
 
-        self.figure = plt.figure()
-
-        self.canvas = FigureCanvas(self.figure)
+        self.drawing = QLabel("")
+        self.drawing.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        scroll_area = Qt.QScrollArea()
+        scroll_area.setWidget(self.drawing)
+        scroll_area.setWidgetResizable(True)
         layout = QVBoxLayout()
-        layout.addWidget(self.canvas)
+        layout.addWidget(scroll_area)
         self.setLayout(layout)
 
-    def plot(self, figure):
-        self.figure.clear()
-        self.figure = figure
-        self.canvas.figure = self.figure
-        self.canvas.draw()
-        plt.close()
-        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.canvas.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.canvas.updateGeometry()
+        self.circuit = None
+        self.moves = moves
+        self.max_operations = max_operations
+        self.version = 0        # Incremented by every update_circuit()
+        self.drawn_version = 0  # Version that is shown
+        self.busy = False       # A drawing is being made
+        self.executor = None    # Process that draws, started by the first drawing
+        self.drawn.connect(self.show_drawing)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.draw)
+
+    def update_circuit(self, circuit):
+        """Set the circuit (game_logic.quantum_circuits.circuit) to draw, as it is at this moment"""
+        self.circuit = circuit
+        self.version += 1
+        if self.isVisible():
+            self.timer.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.drawn_version != self.version:
+            self.timer.start()
+
+    def draw(self):
+        if self.busy or self.circuit is None or not self.isVisible():
+            return # show_drawing() or showEvent() starts the drawing later
+        if self.executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=render_process_init)
+        version = self.version
+        if self.moves is None:
+            qcircuit = self.circuit.qcircuit.copy()
+        else:
+            qcircuit = self.circuit.recent(self.moves)
+        future = self.executor.submit(render_circuit, qcircuit, text = qcircuit.size() > self.max_operations)
+        self.busy = True
+        future.add_done_callback(lambda future: self.drawn.emit(future, version))
+
+    def show_drawing(self, future, version):
+        self.busy = False
+        try:
+            drawing = future.result()
+        except Exception as error:
+            drawing = f"The circuit could not be drawn: {error}"
+        if isinstance(drawing, str):
+            self.drawing.setAlignment(Qtc.Qt.AlignLeft | Qtc.Qt.AlignTop)
+            self.drawing.setText(drawing)
+        else:
+            pixmap = QPixmap()
+            pixmap.loadFromData(drawing, "PNG")
+            self.drawing.setAlignment(Qtc.Qt.AlignCenter)
+            self.drawing.setPixmap(pixmap)
+        self.drawn_version = version
+        if self.version != version:
+            self.timer.start()
+
+    def shutdown(self):
+        """Stop the process that draws, a drawing that is still being made is cancelled"""
+        self.timer.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
 
 class Main(QMainWindow):
     """Main class for the game: UI and classical game logic"""
-    def __init__(self, simulation = True, debug = False, service = None):
+    sampled = Qtc.pyqtSignal(object)
+    def __init__(self, simulation = True, debug = False, service = None, seed = None):
         """
         Description
         -----------
@@ -262,6 +349,9 @@ class Main(QMainWindow):
             If True, the quantum circuit is simulated using AerSimulator(). If False, the quantum circuit is run on a real quantum computer
         debug : Boolean
             If True, the game is in debug mode. This is not very different from normal mode, except that some debug features are already enabled, but can be toggled on and off
+        seed : int
+            If given, the dice, the random moves and the measurement outcomes are drawn from a random.Random with this seed,
+            such that a game can be replayed exactly (e.g. for profiling)
         """
         self.simulation = simulation
         self.debug = debug
@@ -269,30 +359,87 @@ class Main(QMainWindow):
 
 
         self.N = 32
-        self.circuit = circuit(self.N)
+        self.engine = Engine(self.N, simulation = self.simulation, service = self.service, verbose = True, rng = random.Random(seed) if seed is not None else random, record = True)
+        self.circuit = self.engine.circuit
         self.history = []
+        self.redo_history = []
+        self.restoring_history = False
+        self.measurement = None         # Running measurement (a Future of Engine.sample()), see measure_action()
+        self.measured_move = None       # final_position and next_turn of the running measurement
+        self.measure_executor = None    # Thread that measures, started by the first measurement
 
         self.circuitfigure = CircuitFigure()
-        self.fig = self.circuit.draw(mpl_open = False, term_draw = False)
-        self.circuitfigure.plot(self.fig)
+        self.circuitfigure.update_circuit(self.circuit)
         if debug:
             self.circuitfigure.show()
 
         super().__init__()
+        self.sampled.connect(self.measurement_done)
         self.setWindowTitle("Quantum Ludo")
         self.L = int(500)
+        self.button_styles = {} # The arguments of the stylesheet of every button, see Main.restyle()
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(50)
+        self.resize_timer.timeout.connect(self.resize_positions)
         self.setGeometry(250,250,int(1.2 * self.L),self.L)
         self.initUI()
         self.window()
         self.total_turns = 0
         self.next_turn()
 
+    # The state of the game is kept by the engine, the widgets only show it
+    @property
+    def current_turn(self):
+        return self.engine.current_turn
+
+    @current_turn.setter
+    def current_turn(self, color):
+        self.engine.current_turn = color
+
+    @property
+    def die_throws(self):
+        return self.engine.die_throws
+
+    @die_throws.setter
+    def die_throws(self, die_throws):
+        self.engine.die_throws = die_throws
+
+    @property
+    def total_turns(self):
+        return self.engine.total_turns
+
+    @total_turns.setter
+    def total_turns(self, total_turns):
+        self.engine.total_turns = total_turns
+
+    @property
+    def force_global_standard_basis(self):
+        return self.engine.force_standard_basis
+
+    @force_global_standard_basis.setter
+    def force_global_standard_basis(self, force):
+        self.engine.force_standard_basis = force
+
     def resizeEvent(self, event):
+        # Resizing the window sends many resize events, only the last one is handled (see Main.resize_positions)
+        super().resizeEvent(event)
+        self.resize_timer.start()
+
+    def closeEvent(self, event):
+        # The circuit window and its drawing process are not closed with the game by Qt
+        self.circuitfigure.shutdown()
+        self.circuitfigure.close()
+        super().closeEvent(event)
+
+    def resize_positions(self):
         # Update the button size based on the window size
+        if self.L == self.width():
+            return
         self.L = self.width()   # Scale based on window size
         for b in self.board_positions + self.final_positions + self.home_positions + self.dice:
             b.setFixedSize(self.L// 10, self.L// 10)  # Resize button proportionally
-        self.update_stylesheets()
+        self.update_stylesheets(deselect=False)
 
     def window(self):
         """Creates the top left menu bar containg some file options (undo, screenshot, reset), debug options (measure, selecting dice, autoplay) and some standard moves for testing"""
@@ -320,6 +467,10 @@ class Main(QMainWindow):
         self.undo_button.setShortcut("Ctrl+Z")
         self.undo_button.triggered.connect(self.undo)
 
+        self.redo_button = Qt.QAction("Redo", self)
+        self.redo_button.setShortcut("Ctrl+Y")
+        self.redo_button.triggered.connect(self.redo)
+
         self.measure_button = Qt.QAction("Measure", self)
         self.measure_button.setShortcut("Ctrl+M")
         self.measure_button.triggered.connect(lambda: self.measure_action(standard_basis=True))
@@ -419,6 +570,7 @@ class Main(QMainWindow):
 
         self.file_menu.addAction(self.reset)
         self.file_menu.addAction(self.undo_button)
+        self.file_menu.addAction(self.redo_button)
         self.file_menu.addAction(self.throw_dice_button)
         self.file_menu.addAction(self.screenshot)
         self.file_menu.addAction(self.force_standard_basis_button)
@@ -451,18 +603,14 @@ class Main(QMainWindow):
         
         Note
         ----
-        The position buttons all have three properties: "Color", "Pawn" and "Selected", which represent:
-            - "Color": the color of the pawn at that position. None if no pawn is present
-            - "Pawn": the number (0 or 1) of the pawn at that position. None if no pawn is present
-            - "Selected": a boolean indicating if the pawn is at a position where it can be moved
-        This code does not style the buttons. This is done in the method `update_stylesheets` using these three properties
-        The game logic also uses these same properties to determine the possible moves
+        The buttons do not contain the state of the game, this is kept in self.engine (see game_logic/engine.py).
+        The position buttons only have the property "Selected": a boolean indicating if the pawn is at a position where it can be moved.
+        This code does not style the buttons. This is done in the method `update_stylesheets` using the engine and this property
 
         Example
         --------
         # The second red pawn is present at position 2 on the board
-        self.board_positions[2].setProperty("Color", self.colors[0])
-        self.board_positions[2].setProperty("Pawn", 1)
+        self.engine.place(2, self.engine.pawn_id(self.colors[0], 1))
         self.board_positions[2].setProperty("Selected", False)
         """
         central_widget = QWidget(self)
@@ -480,8 +628,6 @@ class Main(QMainWindow):
         y=0
         for i, pos in enumerate(self.board_positions):
             pos.setFixedSize(int(self.L/10), int(self.L/10))
-            pos.setProperty("Color", None)
-            pos.setProperty("Pawn", None)
             pos.setProperty("Selected", False)
 
             grid.addWidget(pos, y, x)
@@ -497,56 +643,33 @@ class Main(QMainWindow):
         # ---------------------------------------------------------------------------------------------------------------------
         # Initialize the colours and the position that they occupy after going out of the home position (after throwing a 6)
         # ---------------------------------------------------------------------------------------------------------------------
-        self.colors = ['Red', 'Green', 'Blue', 'Purple'] # MUST BE FOUR COLOURS
-        self.measure_basis_dict = {
-            (self.colors[0],    0): {self.colors[0]:    "Z", self.colors[1]:  "Q", self.colors[2]:   "X", self.colors[3]: "T"},
-            (self.colors[0],    1): {self.colors[0]:    "Z", self.colors[3]: "Q", self.colors[2]:   "X", self.colors[1]:  "T"},
-            (self.colors[2],   0): {self.colors[2]:   "Z", self.colors[3]: "Q", self.colors[0]:    "X", self.colors[1]:  "T"},
-            (self.colors[2],   1): {self.colors[2]:   "Z", self.colors[1]:  "Q", self.colors[0]:    "X", self.colors[3]: "T"},
-            (self.colors[1],  0): {self.colors[1]:  "Z", self.colors[0]:    "Q", self.colors[3]: "X", self.colors[2]:   "T"},
-            (self.colors[1],  1): {self.colors[1]:  "Z", self.colors[2]:   "Q", self.colors[3]: "X", self.colors[0]:    "T"},
-            (self.colors[3], 0): {self.colors[3]: "Z", self.colors[2]:   "Q", self.colors[1]:  "X", self.colors[0]:    "T"},
-            (self.colors[3], 1): {self.colors[3]: "Z", self.colors[0]:    "Q", self.colors[1]:  "X", self.colors[2]:   "T"}
-        }
-        self.current_turn = self.colors[-1]
-        self.start_position = {
-            self.colors[0] : 26,
-            self.colors[1] : 2,
-            self.colors[2] : 10,
-            self.colors[3] : 18
-        }
+        self.colors = self.engine.colors
+        self.measure_basis_dict = self.engine.measure_basis_dict
+        self.start_position = self.engine.start_position
 
         # -------------------------
         # Create the home positions
         # -------------------------
         self.home_positions = [Qt.QPushButton(rf'{i if self.debug==True else ""}') for i in range(8)]
         for i, pos in enumerate(self.home_positions):
-            current_color = self.colors[int(np.floor(i/2))]
             pos.setFixedSize(int(self.L/10),int(self.L/10))
-            # pos.setStyleSheet(button_stylesheet(color = current_color))
-            pos.setProperty("Color", current_color)
             pos.setProperty("Selected", False)
 
-
-            if i == 0: grid.addWidget(pos, 1, 0), pos.setProperty("Pawn", 0)
-            if i == 1: grid.addWidget(pos, 0, 1), pos.setProperty("Pawn", 1)
-            if i == 2: grid.addWidget(pos, 0, 7), pos.setProperty("Pawn", 0)
-            if i == 3: grid.addWidget(pos, 1, 8), pos.setProperty("Pawn", 1)
-            if i == 4: grid.addWidget(pos, 7, 8), pos.setProperty("Pawn", 0)
-            if i == 5: grid.addWidget(pos, 8, 7), pos.setProperty("Pawn", 1)
-            if i == 6: grid.addWidget(pos, 8, 1), pos.setProperty("Pawn", 0)
-            if i == 7: grid.addWidget(pos, 7, 0), pos.setProperty("Pawn", 1)
+            if i == 0: grid.addWidget(pos, 1, 0)
+            if i == 1: grid.addWidget(pos, 0, 1)
+            if i == 2: grid.addWidget(pos, 0, 7)
+            if i == 3: grid.addWidget(pos, 1, 8)
+            if i == 4: grid.addWidget(pos, 7, 8)
+            if i == 5: grid.addWidget(pos, 8, 7)
+            if i == 6: grid.addWidget(pos, 8, 1)
+            if i == 7: grid.addWidget(pos, 7, 0)
 
         # ---------------------------
         # Create the final positions
         # ---------------------------
         self.final_positions = [Qt.QPushButton(rf'{i if self.debug==True else ""}') for i in range(8)]
         for i, pos in enumerate(self.final_positions):
-            current_color = self.colors[int(np.floor(i/2))]
             pos.setFixedSize(int(self.L/10),int(self.L/10))
-            # pos.setStyleSheet(button_stylesheet(border_color = current_color))
-            pos.setProperty("Color", None)
-            pos.setProperty("Pawn", None)
             pos.setProperty("Selected", False)
 
             if i == 0: grid.addWidget(pos, 4, 1)
@@ -594,15 +717,13 @@ class Main(QMainWindow):
         """
         self.update_drawn_circuit()
         self.update_stylesheets(deselect=True)
-        occupied_positions_count = sum(1 for pos in self.board_positions if pos.property("Color") is not None)
-        if occupied_positions_count >= 20:
+        if self.engine.occupied() >= self.engine.measure_threshold:
             QTimer.singleShot(500, lambda : self.measure_action(next_turn=False, standard_basis=True))
             return  # Exit the method after measuring
         self.save()
 
         if random_turn == False:
-            self.total_turns += 1
-            self.current_turn = self.colors[(self.colors.index(self.current_turn)+1)%4]
+            self.engine.advance_turn()
             for die in self.dice:
                 die.clicked.connect(self.throw_dice)
                 die.setStyleSheet(die_stylesheet(self.current_turn))
@@ -625,11 +746,10 @@ class Main(QMainWindow):
             if throw_menu.exec_() == QDialog.Accepted:
                 self.die_throws = throw_menu.dice_selected
         else: 
-            ar = [1,2,3,4,5,6]
-            self.die_throws = [random.choice(ar), random.choice(ar)]
+            self.engine.throw_dice()
 
             if self.debug and self.total_turns == 2:
-                self.die_throws = [6,random.choice(ar)] #guarantee a six
+                self.die_throws = [6,self.engine.rng.choice([1,2,3,4,5,6])] #guarantee a six
 
         for i, die in enumerate(self.dice):
             die.setIcon(die_cons[self.die_throws[i]])
@@ -660,35 +780,12 @@ class Main(QMainWindow):
             - single move: move a pawn from one position to another (for example: q1 SWAP q2)
         - Make the buttons clickable for the player to make a move or select one randomly if random_turn == True
         """
-        # --------------------
-        # Find pawn properties
-        # --------------------
-        self.update_stylesheets(deselect=True)
-        pawns_on_board = [[position.property("Color"), position.property("Pawn")] for position in self.board_positions]
-        pawns_on_spawn = [[position.property("Color"), position.property("Pawn")] for position in self.home_positions]
-
-        
         # -------------------
         # Find possible moves
         # -------------------
-
-        superposition_move_options = [i for i in range(len(pawns_on_board))
-                                    if pawns_on_board[i][0] == self.current_turn 
-                                    and ((pawns_on_board[(i+self.die_throws[0])%32][0] is None or pawns_on_board[(i+self.die_throws[0])%32][0] != self.current_turn)
-                                    and (pawns_on_board[(i+self.die_throws[1])%32][0] is None or pawns_on_board[(i+self.die_throws[1])%32][0] != self.current_turn))
-                                    and self.die_throws[0] != self.die_throws[1]]
-
-        new_pawn_options = [i for i in range(len(pawns_on_spawn))
-                            if pawns_on_spawn[i][0] == self.current_turn
-                            and pawns_on_board[self.start_position[self.current_turn]][0] != self.current_turn
-                            and 6 in self.die_throws]
-
-        single_move_options = [i for i in range(len(pawns_on_board))
-                                if pawns_on_board[i][0] == self.current_turn
-                                and (pawns_on_board[(i+self.die_throws[0])%32][0] is None or pawns_on_board[(i+self.die_throws[0])%32][0] != self.current_turn)
-                                and self.die_throws[0] == self.die_throws[1]]
-        
-        all_options = [superposition_move_options, new_pawn_options, single_move_options]
+        self.update_stylesheets(deselect=True)
+        all_options = self.engine.options()
+        superposition_move_options, new_pawn_options, single_move_options = all_options
         self.all_options = all_options
 
         # ------------------------------------------------
@@ -703,14 +800,8 @@ class Main(QMainWindow):
             self.next_turn()
         else: 
             if random_turn:
-                options = [
-                    None if len(superposition_move_options) == 0 else lambda: self.move(move_from=random.choice(superposition_move_options)),
-                    None if len(new_pawn_options) == 0 else lambda: self.new_pawn(move_from=random.choice(new_pawn_options)),
-                    None if len(single_move_options) == 0 else lambda: self.direct_move(move_from=random.choice(single_move_options)),
-                ]
-                # Filter out `None` values
-                options = [option for option in options if option is not None]
-                random.choice(options)()
+                kind, move_from = self.engine.random_option(all_options)
+                getattr(self, kind)(move_from = move_from)
             else: 
                 for i in superposition_move_options:
                     self.board_positions[i].setProperty("Selected", True)
@@ -723,192 +814,121 @@ class Main(QMainWindow):
                     self.board_positions[i].clicked.connect(lambda _, b=i: self.direct_move(move_from = b))
         self.update_stylesheets(deselect=False)
 
-    def find_next_available_spot(self, changing_move, constant_move=None):
-        """
-        Test if the position to move to is occupied (this happens for example when capturing a pawn)
-        If this is the case, find the next possible position to move to
-        When moving the pawn into a superposition, the pawn can overlap with itself.
-        To find the next possible position in this case provide the two arguments
-        """
-        while (self.board_positions[changing_move].property("Color") is not None 
-            or (constant_move is not None and changing_move == constant_move)):
-            changing_move = (changing_move + 1) % 32
-        return changing_move
-    
-    def check_if_moving_in_final_positions(self, move_from, move_to):
-        """Check if the move_to position is beyond the final_position for a color on a board. If so, move to the final position"""
-        start_position = self.start_position[self.current_turn]
-        for i, move in enumerate(move_to):
-            if (move_from - start_position) % 32 > 16 and (move - start_position) % 32 < 16: #this might not be the most general solution, but since the maximum movement is 6 this will work
-                move_to[i] = self.current_turn
-        return move_to
-
     def direct_move(self, move_from, to_next_turn = True):
-        """Move a pawn from one position to another and potentially capture another pawn"""
-        move_to = [(move_from + self.die_throws[0]) % 32]
-        captives = [pos for pos in move_to if self.board_positions[pos].property("Color") != None]
-        normal_move = [pos for pos in move_to if self.board_positions[pos].property("Color") is None]
-        captive_entanglement = [[i for i in range(0,32)
-                                if self.board_positions[i].property("Color") == self.board_positions[move].property("Color")
-                                and self.board_positions[i].property("Pawn") == self.board_positions[move].property("Pawn")
-                                and move != i] for move in captives]
-        capture_move = list(map(lambda move: self.find_next_available_spot(move, None), captives))
-        
-        normal_move = self.check_if_moving_in_final_positions(move_from, normal_move)
-        capture_move = self.check_if_moving_in_final_positions(move_from, capture_move)
-        move_to = normal_move + capture_move
-
-        final_pos : int
-
-        if self.current_turn in move_to:
-            for prop in ["Color", "Pawn"]:
-                pawn = self.board_positions[move_from].property("Pawn")
-                final_pos = self.colors.index(self.current_turn) * 2 + pawn
-                self.final_positions[final_pos].setProperty(prop, self.board_positions[move_from].property(prop))
-                self.board_positions[move_from].setProperty(prop, None)
-            move_to = [self.N] 
-            capture_move = [self.N]
-        else:
-            for prop in ["Color", "Pawn"]:
-                self.board_positions[move_to[0]].setProperty(prop, self.board_positions[move_from].property(prop))
-                self.board_positions[move_from].setProperty(prop, None)
-        
-        self.circuit.switch([move_from], move_to)
-        
-        if captives:
-            self.circuit.capture(capture_move, captives, captive_entanglement[0])
+        """Move a pawn from one position to another and potentially capture another pawn, see Engine.direct_move()"""
+        final_pos = self.engine.direct_move(move_from)
         if to_next_turn:
-            if move_to[0] < 32:
+            if final_pos is None:
                 self.next_turn()
             else:
                 self.update_stylesheets(deselect=True)
                 self.measure_action(final_position = final_pos)
 
     def move(self, move_from, to_next_turn = True):
-        """Move a pawn from one position to two others (in a superposition) and potentially capture another or two other pawns"""
-        move_to = [(move_from + self.die_throws[0]) % 32, (move_from + self.die_throws[1]) % 32]
-        move_to.sort()
-        captives = [pos for pos in move_to if self.board_positions[pos].property("Color") != None]
-        normal_move = [pos for pos in move_to if self.board_positions[pos].property("Color") is None]
-        captive_entanglement = [[i for i in range(0,32)
-                                if self.board_positions[i].property("Color") == self.board_positions[move].property("Color")
-                                and self.board_positions[i].property("Pawn") == self.board_positions[move].property("Pawn")
-                                and move != i] for move in captives]
-        capture_move = list(map(lambda move: self.find_next_available_spot(move, None), captives))
-
-
-        if len(captives) != 0:
-            capture_move[0] = self.find_next_available_spot(changing_move=capture_move[0], constant_move=(normal_move[0] if len(captives) == 1 else capture_move[1]))
-
-        normal_move = self.check_if_moving_in_final_positions(move_from, normal_move)
-        capture_move = self.check_if_moving_in_final_positions(move_from, capture_move)
-        
-        nr_of_final_positions = sum(1 for pos in normal_move+capture_move if pos == self.current_turn)
-        if nr_of_final_positions == 1:
-            normal_move = list(map(lambda x: 32 if x == self.current_turn else x, normal_move))
-            capture_move = list(map(lambda x: 32 if x == self.current_turn else x, capture_move))
-        if nr_of_final_positions == 2:
-            if len(normal_move) == 2:
-                normal_move = [32, 33]
-            elif len(capture_move) == 2:
-                capture_move = [32, 33]
-            else:
-                normal_move = list(map(lambda x: 32 if x == self.current_turn else x, normal_move))
-                capture_move = list(map(lambda x: 33 if x == self.current_turn else x, capture_move))
-        move_to = normal_move + capture_move
-        pawn = self.board_positions[move_from].property("Pawn")
-        color = self.board_positions[move_from].property("Color")
-        final_pos = self.colors.index(self.current_turn) * 2 + pawn
-
-        self.circuit.move(move_from = [move_from], move_to = move_to)
-        for i in range(len(captives)):
-            self.circuit.capture(capturer=[capture_move[i]], captive = [captives[i]], captive_entanglement=captive_entanglement[i])   
-
-
-        board_prop = [pawn, color]
-
-        for i, prop in enumerate(["Pawn", "Color"]):
-            if nr_of_final_positions == 0:
-                self.board_positions[move_to[0]].setProperty(prop, board_prop[i])
-                self.board_positions[move_to[1]].setProperty(prop, board_prop[i])
-            if nr_of_final_positions == 1:
-                self.final_positions[final_pos].setProperty(prop, board_prop[i])
-                for pos in move_to:
-                    if pos < 32:
-                        self.board_positions[pos].setProperty(prop, self.board_positions[move_from].property(prop))
-            if nr_of_final_positions == 2:
-                self.final_positions[final_pos].setProperty(prop, board_prop[i])
-            self.board_positions[move_from].setProperty(prop, None)
-            
-
+        """Move a pawn from one position to two others (in a superposition) and potentially capture another or two other pawns, see Engine.move()"""
+        final_pos = self.engine.move(move_from)
         if to_next_turn:
-            if nr_of_final_positions == 0:
+            if final_pos is None:
                 self.next_turn()
             else:
                 self.update_stylesheets(deselect=True)
                 self.measure_action(final_position = final_pos)
 
     def new_pawn(self, move_from, optional_move_to = None, to_next_turn = True):
-        """Move a pawn from the home position to the board and potentially capture another pawn"""
-        move_to_original = self.start_position[self.current_turn] if optional_move_to == None else optional_move_to
-        move_to = self.find_next_available_spot(move_to_original)
-        captive_entanglement = [i for i in range(0,32)
-                                if self.board_positions[i].property("Color") == self.board_positions[move_to_original].property("Color")
-                                and self.board_positions[i].property("Pawn") == self.board_positions[move_to_original].property("Pawn")
-                                and move_to_original != i]
-        
-        for prop in ["Color", "Pawn"]:
-            self.board_positions[move_to].setProperty(prop, self.home_positions[move_from].property(prop))
-            self.home_positions[move_from].setProperty(prop, None)
-
-        self.circuit.new_pawn([move_to])
-
-        if move_to != move_to_original:
-            self.circuit.capture([move_to], [move_to_original], captive_entanglement)
-
+        """Move a pawn from the home position to the board and potentially capture another pawn, see Engine.new_pawn()"""
+        self.engine.new_pawn(move_from, optional_move_to)
         if to_next_turn:
             self.next_turn()
 
-    def measure_action(self, final_position = None, next_turn = True, trigger = None, standard_basis = False, bell_test = False):
-        """Measure the circuit and update the board accordingly"""
-        # Add debug flag to force duplicate pawns
-        force_duplicate = False  # For testing duplicate pawn removal
-        
-        if (trigger != None and self.force_global_standard_basis == True) or self.force_global_standard_basis == False:
-            if standard_basis == False:
-                if trigger == None:
-                    trigger = (self.current_turn, final_position % 2)
-                measure_basis = [self.measure_basis_dict[trigger][pos.property("Color")]
-                                if pos.property("Color") is not None else None
-                                for pos in self.board_positions]
-                # measure basis of pawn that finished
-                if final_position is not None:
-                    # Append same thing twice
-                    measure_basis.append([self.measure_basis_dict[trigger][self.current_turn]] * 2)
-                else:
-                    measure_basis.append([None, None])
-                self.circuit.measure_basis(measure_basis)
-
+    def measure_action(self, final_position = None, next_turn = True, trigger = None, standard_basis = False, bell_test = False, asynchronous = True):
+        """
+        Description
+        -----------
+        Measure the circuit and update the board accordingly, see Engine.measure().
+        If asynchronous is True (and it is not a Bell test), the circuit is measured on another thread while a MeasurePopup
+        is shown, such that the window does not freeze during a long simulation or while waiting for a quantum computer.
+        The board is then updated in measurement_done(), and the measurement can be cancelled, see cancel_measurement()
+
+        Returns
+        -------
+        positions : list[int]
+            Measured positions that contain a pawn, only if bell_test is True
+        """
+        self.engine.measure_basis(final_position = final_position, trigger = trigger, standard_basis = standard_basis)
+        # The full histogram is only needed for debugging and to filter out errors of the hardware
+        histogram = self.debug or not self.simulation
 
         # -------
         # Measure
         # -------
-        if bell_test == False:
-            self.update_drawn_circuit()
-            measure_popup = MeasurePopup()
-            
-            measure_popup.show()
-        positions, out_with_freq, nr_of_qubits_used = self.circuit.measure(out_internal_measure=True, efficient = True, simulator = self.simulation, service = self.service)
-        
-        # Force a duplicate pawn for testing
-        if force_duplicate and len(positions) > 0:
-            # Add a duplicate pawn at position + 1
-            for pos in positions[:]:  # Use slice to avoid modifying while iterating
-                if pos < len(self.board_positions) - 1:  # Ensure we don't go out of bounds
-                    positions.append((pos + 1) % 32)
-                    print(f"DEBUG: Forced duplicate pawn at position {(pos + 1) % 32}")
-
-        if bell_test == False:
+        if bell_test == True or asynchronous == False:
+            measure_popup = None
+            if bell_test == False:
+                self.update_drawn_circuit()
+                measure_popup = MeasurePopup()
+                measure_popup.show()
+            positions = self.engine.sample(histogram = histogram)
+            if measure_popup is not None:
+                measure_popup.close()
+            return self.finish_measurement(positions, final_position = final_position, next_turn = next_turn, bell_test = bell_test)
+
+        self.update_drawn_circuit()
+        # Cancelling returns to the last saved state, so that is only possible if there is one
+        self.measure_popup = MeasurePopup(cancel = len(self.history) > 0)
+        self.measure_popup.cancel_button.clicked.connect(self.cancel_measurement)
+        self.measure_popup.setModal(True)
+        self.measure_popup.show()
+        if self.measure_executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.measure_executor = ThreadPoolExecutor(max_workers=1)
+        self.measured_move = (final_position, next_turn)
+        # The measurement gets its own random numbers and does not change the engine, only measurement_done() stores its result
+        measure = self.engine.prepare_sample(histogram = histogram, rng = random.Random(self.engine.rng.getrandbits(64)))
+        self.measurement = self.measure_executor.submit(measure)
+        self.measurement.add_done_callback(self.sampled.emit)
+
+    def measurement_done(self, future):
+        """Update the board after the measurement on the other thread finished (called on the GUI thread)"""
+        if future is not self.measurement:
+            return # The measurement was cancelled
+        self.measurement = None
+        self.measure_popup.close()
+        try:
+            positions = self.engine.store_sample(*future.result())
+        except Exception as error:
+            print(f"Measurement failed: {error}")
+            self.revert_measurement()
+            return
+        final_position, next_turn = self.measured_move
+        self.finish_measurement(positions, final_position = final_position, next_turn = next_turn)
+
+    def cancel_measurement(self):
+        """
+        Description
+        -----------
+        Stop waiting for the running measurement and return to the last saved state (before the move that triggered the measurement).
+        A simulation that already started can not be interrupted, it finishes on the other thread and its result is ignored
+        """
+        if self.measurement is None:
+            return
+        self.measurement.cancel()
+        self.measurement = None
+        self.measure_popup.close()
+        self.revert_measurement()
+
+    def revert_measurement(self):
+        """Return to the last saved state of the game and of the circuit"""
+        if len(self.history) > 0:
+            self.reset_app(next_turn=False, reset_circuit=False)
+            self.circuit.revert()
+            self.restore(self.history.pop())
+
+    def finish_measurement(self, positions, final_position = None, next_turn = True, bell_test = False):
+        """Update the board to the measured positions (returned by Engine.sample()) and continue the game, see measure_action()"""
+        positions = self.engine.collapse(positions, final_position = final_position, reconcile = not bell_test)
+
+        if bell_test == False and self.engine.last_measurement is not None:
+            out_with_freq, nr_of_qubits_used = self.engine.last_measurement
             print(nr_of_qubits_used)
             print(out_with_freq)
             print(positions)
@@ -916,79 +936,6 @@ class Main(QMainWindow):
         if self.execpopup_measure:
             self.circuitfigure.exec_()
 
-        # ---------------------------------
-        # Remove pawns that no longer exist
-        # ---------------------------------
-        if bell_test == False:
-            for pos in range(0,len(self.board_positions)):
-                if pos not in positions:
-                    for prop in ["Color", "Pawn"]:
-                        self.board_positions[pos].setProperty(prop, None)
-            if final_position != None:
-                if not(32 in positions or 33 in positions):
-                    self.final_positions[final_position].setProperty("Color", None)
-                    self.final_positions[final_position].setProperty("Pawn", None)
-
-            # If pawn appears in winning position, remove it from other positions
-            if final_position is not None and (32 in positions or 33 in positions):
-                pawn_num = final_position % 2
-                for pos in range(len(self.board_positions)):
-                    if (pos in positions and 
-                        self.board_positions[pos].property("Color") == self.current_turn and
-                        self.board_positions[pos].property("Pawn") == pawn_num):
-                        print(f"Removing {self.current_turn} pawn {pawn_num} from position {pos} as it reached winning position")
-                        self.board_positions[pos].setProperty("Color", None)
-                        self.board_positions[pos].setProperty("Pawn", None)
-
-            # Remove duplicate pawns keeping only the furthest one
-            for color in self.colors:
-                for pawn in [0, 1]:
-                    # Find all positions for this color/pawn combination
-                    pawn_positions = []
-                    for pos in range(len(self.board_positions)):
-                        if (pos in positions and 
-                            self.board_positions[pos].property("Color") == color and 
-                            self.board_positions[pos].property("Pawn") == pawn):
-                            pawn_positions.append(pos)
-                    
-                    # If there are duplicates, keep only the furthest one
-                    if len(pawn_positions) > 1:
-                        start_pos = self.start_position[color]
-                        furthest_pos = max(pawn_positions, key=lambda x: (x - start_pos) % 32)
-                        
-                        # Remove all but the furthest position
-                        for pos in pawn_positions:
-                            if pos != furthest_pos:
-                                print(f"Removing duplicate {color} pawn {pawn} at position {pos}, keeping position {furthest_pos}")
-                                self.board_positions[pos].setProperty("Color", None)
-            
-                                self.board_positions[pos].setProperty("Pawn", None)
-
-            # -------------------------------------------------------------------
-            # Check if a pawn was captured and put it back into its home position
-            # -------------------------------------------------------------------
-            pawns = [[pos.property("Color"), pos.property("Pawn")] for pos in self.board_positions + self.final_positions
-                    if pos.property("Color") != None]
-            all_pawns = [[color, i] for i in [0,1] for color in self.colors]
-            pawns_at_spawn = [pawn for pawn in all_pawns if pawn not in pawns]
-
-
-            pos = self.home_positions
-            if [self.colors[0], 0] in pawns_at_spawn: pos[0].setProperty("Pawn", 0), pos[0].setProperty("Color", self.colors[0])
-            if [self.colors[0], 1] in pawns_at_spawn: pos[1].setProperty("Pawn", 1), pos[1].setProperty("Color", self.colors[0])
-            if [self.colors[1], 0] in pawns_at_spawn: pos[2].setProperty("Pawn", 0), pos[2].setProperty("Color", self.colors[1])
-            if [self.colors[1], 1] in pawns_at_spawn: pos[3].setProperty("Pawn", 1), pos[3].setProperty("Color", self.colors[1])
-            if [self.colors[2], 0] in pawns_at_spawn: pos[4].setProperty("Pawn", 0), pos[4].setProperty("Color", self.colors[2])
-            if [self.colors[2], 1] in pawns_at_spawn: pos[5].setProperty("Pawn", 1), pos[5].setProperty("Color", self.colors[2])
-            if [self.colors[3], 0] in pawns_at_spawn: pos[6].setProperty("Pawn", 0), pos[6].setProperty("Color", self.colors[3])
-            if [self.colors[3], 1] in pawns_at_spawn: pos[7].setProperty("Pawn", 1), pos[7].setProperty("Color", self.colors[3])
-
-            measure_popup.close()
-
-        new_positions = [p for p in range(len(self.board_positions)) if self.board_positions[p].property("Color") is not None]
-        self.circuit._reset()
-        self.circuit.new_pawn(new_positions)
-
         self.progress_bar.setValue(0)
         if self.win() == False or next_turn == False:
             self.next_turn()
@@ -997,8 +944,7 @@ class Main(QMainWindow):
 
     def win(self):
         """Check if a player has won the game. If so, show WinPopup() and reset the game"""
-        final_position_colors = [pos.property("Color") for pos in self.final_positions]
-        if any(final_position_colors.count(color) == 2 for color in self.colors):
+        if self.engine.winner() is not None:
             self.update_stylesheets()
             popup = WinPopup(self.current_turn)
             popup.exec_()
@@ -1012,7 +958,7 @@ class Main(QMainWindow):
         Description
         -----------
         Update the stylesheets of the buttons to reflect the current state of the game. This is done using 
-        the properties connected to each position.
+        the board of the engine and the "Selected" property of each position.
 
         Parameters
         ----------
@@ -1021,74 +967,90 @@ class Main(QMainWindow):
         
         Notes
         -----
-        For updating the stylesheets more than the three properties are used. The color of the pawns are also determined
-        based on being classical or quantum (in a superposition). This is calculated in this function.
+        The color of the pawns are also determined based on being classical or quantum (in a superposition), see Engine.classical().
         Similarily the border colour also depends on if a button is filled with a pawn.
+        Only the buttons of which the style changed since the previous call are restyled, see Main.restyle()
         """
         for i, pos in enumerate(self.home_positions):
-            pos_color = pos.property('Color')
-            pos_pawn = pos.property('Pawn')
+            pos_color, pos_pawn = self.engine.describe(self.engine.home[i])
             if deselect == True:
-                try:
-                    pos.clicked.disconnect()
-                except TypeError:
-                    pass
-                pos.setProperty('Selected', False)
+                self.deselect(pos)
             select = pos.property('Selected')
-            button_stylesheet(pos, color = pos_color, pawn=pos_pawn, border_color=self.colors[int(np.floor(i/2))] if pos_color == None else 'White', selected =select, L = self.L/10)
-        for pos in self.board_positions:
-            pos_color = pos.property('Color')
-            pos_pawn = pos.property('Pawn')
+            self.restyle(pos, color = pos_color, pawn=pos_pawn, border_color=self.colors[int(np.floor(i/2))] if pos_color == None else 'White', selected =select, L = self.L/10)
+        for i, pos in enumerate(self.board_positions):
+            pos_color, pos_pawn = self.engine.describe(self.engine.board[i])
             if deselect == True:
-                try:
-                    pos.clicked.disconnect()
-                except TypeError:
-                    pass
-                select = pos.setProperty("Selected", False)
+                self.deselect(pos)
             select = pos.property("Selected")
-            classical = len([pos for pos in (self.board_positions) if 
-                             pos_pawn == pos.property("Pawn") and pos_color == pos.property("Color")]) == 1
-            button_stylesheet(pos, color = pos_color, pawn = pos_pawn, selected=select, classical = classical, L = self.L/10)
+            classical = self.engine.classical(i)
+            self.restyle(pos, color = pos_color, pawn = pos_pawn, selected=select, classical = classical, L = self.L/10)
         for i, pos in enumerate(self.final_positions):
-            pos_color = pos.property('Color')
-            pos_pawn = pos.property("Pawn")
-            button_stylesheet(pos, color = pos_color, pawn=pos_pawn, border_color=self.colors[int(np.floor(i/2))], L = self.L/10)
+            pos_color, pos_pawn = self.engine.describe(self.engine.final[i])
+            self.restyle(pos, color = pos_color, pawn=pos_pawn, border_color=self.colors[int(np.floor(i/2))], L = self.L/10)
+
+    def deselect(self, button):
+        """Disconnect the clicked signal of a position (if it is connected) and set its "Selected" property to False"""
+        if button.receivers(button.clicked) > 0:
+            button.clicked.disconnect()
+        button.setProperty("Selected", False)
+
+    def restyle(self, button, **style):
+        """
+        Description
+        -----------
+        Apply UI.button_stylesheet() to a button, unless the button already has exactly this style.
+        Applying a stylesheet makes Qt re-polish the button, which is slow compared to comparing the style arguments
+
+        Parameters
+        ----------
+        button : QPushButton
+            Position on the board
+        style : dict
+            Keyword arguments of UI.button_stylesheet()
+        """
+        key = tuple(sorted(style.items()))
+        if self.button_styles.get(button) != key:
+            self.button_styles[button] = key
+            button_stylesheet(button, **style)
 
     def update_drawn_circuit(self):
-        self.fig = self.circuit.draw(mpl_open = False, term_draw = False, show_idle_wires=False)
-        self.circuitfigure.plot(self.fig)
+        """The circuit changed, draw it again once the circuit figure is visible (see CircuitFigure)"""
+        self.circuitfigure.update_circuit(self.circuit)
 
     def save(self): 
         """Save the current state of the game to the history list and save the circuit to be used by undo()"""
-        hp = [[pos.property("Pawn"), pos.property("Color")] for pos in self.home_positions]
-        bp = [[pos.property("Pawn"), pos.property("Color")] for pos in self.board_positions]
-        fp = [[pos.property("Pawn"), pos.property("Color")] for pos in self.final_positions]
-        turn = self.current_turn
-        to_save = [hp, bp, fp, turn]
+        to_save = self.engine.snapshot()
         if len(self.history) == 0 or self.history[-1][0:2] != to_save[0:2]:
             self.history.append(to_save)
-            self.circuit.save()
+            if len(self.history) > self.circuit.max_history:
+                self.history.pop(0)
+            # circuit.undo(), circuit.redo() and circuit.revert() already keep the saved states of the circuit
+            if self.restoring_history == False:
+                self.circuit.save()
+                self.redo_history = []
     
     def undo(self):
         """Undo the last move and reset the game to the previous state using the saved history"""
-        self.reset_app(next_turn=False)
-
         if len(self.history) > 1:
+            self.reset_app(next_turn=False, reset_circuit=False)
             self.circuit.undo()
-            positions = self.history.pop()
-            positions = self.history.pop()
-            
-            for i, pos in enumerate(self.home_positions):
-                pos.setProperty("Pawn", positions[0][i][0])
-                pos.setProperty("Color", positions[0][i][1])
-            for i, pos in enumerate(self.board_positions):
-                pos.setProperty("Pawn", positions[1][i][0])
-                pos.setProperty("Color", positions[1][i][1])
-            for i, pos in enumerate(self.final_positions):
-                pos.setProperty("Pawn", positions[2][i][0])
-                pos.setProperty("Color", positions[2][i][1])
-            self.current_turn = positions[3]
-            self.next_turn()
+            self.redo_history.append(self.history.pop())
+            self.restore(self.history.pop())
+
+    def redo(self):
+        """Redo the last move that was undone by undo()"""
+        # A measurement clears the redo history of the circuit, the board can then no longer be restored
+        if len(self.redo_history) > 0 and len(self.circuit.redo_history) > 0:
+            self.reset_app(next_turn=False, reset_circuit=False)
+            self.circuit.redo()
+            self.restore(self.redo_history.pop())
+
+    def restore(self, positions):
+        """Set the board to positions (an element of self.history) and continue the game from there"""
+        self.engine.restore(positions)
+        self.restoring_history = True
+        self.next_turn()
+        self.restoring_history = False
 
     def circuit_visibility(self):
         """Show or hide the circuit figure"""
@@ -1125,15 +1087,12 @@ class Main(QMainWindow):
             self.force_standard_basis_button.setText("Set measurement basis to be dependent on pawn")
             self.force_global_standard_basis = True
 
-    def reset_app(self, next_turn = True):
+    def reset_app(self, next_turn = True, reset_circuit = True):
         """Reset the game to the initial state. This is similar to starting a new game, except that the history is not cleared (e.g. ctrl+z still works)"""
-        # Reset the quantum circuit completely
-        self.circuit._reset()
+        # Reset the quantum circuit completely, unless it is rebuilt by undo() or redo()
+        self.engine.reset(reset_circuit = reset_circuit)
         self.update_drawn_circuit()
         
-        self.total_turns = 0
-        self.current_turn = self.colors[-1]
-        
         for die in self.dice:
             die.setIcon(die_cons[0])
             die.setStyleSheet(die_stylesheet())
@@ -1143,26 +1102,7 @@ class Main(QMainWindow):
                 pass
             die.clicked.connect(self.throw_dice)
         
-        for pos in self.board_positions:
-            pos.setProperty("Color", None)
-            pos.setProperty("Pawn", None)
-            try:
-                pos.clicked.disconnect()
-            except TypeError:
-                pass
-        
-        for i, pos in enumerate(self.home_positions):
-            current_color = self.colors[int(np.floor(i/2))]
-            pos.setProperty("Color", current_color)
-            pos.setProperty("Pawn", i % 2)  
-            try:
-                pos.clicked.disconnect()
-            except TypeError:
-                pass
-
-        for i, pos in enumerate(self.final_positions):
-            pos.setProperty("Color", None)
-            pos.setProperty("Pawn", None)  
+        for pos in self.board_positions + self.home_positions + self.final_positions:
             try:
                 pos.clicked.disconnect()
             except TypeError:
@@ -1179,9 +1119,10 @@ class Main(QMainWindow):
 
 
     def print_positions(self):
-        """Print the positions of the pawns on the board and the home positions by displaying the "pawn" and "color" properties of each position"""
-        pawns_on_board = [[position.property("Color"), position.property("Pawn")] for position in self.board_positions]
-        pawns_on_spawn = [[position.property("Color"), position.property("Pawn")] for position in self.home_positions]
+        """Print the positions of the pawns on the board and the home positions by displaying the color and pawn on each position"""
+        pawns_on_board = [list(self.engine.describe(pawn_id)) for pawn_id in self.engine.board]
+        pawns_on_spawn = [list(self.engine.describe(pawn_id)) for pawn_id in self.engine.home]
+        from pandas import DataFrame # only used for debugging, so it is not imported at startup
         print(DataFrame(pawns_on_board, columns = ['Color','Pawn number']).T.fillna('   ').replace({np.nan: '   '}))
         print(DataFrame(pawns_on_spawn, columns = ['Color','Pawn number']).T.fillna('   ').replace({np.nan: '   '}))
         print("--------------------")
@@ -1212,11 +1153,8 @@ class Main(QMainWindow):
 
     def update_progress_bar(self):
         """Update progress bar to reflect the number of occupied positions (up to 20)."""
-        occupied_positions_count = sum(
-            1 for pos in self.board_positions if pos.property("Color") is not None
-        )
         # Cap at 20:
-        occupied_positions_count = min(occupied_positions_count, 20)
+        occupied_positions_count = min(self.engine.occupied(), self.engine.measure_threshold)
         self.progress_bar.setValue(occupied_positions_count)
 
 
@@ -1377,13 +1315,11 @@ class Main(QMainWindow):
             self.move(23, False)
             self.die_throws = [5,5]
         if fin_type == 'single_win' or fin_type == 'double_super_win_cap':
-            self.final_positions[4].setProperty("Color", self.colors[2])
-            self.final_positions[4].setProperty("Pawn", 0)
-            self.final_positions[1].setProperty("Color", self.colors[0])
-            self.final_positions[1].setProperty("Pawn", 1)
+            self.engine.final[4] = self.engine.pawn_id(self.colors[2], 0)
+            self.engine.final[1] = self.engine.pawn_id(self.colors[0], 1)
             self.new_pawn(0,23, False)
             self.new_pawn(5, 8, False)
-            self.measure_action()
+            self.measure_action(asynchronous = False)
             self.current_turn = self.colors[2]
             if fin_type == 'single_win':
                 self.die_throws = [4,4]
@@ -1394,10 +1330,9 @@ class Main(QMainWindow):
             self.new_pawn(0,24,False)
             self.die_throws = [1,2]
         if fin_type == 'super_win' or fin_type == 'double_super':
-            self.final_positions[1].setProperty("Color", self.colors[0])
-            self.final_positions[1].setProperty("Pawn", 1)
+            self.engine.final[1] = self.engine.pawn_id(self.colors[0], 1)
             self.new_pawn(0,24, False)
-            self.measure_action()
+            self.measure_action(asynchronous = False)
             self.current_turn = self.colors[0]
             if fin_type == 'super_win':
                 self.die_throws = [1,2]
@@ -1439,115 +1374,23 @@ class Main(QMainWindow):
             self.force_standard_basis()
         QTimer.singleShot(3000, lambda : self._bell_test_internals())
     
-    def _bell_test_internals(self):
-        def initialize():
-            self.reset_app()
-            self.current_turn = self.colors[0]
-            self.new_pawn(0,20)
-            self.current_turn = self.colors[1]
-            self.new_pawn(2,19)
-            self.new_pawn(3,23) 
-            self.current_turn = self.colors[2]
-            self.new_pawn(5,9)
-            self.new_pawn(4,8)
-            self.current_turn = self.colors[0]
-            self.new_pawn(1,25)
-
-            self.die_throws = [1,3]
-            self.move(20, False)
-            self.current_turn = self.colors[2]
-            self.die_throws = [2,2]
-            self.direct_move(19,False)
-            self.update_drawn_circuit()
-            self.update_stylesheets(deselect=True)
-        def blue_zero_finish():
-            self.current_turn = self.colors[2]
-            self.die_throws = [2,2]
-            self.direct_move(8,False)
-            positions = self.measure_action(final_position=4, next_turn=False, bell_test=True)
-            if (24 in positions and 23 in positions) or (24 not in positions and 23 not in positions):
-                outcomes["XQ"]["total"] += 1
-            else:
-                outcomes["XQ"]["total"] += -1
-            outcomes["XQ"]["amount"] += 1
-
-        def blue_one_finish():
-            self.current_turn = self.colors[2]
-            self.die_throws = [2,2]
-            self.direct_move(9,False)
-            positions = self.measure_action(final_position=5, next_turn=False, bell_test=True)
-
-            if (24 in positions and 23 in positions) or (24 not in positions and 23 not in positions):
-                outcomes["XT"]["total"] += 1
-            else:
-                outcomes["XT"]["total"] += -1
-            outcomes["XT"]["amount"] += 1
-        def red_one_finish():
-            self.current_turn = self.colors[0]
-            self.die_throws = [1,1]
-            self.direct_move(25,False)
-            positions = self.measure_action(final_position=1, next_turn=False, bell_test=True)
-
-            if (24 in positions and 23 in positions) or (24 not in positions and 23 not in positions):
-                outcomes["ZT"]["total"] += 1
-            else:
-                outcomes["ZT"]["total"] += -1
-            outcomes["ZT"]["amount"] += 1
-            
-        def red_zero_finish():
-            self.current_turn = self.colors[0]
-            self.die_throws = [2,2]
-            self.direct_move(24,False)
-            positions = self.measure_action(final_position=0, next_turn=False, bell_test=True)
-
-            if (23 in positions and 32 in positions) or (23 not in positions and 32 not in positions):
-                outcomes["ZQ"]["total"] += 1
-            else:
-                outcomes["ZQ"]["total"] += -1
-            outcomes["ZQ"]["amount"] += 1
-
-        finish_options = [blue_zero_finish, blue_one_finish, red_one_finish, red_zero_finish]
-        # randomly select one
-        outcomes = {"ZT": {"amount" : 0, "total" : 0}, # Z, T - red 1
-                    "ZQ": {"amount" : 0, "total" : 0}, # Z, Q - red 0
-                    "XT": {"amount" : 0, "total" : 0}, # X, T - blue 1
-                    "XQ": {"amount" : 0, "total" : 0}} # X, Q - blue 0
+    def _bell_test_internals(self, iterations = 999, plot_every = 25):
+        """
+        Measure the Bell test board many times and plot S. The circuits of the four measurement settings are simulated once
+        without redrawing the board, see game_logic/bell_test.py. The plot is redrawn every plot_every measurements
+        """
         bell_test_figure = BellTestPlot()
         bell_test_figure.show()
-        
-        Ss = []
-        for i in range(1,1000):
-            finish_options[np.random.randint(0,4)]()
-            S = 0
-            print(outcomes)
-
-            # Check each value individually and only divide if non-zero
-            if outcomes["ZT"]["amount"] != 0:
-                S += outcomes["ZT"]["total"] / outcomes["ZT"]["amount"]
-            else:
-                S += 0
 
-            if outcomes["XQ"]["amount"] != 0:
-                S += outcomes["XQ"]['total'] / outcomes["XQ"]['amount']
-            else:
-                S += 0
-
-            if outcomes["XT"]["amount"] != 0:
-                S += outcomes["XT"]['total'] / outcomes["XT"]['amount']
-            else:
-                S += 0
+        def plot(i, S, outcomes):
+            draw = i % plot_every == 0 or i == iterations
+            bell_test_figure.update_plot(y=S, x=i, draw=draw)
+            if draw:
+                QApplication.processEvents()
 
-            if outcomes["ZQ"]["amount"] != 0:
-                S -= outcomes["ZQ"]['total'] / outcomes["ZQ"]['amount']
-            else:
-                S -= 0
-            print(S)
-            Ss.append(S)
-            bell_test_figure.update_plot(y=S, x=i)
-            plt.pause(0.1)
-            initialize()
-            if i % 100 == 0 or i == 1:
-                open(os.path.join(dir_path, "game_logic", "Cache", "bell_test_results.txt"), "w").write(str(Ss))
+        Ss = bell_test.run(iterations = iterations, callback = plot)
+        print(f"S = {Ss[-1]}")
+        open(os.path.join(dir_path, "game_logic", "Cache", "bell_test_results.txt"), "w").write(str(Ss))
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -3,7 +3,6 @@ from PyQt5.QtGui import QIcon, QFont, QPixmap
 from PyQt5.QtCore import Qt
 import sys
 import os
-from main import Main 
 from PyQt5.QtSvg import QSvgGenerator
 from PyQt5.QtGui import QPainter
 
@@ -144,6 +143,7 @@ class StartScreen(QMainWindow):
         self.save_as_svg()
         self.close()  # Close the Start screen
 
+        from main import Main # imports qiskit, so it is only imported when the game starts to open the start screen faster
         self.main_window = Main(debug=debug, simulation=simulation, service = self.service)  # Create instance of Main window
         self.main_window.show()  # Show Main window
 